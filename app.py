@@ -10,12 +10,12 @@ import subprocess
 import re
 import shutil
 import gzip
+import hashlib
 import psutil
 import threading
 from pathlib import Path
-from flask import Flask, jsonify, request, send_file, Response
+from flask import Flask, jsonify, request, Response
 from flask_cors import CORS
-import pymysql
 from datetime import datetime, timedelta
 import time
 from werkzeug.utils import secure_filename
@@ -27,6 +27,23 @@ from backend.mail import cloudflare as mail_cloudflare
 from backend.mail import maildir_reader
 from backend.mail.exceptions import MailServiceError
 from backend.utils.commands import run_sudo_command
+from backend.sites import get_size_index
+from backend.sites.discovery import discover_sites, enrich_sites
+from backend.sites.inventory import SiteInventory
+from backend.sites.disk_usage import measure_disk_usage
+from backend.sites.enrichment import parse_fields, parse_sort, query_sites
+from backend.sites.enrichment_cache import EnrichmentCache
+from backend.wordpress import load_wp_config
+from backend.mysql import (
+    EXPORT_TIMEOUT, MAX_QUERY_TIMEOUT, MAX_RESULT_ROWS, MAX_STREAM_ROWS, QUERY_TIMEOUT, StreamedQuery,
+    browse_table, get_connection_pool, get_query_cache, get_query_registry, limit_execution_time,
+    normalize_sql, open_unpooled_connection, referenced_tables, release_stream, reserve_stream
+)
+from backend.files import (
+    WINDOW_BYTES, BulkJobManager, PatchError, TrashError, TrashManager, UploadError, UploadManager,
+    WatchLimitError, build_archive, content_hash, get_directory_watcher, get_search_index, list_directory,
+    prepare_download, read_bytes, read_lines, read_tail, resolve_site_entry, resolve_site_path, save_file
+)
 try:
     import requests
     REQUESTS_AVAILABLE = True
@@ -88,99 +105,44 @@ POSTFIX_VIRTUAL_ALIAS_MAP = Path("/etc/postfix/virtual_aliases")
 POSTFIX_VIRTUAL_MAILBOX_MAP = Path("/etc/postfix/virtual_mailboxes")
 DOVECOT_USER_FILE = Path("/etc/dovecot/users")
 
-# Site configuration (will be auto-detected)
-SITES = []
+# Site configuration (auto-detected and owned by the background inventory,
+# see site_inventory below)
 
-def detect_sites():
-    """Auto-detect all WordPress sites from directory structure"""
-    sites = []
-    if not BASE_DIR.exists():
-        return sites
-    
-    for site_dir in BASE_DIR.iterdir():
-        if site_dir.is_dir() and (site_dir / "public_html" / "wp-config.php").exists():
-            domain = site_dir.name
-            wp_config = site_dir / "public_html" / "wp-config.php"
-            
-            # Extract database info from wp-config.php
-            db_info = extract_db_info(wp_config)
-            
-            # Check if Apache config exists
-            apache_config = APACHE_SITES_DIR / f"{domain}.conf"
-            # Check both with and without .com/.net/.org etc extension
-            domain_without_tld = domain.rsplit('.', 1)[0]  # e.g., aplusacademytt from aplusacademytt.com
-            apache_enabled = (
-                (APACHE_SITES_ENABLED / f"{domain}.conf").exists() or 
-                (APACHE_SITES_ENABLED / f"{domain_without_tld}.conf").exists()
-            )
-            
-            # Get directory size
-            site_size = get_directory_size(site_dir)
-            
-            sites.append({
-                'domain': domain,
-                'path': str(site_dir),
-                'public_html': str(site_dir / "public_html"),
-                'apache_config': str(apache_config) if apache_config.exists() else None,
-                'apache_enabled': apache_enabled,
-                'db_name': db_info.get('db_name'),
-                'db_user': db_info.get('db_user'),
-                'db_host': db_info.get('db_host', '127.0.0.1'),
-                'error_log': str(APACHE_LOG_DIR / f"{domain}_error.log"),
-                'access_log': str(APACHE_LOG_DIR / f"{domain}_access.log"),
-                'size_mb': site_size,
-            })
-    
-    return sorted(sites, key=lambda x: x['domain'])
+def detect_sites(include_size=True):
+    """Auto-detect all WordPress sites from directory structure
 
-def get_directory_size(path):
-    """Get directory size in MB"""
-    try:
-        total = 0
-        for dirpath, dirnames, filenames in os.walk(path):
-            for f in filenames:
-                fp = os.path.join(dirpath, f)
-                if os.path.exists(fp):
-                    total += os.path.getsize(fp)
-        return round(total / (1024 * 1024), 2)
-    except:
-        return 0
+    Identity data (domain, paths, DB name, vhost state) is cheap; pass
+    include_size=False to skip the disk-size enrichment.
+    """
+    sites = discover_sites(BASE_DIR, APACHE_SITES_DIR, APACHE_SITES_ENABLED, APACHE_LOG_DIR)
+    if include_size:
+        enrich_sites(sites, fields=('size_mb',))
+    return sites
 
 def extract_db_info(wp_config_path):
-    """Extract database information from wp-config.php"""
-    db_info = {}
-    try:
-        with open(wp_config_path, 'r') as f:
-            content = f.read()
-            
-        # Extract DB_NAME
-        match = re.search(r"define\s*\(\s*['\"]DB_NAME['\"]\s*,\s*['\"]([^'\"]+)['\"]", content)
-        if match:
-            db_info['db_name'] = match.group(1)
-        
-        # Extract DB_USER
-        match = re.search(r"define\s*\(\s*['\"]DB_USER['\"]\s*,\s*['\"]([^'\"]+)['\"]", content)
-        if match:
-            db_info['db_user'] = match.group(1)
-        
-        # Extract DB_PASSWORD
-        match = re.search(r"define\s*\(\s*['\"]DB_PASSWORD['\"]\s*,\s*['\"]([^'\"]+)['\"]", content)
-        if match:
-            db_info['db_password'] = match.group(1)
-        
-        # Extract DB_HOST
-        match = re.search(r"define\s*\(\s*['\"]DB_HOST['\"]\s*,\s*['\"]([^'\"]+)['\"]", content)
-        if match:
-            db_info['db_host'] = match.group(1)
-        
-    except Exception as e:
-        print(f"Error reading wp-config.php: {e}")
-    
-    return db_info
+    """Extract database information from wp-config.php (cached per file version)"""
+    wp_config = load_wp_config(wp_config_path)
+    return wp_config.db_info() if wp_config else {}
+
+def get_table_prefix(wp_path):
+    """Get the WordPress table prefix from wp-config.php"""
+    wp_config = load_wp_config(Path(wp_path) / 'wp-config.php')
+    return wp_config.table_prefix if wp_config else 'wp_'
+
+def find_site(domain):
+    """Look up a site by domain or ServerAlias in the current inventory snapshot"""
+    return site_inventory.find(domain)
 
-def get_db_connection(domain):
-    """Get database connection for a site"""
-    site = next((s for s in SITES if s['domain'] == domain), None)
+def get_db_connection(domain, pooled=True):
+    """Get a pooled database connection for a site (release it with `with connection:`)"""
+    return get_site_db_connection(find_site(domain), pooled)
+
+def get_site_db_connection(site, pooled=True):
+    """Get database connection for a site record
+
+    Unpooled connections don't count against the site's pool limit and must
+    be closed by the caller.
+    """
     if not site or not site.get('db_name'):
         return None
     
@@ -190,15 +152,16 @@ def get_db_connection(domain):
     if not db_info.get('db_password'):
         return None
     
+    connect = get_connection_pool().connection if pooled else open_unpooled_connection
     try:
-        return pymysql.connect(
-            host=db_info.get('db_host', '127.0.0.1'),
-            user=db_info['db_user'],
-            password=db_info['db_password'],
-            database=db_info['db_name'],
-            cursorclass=pymysql.cursors.DictCursor
+        return connect(
+            db_info.get('db_host', '127.0.0.1'),
+            db_info['db_user'],
+            db_info['db_password'],
+            db_info['db_name']
         )
-    except:
+    except Exception as e:
+        print(f"Error connecting to database {db_info.get('db_name')}: {e}")
         return None
 
 def get_service_status(service_name):
@@ -240,78 +203,82 @@ def site_page(domain):
     """Individual site management page"""
     return render_template('site.html', domain=domain)
 
+# The inventory owns the site list: it refreshes in the background and on
+# changes to the sites root or Apache vhost directories. It only holds cheap
+# identity data; sizes, DB stats and WP versions are enriched per request.
+site_inventory = SiteInventory(
+    lambda: detect_sites(include_size=False),
+    watch_paths=[BASE_DIR, APACHE_SITES_DIR, APACHE_SITES_ENABLED],
+)
+
+# Enriched values are served from cache and revalidated in the background
+site_enrichment = EnrichmentCache()
+
+def site_files_changed(domain, rel_path=None):
+    """Drop a site's cached enrichment after its files change
+
+    wp-config.php holds the database settings and wp-includes/version.php the
+    WordPress version; any other change only affects the size.
+    """
+    rel_path = str(rel_path or '').replace('\\', '/').strip('/')
+    if rel_path == 'wp-config.php':
+        site_enrichment.invalidate(domain)
+        return
+    if rel_path == 'wp-includes/version.php':
+        site_enrichment.invalidate(domain, group='wordpress')
+    site_enrichment.invalidate(domain, group='size')
+
+# Chunked upload sessions (state under .cache/uploads, data next to the target)
+upload_manager = UploadManager()
+
+# Deleted files go to <site>/.trash and are purged in the background after
+# the restore window
+file_trash = TrashManager(lambda: [site['path'] for site in site_inventory.snapshot().sites])
+
+# Bulk delete/move/copy/chmod jobs, run on a bounded worker pool
+bulk_jobs = BulkJobManager(trash=file_trash, on_finished=site_files_changed)
+
 @app.route('/api/sites')
 def get_sites():
-    """Get all detected sites with enhanced information"""
-    global SITES
-    SITES = detect_sites()
-    
-    # Enhance each site with additional information
-    enhanced_sites = []
-    for site in SITES:
-        enhanced_site = site.copy()
-        
-        # Add status based on apache_enabled
-        enhanced_site['status'] = 'active' if site.get('apache_enabled', False) else 'inactive'
-        
-        # Add disk_usage in bytes (convert from MB)
-        enhanced_site['disk_usage'] = int(site.get('size_mb', 0) * 1024 * 1024)
-        
-        # Get database information
-        databases = []
-        if site.get('db_name'):
-            try:
-                connection = get_db_connection(site['domain'])
-                if connection:
-                    with connection:
-                        with connection.cursor() as cursor:
-                            cursor.execute("SHOW TABLES")
-                            tables = cursor.fetchall()
-                            
-                            cursor.execute("""
-                                SELECT
-                                    ROUND(SUM(data_length + index_length) / 1024 / 1024, 2) AS size_mb
-                                FROM information_schema.tables
-                                WHERE table_schema = %s
-                            """, (site['db_name'],))
-                            size_result = cursor.fetchone()
-                            db_size = size_result['size_mb'] if size_result else 0
-                            
-                            databases.append({
-                                'name': site['db_name'],
-                                'size_mb': db_size,
-                                'table_count': len(tables)
-                            })
-            except:
-                # If connection fails, still add database info but mark as unavailable
-                databases.append({
-                    'name': site['db_name'],
-                    'size_mb': 0,
-                    'table_count': 0
-                })
-        
-        enhanced_site['databases'] = databases
-        
-        # Check for WordPress installation
-        wp_config = Path(site['public_html']) / 'wp-config.php'
-        version_file = Path(site['public_html']) / 'wp-includes' / 'version.php'
-        
-        enhanced_site['wordpress_detected'] = wp_config.exists()
-        enhanced_site['wordpress_version'] = None
+    """Get detected sites from the current inventory snapshot
+
+    Query parameters:
+      fields  - comma-separated fields to return (default: all). Size, database
+                and WordPress version enrichment only runs when requested.
+      sort    - field to sort by, prefix with '-' for descending (default: domain)
+      limit   - page size; the next page's cursor is in the X-Next-Cursor header
+      cursor  - opaque cursor from a previous page
+      refresh - force a synchronous rescan of the site list
+    Enriched values come from cache: rows carry 'stale' and 'enriched_at'
+    (per enricher group) and stale values are refreshed in the background.
+    Supports If-None-Match (304 when the response would be unchanged).
+    """
+    try:
+        fields = parse_fields(request.args.get('fields'))
+        sort = parse_sort(request.args.get('sort'))
+        limit = request.args.get('limit', type=int)
+        cursor = request.args.get('cursor')
         
-        if version_file.exists():
-            try:
-                with open(version_file, 'r') as f:
-                    content = f.read()
-                    match = re.search(r"\$wp_version\s*=\s*['\"]([^'\"]+)['\"]", content)
-                    if match:
-                        enhanced_site['wordpress_version'] = match.group(1)
-            except:
-                pass
+        if parse_bool(request.args.get('refresh')):
+            snapshot = site_inventory.refresh()
+        else:
+            snapshot = site_inventory.snapshot()
         
-        enhanced_sites.append(enhanced_site)
-    
-    return jsonify(enhanced_sites)
+        rows, next_cursor, total = query_sites(
+            snapshot.sites, fields, sort, limit, cursor, enricher=site_enrichment.enrich
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    response = jsonify(rows)
+    response.set_etag(hashlib.sha1(response.get_data()).hexdigest()[:20])
+    response.headers['X-Inventory-Version'] = str(snapshot.version)
+    response.headers['X-Total-Count'] = str(total)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    if any(row.get('stale') for row in rows):
+        response.headers['X-Stale'] = '1'
+    return response.make_conditional(request)
 
 @app.route('/api/services')
 def get_services():
@@ -370,7 +337,7 @@ def control_service(service_name, action):
 @app.route('/api/site/<domain>/status')
 def get_site_status(domain):
     """Get status of a specific site"""
-    site = next((s for s in SITES if s['domain'] == domain), None)
+    site = find_site(domain)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
     
@@ -406,68 +373,167 @@ def get_site_status(domain):
         'path': site['path']
     })
 
+@app.route('/api/site/<domain>/disk-usage')
+def get_site_disk_usage(domain):
+    """Get a site's disk usage by area (uploads by year/month, plugins, themes,
+    cache, backups, ...) and its ?top= largest files
+
+    Served from the site's size index after an incremental refresh, so it
+    never costs a separate tree walk; the breakdown is cached until the
+    index changes.
+    """
+    site = find_site(domain)
+    if not site:
+        return jsonify({'error': 'Site not found'}), 404
+    
+    top = request.args.get('top', 20, type=int)
+    try:
+        index = get_size_index(site['path'])
+        index.refresh()
+        result = index.breakdown(top)
+        result['domain'] = site['domain']
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/site/<domain>/disk-usage/measure')
+def measure_site_disk_usage(domain):
+    """Measure a site's disk usage from scratch (apparent and allocated bytes)
+
+    Large subtrees are measured in worker processes; the walk stops after
+    ?budget= seconds and reports partial totals.
+    """
+    site = find_site(domain)
+    if not site:
+        return jsonify({'error': 'Site not found'}), 404
+    
+    budget = request.args.get('budget', 30, type=float)
+    budget = max(1.0, min(budget, 300.0))
+    try:
+        return jsonify(measure_disk_usage(site['path'], time_budget=budget))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # ==================== FILE MANAGEMENT ====================
 
 @app.route('/api/site/<domain>/files')
 def list_files(domain):
-    """List files in a directory"""
-    site = next((s for s in SITES if s['domain'] == domain), None)
+    """List files in a directory
+
+    Query params: path, sort (name|size|mtime, prefix - for descending),
+    filter (glob or substring), limit, cursor, stat (0 to skip per-entry stat).
+    Without limit every entry is returned, as before.
+    """
+    site = find_site(domain)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
     
     path = request.args.get('path', site['public_html'])
     base_path = Path(site['public_html'])
-    target_path = base_path / path.replace(site['public_html'], '').lstrip('/')
     
     # Security: ensure path is within site directory
     try:
-        target_path = target_path.resolve()
-        if not str(target_path).startswith(str(base_path.resolve())):
-            return jsonify({'error': 'Access denied'}), 403
-    except:
+        target_path = resolve_site_path(base_path, path.replace(site['public_html'], ''))
+    except PermissionError:
+        return jsonify({'error': 'Access denied'}), 403
+    except ValueError:
         return jsonify({'error': 'Invalid path'}), 400
     
     if not target_path.exists():
         return jsonify({'error': 'Path not found'}), 404
     
-    files = []
+    sort = request.args.get('sort', 'name')
     try:
-        for item in target_path.iterdir():
-            try:
-                stat = item.stat()
-                files.append({
-                    'name': item.name,
-                    'path': str(item.relative_to(base_path)),
-                    'type': 'directory' if item.is_dir() else 'file',
-                    'size': stat.st_size if item.is_file() else 0,
-                    'size_human': format_size(stat.st_size) if item.is_file() else '-',
-                    'modified': datetime.fromtimestamp(stat.st_mtime).isoformat(),
-                    'permissions': oct(stat.st_mode)[-3:]
-                })
-            except:
-                pass
-        
-        files.sort(key=lambda x: (x['type'] == 'file', x['name'].lower()))
+        limit = int(request.args['limit']) if request.args.get('limit') else None
+        listing = list_directory(
+            target_path,
+            base_path.resolve(),
+            sort=sort.lstrip('-+'),
+            descending=sort.startswith('-'),
+            pattern=request.args.get('filter'),
+            limit=limit,
+            cursor=request.args.get('cursor'),
+            with_stat=request.args.get('stat', '1') != '0'
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     
-    return jsonify({
-        'path': str(target_path.relative_to(base_path)),
-        'files': files
+    response = jsonify({
+        'path': str(target_path.relative_to(base_path.resolve())),
+        'files': listing['files'],
+        'total': listing['total'],
+        'next_cursor': listing['next_cursor']
     })
+    response.headers['X-Total-Count'] = str(listing['total'])
+    if listing['next_cursor']:
+        response.headers['X-Next-Cursor'] = listing['next_cursor']
+    return response
+
+# Seconds between keepalive comments on idle change streams
+WATCH_KEEPALIVE = 15
+
+@app.route('/api/site/<domain>/files/watch')
+def watch_files(domain):
+    """Stream changes to a directory as Server-Sent Events
+
+    Events: ready, created/modified (with the listing entry), deleted, resync
+    (re-list the directory) and gone (the directory itself was removed).
+    """
+    site = find_site(domain)
+    if not site:
+        return jsonify({'error': 'Site not found'}), 404
+    
+    path = request.args.get('path', site['public_html'])
+    base_path = Path(site['public_html']).resolve()
+    
+    # Security: ensure path is within site directory
+    try:
+        target_path = resolve_site_path(base_path, path.replace(site['public_html'], ''))
+    except PermissionError:
+        return jsonify({'error': 'Access denied'}), 403
+    except ValueError:
+        return jsonify({'error': 'Invalid path'}), 400
+    
+    if not target_path.is_dir():
+        return jsonify({'error': 'Directory not found'}), 404
+    
+    watcher = get_directory_watcher()
+    try:
+        subscription = watcher.subscribe(target_path, base_path)
+    except WatchLimitError as e:
+        return jsonify({'error': str(e)}), 503
+    except OSError as e:
+        return jsonify({'error': str(e)}), 500
+    
+    def stream():
+        try:
+            ready = {'event': 'ready', 'path': str(target_path.relative_to(base_path)), 'backend': watcher.backend}
+            yield f"event: ready\ndata: {json.dumps(ready)}\n\n"
+            while True:
+                event = subscription.get(timeout=WATCH_KEEPALIVE)
+                if event is None:
+                    # Comment line; keeps proxies from timing out and detects closed clients
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            subscription.close()
+    
+    response = Response(stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.call_on_close(subscription.close)
+    return response
 
-def format_size(size):
-    """Format file size"""
-    for unit in ['B', 'KB', 'MB', 'GB']:
-        if size < 1024.0:
-            return f"{size:.2f} {unit}"
-        size /= 1024.0
-    return f"{size:.2f} TB"
+# Files up to this size are returned whole when no window is requested
+MAX_FULL_READ = 5 * 1024 * 1024
 
 @app.route('/api/site/<domain>/files/read')
 def read_file(domain):
-    """Read file contents"""
-    site = next((s for s in SITES if s['domain'] == domain), None)
+    """Read file contents, whole or as a window"""
+    site = find_site(domain)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
     
@@ -475,72 +541,124 @@ def read_file(domain):
     if not file_path:
         return jsonify({'error': 'Path required'}), 400
     
-    base_path = Path(site['public_html'])
-    target_path = base_path / file_path.lstrip('/')
-    
     # Security check
     try:
-        target_path = target_path.resolve()
-        if not str(target_path).startswith(str(base_path.resolve())):
-            return jsonify({'error': 'Access denied'}), 403
-    except:
+        target_path = resolve_site_path(site['public_html'], file_path)
+    except PermissionError:
+        return jsonify({'error': 'Access denied'}), 403
+    except ValueError:
         return jsonify({'error': 'Invalid path'}), 400
     
     if not target_path.exists() or not target_path.is_file():
         return jsonify({'error': 'File not found'}), 404
     
-    # Check file size (max 5MB for text files)
-    if target_path.stat().st_size > 5 * 1024 * 1024:
-        return jsonify({'error': 'File too large'}), 400
-    
     try:
-        with open(target_path, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
-        return jsonify({
-            'path': file_path,
-            'content': content,
-            'size': target_path.stat().st_size
-        })
+        size = target_path.stat().st_size
+        # Windowed reads: tail=N, line=N (0-based) with lines=N, or offset/length in bytes
+        if request.args.get('tail'):
+            window = read_tail(str(target_path), int(request.args['tail']))
+        elif request.args.get('line'):
+            window = read_lines(str(target_path), int(request.args['line']), int(request.args.get('lines', 100)))
+        elif request.args.get('offset') or request.args.get('length'):
+            window = read_bytes(str(target_path), int(request.args.get('offset', 0)),
+                                int(request.args.get('length', WINDOW_BYTES)))
+        elif size > MAX_FULL_READ:
+            # A partial file must never reach an editor that saves it back whole
+            return jsonify({'error': 'File too large', 'size': size, 'max_size': MAX_FULL_READ}), 400
+        else:
+            with open(target_path, 'rb') as f:
+                raw = f.read()
+            return jsonify({
+                'path': file_path,
+                'content': raw.decode('utf-8', errors='ignore'),
+                'size': size,
+                'hash': content_hash(raw)
+            })
+        window['path'] = file_path
+        window['truncated'] = window['offset'] > 0 or window['end'] < window['size']
+        return jsonify(window)
+    except ValueError:
+        return jsonify({'error': 'Invalid window parameters'}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/site/<domain>/files/write', methods=['POST'])
 def write_file(domain):
-    """Write file contents"""
-    site = next((s for s in SITES if s['domain'] == domain), None)
+    """Write file contents, whole or as a delta against a base hash"""
+    site = find_site(domain)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
     
-    data = request.json
+    data = request.json or {}
     file_path = data.get('path')
-    content = data.get('content')
     
     if not file_path:
         return jsonify({'error': 'Path required'}), 400
     
-    base_path = Path(site['public_html'])
-    target_path = base_path / file_path.lstrip('/')
-    
     # Security check
     try:
-        target_path = target_path.resolve()
-        if not str(target_path).startswith(str(base_path.resolve())):
-            return jsonify({'error': 'Access denied'}), 403
-    except:
+        target_path = resolve_site_path(site['public_html'], file_path)
+    except PermissionError:
+        return jsonify({'error': 'Access denied'}), 403
+    except ValueError:
         return jsonify({'error': 'Invalid path'}), 400
     
+    # Either the full content, or base_hash plus byte-range edits / a unified diff
     try:
         target_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(target_path, 'w', encoding='utf-8') as f:
-            f.write(content)
-        return jsonify({'success': True, 'message': 'File saved'})
+        result = save_file(
+            target_path,
+            base_hash=data.get('base_hash'),
+            content=data.get('content'),
+            edits=data.get('edits'),
+            diff=data.get('diff')
+        )
+        site_files_changed(site['domain'], file_path)
+        return jsonify({'success': True, 'message': 'File saved', **result})
+    except PatchError as e:
+        payload = {'error': str(e)}
+        if e.current_hash:
+            payload['current_hash'] = e.current_hash
+        return jsonify(payload), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/site/<domain>/files/mkdir', methods=['POST'])
+def make_directory(domain):
+    """Create a directory and any missing parents; an existing one is left as is"""
+    site = find_site(domain)
+    if not site:
+        return jsonify({'error': 'Site not found'}), 404
+    
+    data = request.json or {}
+    dir_path = data.get('path')
+    
+    if not dir_path:
+        return jsonify({'error': 'Path required'}), 400
+    
+    # Security check
+    try:
+        target_path = resolve_site_path(site['public_html'], dir_path)
+    except PermissionError:
+        return jsonify({'error': 'Access denied'}), 403
+    except ValueError:
+        return jsonify({'error': 'Invalid path'}), 400
+    
+    if os.path.lexists(target_path) and not target_path.is_dir():
+        return jsonify({'error': 'A file already exists at this path'}), 409
+    
+    try:
+        created = not target_path.exists()
+        target_path.mkdir(parents=True, exist_ok=True)
+        return jsonify({'success': True, 'message': 'Folder created' if created else 'Folder already exists',
+                        'created': created})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/site/<domain>/files/upload', methods=['POST'])
 def upload_file(domain):
     """Upload a file"""
-    site = next((s for s in SITES if s['domain'] == domain), None)
+    site = find_site(domain)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
     
@@ -567,14 +685,143 @@ def upload_file(domain):
     try:
         target_path.parent.mkdir(parents=True, exist_ok=True)
         file.save(str(target_path))
+        site_files_changed(site['domain'], target_path.relative_to(base_path.resolve()))
         return jsonify({'success': True, 'message': 'File uploaded', 'path': str(target_path.relative_to(base_path))})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def upload_error_response(e):
+    payload = {'error': str(e)}
+    if e.offset is not None:
+        payload['offset'] = e.offset
+    return jsonify(payload), e.status
+
+@app.route('/api/site/<domain>/files/uploads', methods=['POST'])
+def create_upload(domain):
+    """Start a resumable chunked upload
+
+    Body: {path, size, overwrite}. Chunks are then PUT to
+    /files/uploads/<upload_id>?offset=N and finished with POST .../complete.
+    """
+    site = find_site(domain)
+    if not site:
+        return jsonify({'error': 'Site not found'}), 404
+    
+    data = request.json or {}
+    path = data.get('path', '')
+    if not path or path.endswith('/'):
+        return jsonify({'error': 'Path required'}), 400
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Size required'}), 400
+    
+    # Security: the filename part is sanitised like regular uploads
+    directory, _, filename = path.rpartition('/')
+    filename = secure_filename(filename)
+    if not filename:
+        return jsonify({'error': 'Invalid filename'}), 400
+    
+    try:
+        session = upload_manager.create(domain, site['public_html'], f"{directory}/{filename}", size,
+                                        overwrite=bool(data.get('overwrite')))
+        return jsonify(session), 201
+    except UploadError as e:
+        return upload_error_response(e)
+    except PermissionError:
+        return jsonify({'error': 'Access denied'}), 403
+    except ValueError:
+        return jsonify({'error': 'Invalid path'}), 400
+    except OSError as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/site/<domain>/files/uploads/<upload_id>', methods=['GET', 'PUT', 'DELETE'])
+def upload_session(domain, upload_id):
+    """Query the committed offset (GET), write a chunk (PUT) or abort (DELETE)"""
+    site = find_site(domain)
+    if not site:
+        return jsonify({'error': 'Site not found'}), 404
+    
+    try:
+        if request.method == 'GET':
+            return jsonify(upload_manager.get(domain, upload_id))
+        if request.method == 'DELETE':
+            upload_manager.abort(domain, upload_id)
+            return jsonify({'success': True, 'message': 'Upload aborted'})
+        
+        try:
+            offset = int(request.args.get('offset', request.headers.get('Upload-Offset', '')))
+        except ValueError:
+            return jsonify({'error': 'Offset required'}), 400
+        # Read the raw body stream; no form parsing or spooling
+        session = upload_manager.write_chunk(domain, upload_id, offset, request.stream,
+                                             length=request.content_length)
+        return jsonify(session)
+    except UploadError as e:
+        return upload_error_response(e)
+
+@app.route('/api/site/<domain>/files/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(domain, upload_id):
+    """Verify the checksum and move the uploaded file into place"""
+    site = find_site(domain)
+    if not site:
+        return jsonify({'error': 'Site not found'}), 404
+    
+    data = request.json or {}
+    try:
+        result = upload_manager.complete(domain, upload_id, checksum=data.get('checksum'),
+                                         algorithm=data.get('algorithm', 'sha256'))
+        site_files_changed(site['domain'], result.get('path'))
+        return jsonify({'success': True, 'message': 'File uploaded', **result})
+    except UploadError as e:
+        return upload_error_response(e)
+    except OSError as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/site/<domain>/files/search')
+def search_files(domain):
+    """Search file contents and names through the site's trigram index
+
+    Query params: q, regex (1 for a regular expression), case (1 for
+    case-sensitive), glob (limit to matching paths), limit, reindex (1 to
+    force a background refresh, full for a rebuild).
+    """
+    site = find_site(domain)
+    if not site:
+        return jsonify({'error': 'Site not found'}), 404
+    
+    query = request.args.get('q', '')
+    if not query:
+        return jsonify({'error': 'Query required'}), 400
+    
+    index = get_search_index(site['public_html'])
+    index.ensure_loaded()
+    reindex = request.args.get('reindex')
+    if not index.ready or reindex:
+        index.refresh_async(force=True, full=reindex == 'full')
+    else:
+        # Stale indexes are refreshed in the background; this query uses the current one
+        index.refresh_async()
+    if not index.ready:
+        return jsonify({'building': True, 'message': 'Search index is being built, try again shortly'}), 202
+    
+    try:
+        result = index.search(
+            query,
+            regex=request.args.get('regex') == '1',
+            case_sensitive=request.args.get('case') == '1',
+            path_glob=request.args.get('glob'),
+            limit=int(request.args.get('limit', 100))
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    result['building'] = index.building
+    return jsonify(result)
+
 @app.route('/api/site/<domain>/files/delete', methods=['POST'])
 def delete_file(domain):
-    """Delete a file or directory"""
-    site = next((s for s in SITES if s['domain'] == domain), None)
+    """Delete a file or directory (via the site's trash)"""
+    site = find_site(domain)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
     
@@ -584,33 +831,119 @@ def delete_file(domain):
     if not file_path:
         return jsonify({'error': 'Path required'}), 400
     
-    base_path = Path(site['public_html'])
-    target_path = base_path / file_path.lstrip('/')
-    
     # Security check
     try:
-        target_path = target_path.resolve()
-        if not str(target_path).startswith(str(base_path.resolve())):
-            return jsonify({'error': 'Access denied'}), 403
-    except:
+        target_path = resolve_site_entry(site['public_html'], file_path)
+    except PermissionError:
+        return jsonify({'error': 'Access denied'}), 403
+    except ValueError:
         return jsonify({'error': 'Invalid path'}), 400
     
-    if not target_path.exists():
+    if not os.path.lexists(target_path):
         return jsonify({'error': 'Path not found'}), 404
     
+    # Moved into the site's trash; the purger deletes it once the restore window ends
     try:
-        if target_path.is_dir():
-            shutil.rmtree(target_path)
-        else:
-            target_path.unlink()
-        return jsonify({'success': True, 'message': 'Deleted'})
+        record = file_trash.trash(site['path'], site['public_html'], target_path)
+        site_files_changed(site['domain'], file_path)
+        return jsonify({'success': True, 'message': 'Moved to trash', 'trash_id': record['id'],
+                        'purge_after': record['purge_after']})
+    except TrashError as e:
+        return jsonify({'error': str(e)}), e.status
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/site/<domain>/files/download')
+@app.route('/api/site/<domain>/files/trash')
+def list_trash(domain):
+    """List deleted files that can still be restored"""
+    site = find_site(domain)
+    if not site:
+        return jsonify({'error': 'Site not found'}), 404
+    return jsonify({'items': file_trash.list(site['path']), 'retention': file_trash.retention})
+
+@app.route('/api/site/<domain>/files/trash/<item_id>/restore', methods=['POST'])
+def restore_trash(domain, item_id):
+    """Move a trashed file or directory back to its original path"""
+    site = find_site(domain)
+    if not site:
+        return jsonify({'error': 'Site not found'}), 404
+    try:
+        record = file_trash.restore(site['path'], site['public_html'], item_id)
+        site_files_changed(site['domain'], record['path'])
+        return jsonify({'success': True, 'message': 'Restored', 'path': record['path']})
+    except TrashError as e:
+        return jsonify({'error': str(e)}), e.status
+    except OSError as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/site/<domain>/files/trash/<item_id>', methods=['DELETE'])
+def purge_trash(domain, item_id):
+    """Permanently delete a trashed item without waiting for its restore window"""
+    site = find_site(domain)
+    if not site:
+        return jsonify({'error': 'Site not found'}), 404
+    try:
+        file_trash.purge(site['path'], item_id)
+        return jsonify({'success': True, 'message': 'Queued for deletion'})
+    except TrashError as e:
+        return jsonify({'error': str(e)}), e.status
+
+@app.route('/api/site/<domain>/files/bulk', methods=['POST'])
+def bulk_files(domain):
+    """Run delete/move/copy/chmod on many paths as one background job
+
+    Body: {operation, paths, destination (move/copy), mode (chmod, octal
+    string), recursive (chmod), overwrite (move/copy)}.
+    """
+    site = find_site(domain)
+    if not site:
+        return jsonify({'error': 'Site not found'}), 404
+    
+    data = request.json or {}
+    try:
+        job = bulk_jobs.submit(
+            site['domain'],
+            site['public_html'],
+            data.get('operation'),
+            data.get('paths'),
+            destination=data.get('destination'),
+            mode=data.get('mode'),
+            recursive=data.get('recursive', False),
+            overwrite=data.get('overwrite', False),
+            site_root=site['path']
+        )
+    except PermissionError:
+        return jsonify({'error': 'Access denied'}), 403
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'success': True, 'message': 'Bulk operation started', **job}), 202
+
+@app.route('/api/site/<domain>/files/bulk/<job_id>', methods=['GET', 'DELETE'])
+def bulk_files_status(domain, job_id):
+    """Get a bulk job's progress and per-item results (GET) or cancel it (DELETE)
+
+    GET accepts offset to only return results for items at that index or later.
+    """
+    site = find_site(domain)
+    if not site:
+        return jsonify({'error': 'Site not found'}), 404
+    
+    if request.method == 'DELETE':
+        job = bulk_jobs.cancel(site['domain'], job_id)
+    else:
+        try:
+            offset = max(0, int(request.args.get('offset', 0)))
+        except ValueError:
+            return jsonify({'error': 'Invalid offset'}), 400
+        job = bulk_jobs.status(site['domain'], job_id, offset=offset)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route('/api/site/<domain>/files/download', methods=['GET', 'HEAD'])
 def download_file(domain):
     """Download a file"""
-    site = next((s for s in SITES if s['domain'] == domain), None)
+    site = find_site(domain)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
     
@@ -618,28 +951,71 @@ def download_file(domain):
     if not file_path:
         return jsonify({'error': 'Path required'}), 400
     
-    base_path = Path(site['public_html'])
-    target_path = base_path / file_path.lstrip('/')
-    
     # Security check
     try:
-        target_path = target_path.resolve()
-        if not str(target_path).startswith(str(base_path.resolve())):
-            return jsonify({'error': 'Access denied'}), 403
-    except:
+        target_path = resolve_site_path(site['public_html'], file_path)
+    except PermissionError:
+        return jsonify({'error': 'Access denied'}), 403
+    except ValueError:
         return jsonify({'error': 'Invalid path'}), 400
     
     if not target_path.exists() or not target_path.is_file():
         return jsonify({'error': 'File not found'}), 404
     
-    return send_file(str(target_path), as_attachment=True)
+    # Handles Range/If-Range, If-None-Match/If-Modified-Since and HEAD
+    try:
+        status, headers, body = prepare_download(target_path, request.environ)
+    except OSError as e:
+        return jsonify({'error': str(e)}), 500
+    return Response(body if body is not None else (), status=status, headers=headers, direct_passthrough=True)
+
+@app.route('/api/site/<domain>/files/download-archive')
+def download_archive(domain):
+    """Stream a directory as a zip or tar.gz archive
+
+    Query params: path, format (zip|tar.gz), compression (deflate|store, zip
+    only). Stored zips are sent with a Content-Length so progress is known.
+    """
+    site = find_site(domain)
+    if not site:
+        return jsonify({'error': 'Site not found'}), 404
+    
+    # Security check
+    try:
+        target_path = resolve_site_path(site['public_html'], request.args.get('path', ''))
+    except PermissionError:
+        return jsonify({'error': 'Access denied'}), 403
+    except ValueError:
+        return jsonify({'error': 'Invalid path'}), 400
+    
+    if not target_path.is_dir():
+        return jsonify({'error': 'Directory not found'}), 404
+    
+    try:
+        chunks, length, mimetype, filename = build_archive(
+            target_path,
+            fmt=request.args.get('format', 'zip'),
+            compression=request.args.get('compression', 'deflate')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except OSError as e:
+        return jsonify({'error': str(e)}), 500
+    
+    if target_path == Path(site['public_html']).resolve():
+        filename = filename.replace(target_path.name, site['domain'], 1)
+    response = Response(chunks, mimetype=mimetype, direct_passthrough=True)
+    response.headers.set('Content-Disposition', 'attachment', filename=filename)
+    if length is not None:
+        response.headers['Content-Length'] = str(length)
+    return response
 
 # ==================== DATABASE MANAGEMENT ====================
 
 @app.route('/api/site/<domain>/database/info')
 def get_database_info(domain):
     """Get database information for a site"""
-    site = next((s for s in SITES if s['domain'] == domain), None)
+    site = find_site(domain)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
     
@@ -718,54 +1094,85 @@ def get_database_tables(domain):
 
 @app.route('/api/site/<domain>/database/table/<table_name>')
 def get_table_data(domain, table_name):
-    """Get table data"""
+    """Get table data
+
+    Query params: per_page, after/before (cursors from next_cursor/prev_cursor),
+    page (offset paging, only used without a cursor), count=exact for COUNT(*)
+    instead of the information_schema row estimate.
+    """
     connection = get_db_connection(domain)
     if not connection:
         return jsonify({'error': 'Could not connect to database'}), 500
     
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 50, type=int)
-    offset = (page - 1) * per_page
     
     try:
         with connection:
             with connection.cursor() as cursor:
-                # Get total count
-                cursor.execute(f"SELECT COUNT(*) as count FROM `{table_name}`")
-                total = cursor.fetchone()['count']
-                
-                # Get data
-                cursor.execute(f"SELECT * FROM `{table_name}` LIMIT {per_page} OFFSET {offset}")
-                rows = cursor.fetchall()
-                
-                # Get columns
-                cursor.execute(f"DESCRIBE `{table_name}`")
-                columns = cursor.fetchall()
+                result = browse_table(
+                    cursor,
+                    table_name,
+                    per_page=per_page,
+                    after=request.args.get('after'),
+                    before=request.args.get('before'),
+                    page=page,
+                    exact_count=request.args.get('count') == 'exact'
+                )
                 
                 return jsonify({
                     'table': table_name,
-                    'columns': [col['Field'] for col in columns],
-                    'rows': rows,
-                    'total': total,
-                    'page': page,
-                    'per_page': per_page,
-                    'pages': (total + per_page - 1) // per_page
+                    'columns': result['columns'],
+                    'rows': result['rows'],
+                    'total': result['total'],
+                    'total_exact': result['total_exact'],
+                    'page': result['page'],
+                    'per_page': result['per_page'],
+                    'pages': (result['total'] + result['per_page'] - 1) // result['per_page'],
+                    'key': result['key'],
+                    'has_more': result['has_more'],
+                    'next_cursor': result['next_cursor'],
+                    'prev_cursor': result['prev_cursor']
                 })
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/site/<domain>/database/query', methods=['POST'])
 def execute_query(domain):
-    """Execute SQL query"""
-    connection = get_db_connection(domain)
-    if not connection:
-        return jsonify({'error': 'Could not connect to database'}), 500
+    """Execute SQL query
+
+    Body: query, format (json | ndjson | csv), max_rows, timeout (seconds),
+    query_id (optional, to cancel it later). ndjson and csv stream the result
+    unbuffered; all formats stop at a server-side row cap (and the streaming
+    ones at a byte cap) and are killed after the time limit.
+    """
+    site = find_site(domain)
+    if not site:
+        return jsonify({'error': 'Site not found'}), 404
     
     data = request.json
     query = data.get('query', '').strip()
+    output_format = data.get('format', 'json')
     
     if not query:
         return jsonify({'error': 'Query required'}), 400
+    if output_format not in ('json', 'ndjson', 'csv'):
+        return jsonify({'error': 'Format must be json, ndjson or csv'}), 400
+    try:
+        max_rows = int(data.get('max_rows') or 0)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'max_rows must be an integer'}), 400
+    try:
+        timeout = float(data.get('timeout') or (QUERY_TIMEOUT if output_format == 'json' else EXPORT_TIMEOUT))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'timeout must be a number of seconds'}), 400
+    if timeout <= 0:
+        return jsonify({'error': 'timeout must be a number of seconds'}), 400
+    timeout = min(timeout, MAX_QUERY_TIMEOUT)
     
     # Security: only allow SELECT, SHOW, DESCRIBE, EXPLAIN
     # Remove comments and whitespace to check the first command
@@ -782,26 +1189,139 @@ def execute_query(domain):
     if not any(query_upper.startswith(cmd) for cmd in allowed_commands):
         return jsonify({'error': 'Only SELECT, SHOW, DESCRIBE, and EXPLAIN queries are allowed'}), 400
     
+    # Exports may stream for minutes; they get their own connections, a few per
+    # site (keyed on the canonical domain, not the alias or case used in the URL)
+    streamed = output_format != 'json'
+    if streamed and not reserve_stream(site['domain']):
+        return jsonify({'error': 'Too many exports running for this site, try again when one finishes'}), 429
+    
+    connection = get_site_db_connection(site, pooled=not streamed)
+    if not connection:
+        if streamed:
+            release_stream(site['domain'])
+        return jsonify({'error': 'Could not connect to database'}), 500
+    
+    row_cap = MAX_STREAM_ROWS if output_format != 'json' else MAX_RESULT_ROWS
+    row_cap = min(max_rows, row_cap) if max_rows > 0 else row_cap
+    
+    # Inline results of read-only statements are cached until a table they read changes
+    query_cache = get_query_cache()
+    cache_key = fingerprint = None
+    if output_format == 'json':
+        normalized = normalize_sql(query)
+        tables = referenced_tables(normalized)
+        if tables:
+            try:
+                fingerprint = query_cache.fingerprint(connection, tables)
+            except Exception as e:
+                print(f"Error reading table metadata for query cache: {e}")
+        if fingerprint is not None:
+            cache_key = (connection.host, connection.db, normalized, row_cap)
+            body = query_cache.get(cache_key, fingerprint)
+            if body is not None:
+                connection.close()
+                response = Response(body, mimetype='application/json')
+                response.headers['X-Query-Cache'] = 'hit'
+                return response
+        else:
+            query_cache.note_uncacheable()
+    
+    server_info = connection.get_server_info()
     try:
-        with connection:
-            with connection.cursor() as cursor:
-                cursor.execute(query)
-                if query_upper.startswith('SELECT') or query_upper.startswith('SHOW') or query_upper.startswith('DESCRIBE') or query_upper.startswith('DESC') or query_upper.startswith('EXPLAIN'):
-                    results = cursor.fetchall()
-                    return jsonify({
-                        'success': True,
-                        'results': results,
-                        'row_count': len(results)
-                    })
-                else:
-                    connection.commit()
-                    return jsonify({
-                        'success': True,
-                        'message': 'Query executed successfully',
-                        'affected_rows': cursor.rowcount
-                    })
+        running = get_query_registry().register(
+            site['domain'], query, connection, timeout, lambda: get_site_db_connection(site, pooled=False),
+            data.get('query_id')
+        )
+    except ValueError as e:
+        connection.close()
+        if streamed:
+            release_stream(site['domain'])
+        return jsonify({'error': str(e)}), 400
+    
+    def finished():
+        running.finish()
+        if streamed:
+            release_stream(site['domain'])
+    
+    def query_failed(e):
+        failure = running.failure(e)
+        if failure:
+            return jsonify({'error': failure[0], 'query_id': running.id}), failure[1]
+        return jsonify({'error': str(e), 'query_id': running.id}), 500
+    
+    try:
+        # Unbuffered: rows come off the socket as they are written out
+        result = StreamedQuery(
+            connection,
+            limit_execution_time(query, timeout, server_info),
+            max_rows=row_cap,
+            on_close=finished
+        )
+    except Exception as e:
+        return query_failed(e)
+    
+    if output_format == 'json':
+        try:
+            results = result.fetch()
+        except Exception as e:
+            return query_failed(e)
+        response = jsonify({
+            'success': True,
+            'results': results,
+            'row_count': len(results),
+            'truncated': bool(result.truncated)
+        })
+        if cache_key is not None:
+            query_cache.put(cache_key, fingerprint, response.get_data())
+        response.headers['X-Query-Cache'] = 'miss' if cache_key is not None else 'bypass'
+        response.headers['X-Query-Id'] = running.id
+        return response
+    
+    if output_format == 'csv':
+        response = Response(result.csv(), mimetype='text/csv')
+        response.headers['Content-Disposition'] = f'attachment; filename="{domain}-query.csv"'
+    else:
+        response = Response(result.ndjson(), mimetype='application/x-ndjson')
+    response.headers['X-Row-Limit'] = str(result.max_rows)
+    response.headers['X-Byte-Limit'] = str(result.max_bytes)
+    response.headers['X-Query-Id'] = running.id
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/site/<domain>/database/queries')
+def list_running_queries(domain):
+    """Queries from the SQL console still running against the site's database"""
+    site = find_site(domain)
+    if not site:
+        return jsonify({'error': 'Site not found'}), 404
+    return jsonify({'queries': get_query_registry().running(site['domain'])})
+
+@app.route('/api/site/<domain>/database/queries/<query_id>/cancel', methods=['POST'])
+def cancel_query(domain, query_id):
+    """Stop a running query with KILL QUERY"""
+    site = find_site(domain)
+    if not site:
+        return jsonify({'error': 'Site not found'}), 404
+    try:
+        query = get_query_registry().cancel(site['domain'], query_id)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    if query is None:
+        return jsonify({'error': 'Query not found or already finished'}), 404
+    return jsonify({'success': True, 'message': 'Query cancelled', 'query': query})
+
+@app.route('/api/database/pool')
+def get_database_pool_stats():
+    """Connection pool counters and per-database in-use/idle connections"""
+    return jsonify(get_connection_pool().stats())
+
+@app.route('/api/database/query-cache', methods=['GET', 'DELETE'])
+def database_query_cache():
+    """Query result cache hit/miss counters; DELETE empties the cache"""
+    query_cache = get_query_cache()
+    if request.method == 'DELETE':
+        query_cache.clear()
+    return jsonify(query_cache.stats())
 
 def create_backup_async(domain, backup_type, backup_id, include_db=True, include_files=True):
     """Create backup in background thread"""
@@ -815,7 +1335,7 @@ def create_backup_async(domain, backup_type, backup_id, include_db=True, include
                 'domain': domain
             }
         
-        site = next((s for s in SITES if s['domain'] == domain), None)
+        site = find_site(domain)
         if not site:
             with backup_lock:
                 backup_status[backup_id] = {'status': 'error', 'message': 'Site not found'}
@@ -823,7 +1343,7 @@ def create_backup_async(domain, backup_type, backup_id, include_db=True, include
         
         # Create backups folder with date/time
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_folder = BASE_DIR / domain / 'backups' / timestamp
+        backup_folder = BASE_DIR / site['domain'] / 'backups' / timestamp
         backup_folder.mkdir(parents=True, exist_ok=True)
         
         files_created = []
@@ -965,11 +1485,13 @@ host={db_info.get('db_host', '127.0.0.1')}
     except Exception as e:
         with backup_lock:
             backup_status[backup_id] = {'status': 'error', 'message': str(e)}
+    finally:
+        site_files_changed(domain)
 
 @app.route('/api/site/<domain>/backup', methods=['POST'])
 def create_backup(domain):
     """Create a backup (database, files, or both)"""
-    site = next((s for s in SITES if s['domain'] == domain), None)
+    site = find_site(domain)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
     
@@ -1036,11 +1558,11 @@ def backup_files(domain):
 @app.route('/api/site/<domain>/backups', methods=['GET'])
 def list_backups(domain):
     """List all backups for a domain"""
-    site = next((s for s in SITES if s['domain'] == domain), None)
+    site = find_site(domain)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
     
-    backups_dir = BASE_DIR / domain / 'backups'
+    backups_dir = BASE_DIR / site['domain'] / 'backups'
     backups = []
     
     if backups_dir.exists():
@@ -1115,11 +1637,11 @@ def list_file_backups(domain):
 @app.route('/api/site/<domain>/backups/<backup_folder>', methods=['DELETE'])
 def delete_backup(domain, backup_folder):
     """Delete a backup folder"""
-    site = next((s for s in SITES if s['domain'] == domain), None)
+    site = find_site(domain)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
     
-    backups_dir = BASE_DIR / domain / 'backups' / backup_folder
+    backups_dir = BASE_DIR / site['domain'] / 'backups' / backup_folder
     
     if not backups_dir.exists() or not backups_dir.is_dir():
         return jsonify({'error': 'Backup not found'}), 404
@@ -1127,6 +1649,7 @@ def delete_backup(domain, backup_folder):
     try:
         import shutil
         shutil.rmtree(backups_dir)
+        site_files_changed(site['domain'])
         return jsonify({'success': True, 'message': 'Backup deleted'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -1134,11 +1657,11 @@ def delete_backup(domain, backup_folder):
 @app.route('/api/site/<domain>/backups/settings', methods=['GET', 'POST'])
 def backup_settings(domain):
     """Get or update backup settings"""
-    site = next((s for s in SITES if s['domain'] == domain), None)
+    site = find_site(domain)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
     
-    settings_file = BASE_DIR / domain / 'backups' / '.settings.json'
+    settings_file = BASE_DIR / site['domain'] / 'backups' / '.settings.json'
     
     if request.method == 'GET':
         # Return default settings if file doesn't exist
@@ -1175,8 +1698,8 @@ def check_and_run_auto_backups():
     print("Auto-backup scheduler thread started")
     while True:
         try:
-            # Detect sites fresh each time (in case new sites are added)
-            sites = detect_sites()
+            # Read the inventory's current snapshot (it picks up new sites itself)
+            sites = site_inventory.snapshot().sites
             
             current_time = datetime.now()
             current_hour = current_time.hour
@@ -1318,10 +1841,9 @@ def cleanup_old_backups(domain, retention):
     except Exception as e:
         print(f"Error cleaning up backups for {domain}: {e}")
 
-# Start auto-backup scheduler in background thread
+# Auto-backup scheduler, started with the other background threads
 backup_scheduler_thread = threading.Thread(target=check_and_run_auto_backups)
 backup_scheduler_thread.daemon = True
-backup_scheduler_thread.start()
 
 # ==================== RESOURCE MONITORING ====================
 
@@ -1406,7 +1928,7 @@ def get_system_info():
 @app.route('/api/site/<domain>/wordpress/info')
 def get_wordpress_info(domain):
     """Get WordPress information"""
-    site = next((s for s in SITES if s['domain'] == domain), None)
+    site = find_site(domain)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
     
@@ -1427,18 +1949,12 @@ def get_wordpress_info(domain):
             pass
     
     # Get site URL from wp-config
-    try:
-        with open(wp_config, 'r') as f:
-            content = f.read()
-            match = re.search(r"define\s*\(\s*['\"]WP_HOME['\"]\s*,\s*['\"]([^'\"]+)['\"]", content)
-            if match:
-                wp_info['home_url'] = match.group(1)
-            
-            match = re.search(r"define\s*\(\s*['\"]WP_SITEURL['\"]\s*,\s*['\"]([^'\"]+)['\"]", content)
-            if match:
-                wp_info['site_url'] = match.group(1)
-    except:
-        pass
+    config = load_wp_config(wp_config)
+    if config:
+        if config.get('WP_HOME'):
+            wp_info['home_url'] = config.get('WP_HOME')
+        if config.get('WP_SITEURL'):
+            wp_info['site_url'] = config.get('WP_SITEURL')
     
     # Get plugin count
     plugins_dir = Path(site['public_html']) / 'wp-content' / 'plugins'
@@ -1528,15 +2044,7 @@ def get_active_plugins(wp_path):
         try:
             with connection:
                 with connection.cursor() as cursor:
-                    # Get table prefix
-                    wp_config = wp_path / 'wp-config.php'
-                    table_prefix = 'wp_'
-                    if wp_config.exists():
-                        with open(wp_config, 'r', encoding='utf-8', errors='ignore') as f:
-                            config_content = f.read()
-                            prefix_match = re.search(r"\$table_prefix\s*=\s*['\"]([^'\"]+)['\"]", config_content)
-                            if prefix_match:
-                                table_prefix = prefix_match.group(1)
+                    table_prefix = get_table_prefix(wp_path)
                     
                     # Get active plugins from options table
                     cursor.execute(f"SELECT option_value FROM {table_prefix}options WHERE option_name = 'active_plugins' LIMIT 1")
@@ -1556,50 +2064,31 @@ def get_active_plugins(wp_path):
 def get_db_connection_from_config(wp_path):
     """Get database connection from wp-config.php"""
     try:
-        wp_config = wp_path / 'wp-config.php'
-        if not wp_config.exists():
+        db_info = extract_db_info(wp_path / 'wp-config.php')
+        if not all(db_info.get(key) for key in ('db_name', 'db_user', 'db_password', 'db_host')):
             return None
         
-        with open(wp_config, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
-        
-        # Extract database credentials
-        db_name_match = re.search(r"define\s*\(\s*['\"]DB_NAME['\"]\s*,\s*['\"]([^'\"]+)['\"]", content)
-        db_user_match = re.search(r"define\s*\(\s*['\"]DB_USER['\"]\s*,\s*['\"]([^'\"]+)['\"]", content)
-        db_pass_match = re.search(r"define\s*\(\s*['\"]DB_PASSWORD['\"]\s*,\s*['\"]([^'\"]+)['\"]", content)
-        db_host_match = re.search(r"define\s*\(\s*['\"]DB_HOST['\"]\s*,\s*['\"]([^'\"]+)['\"]", content)
-        
-        if not all([db_name_match, db_user_match, db_pass_match, db_host_match]):
-            return None
-        
-        db_info = {
-            'db_name': db_name_match.group(1),
-            'db_user': db_user_match.group(1),
-            'db_password': db_pass_match.group(1),
-            'db_host': db_host_match.group(1)
-        }
-        
         return get_db_connection_from_info(db_info)
     except:
         return None
 
 def get_db_connection_from_info(db_info):
-    """Create database connection from info dict"""
-    try:
-        return pymysql.connect(
-            host=db_info['db_host'],
-            user=db_info['db_user'],
-            password=db_info['db_password'],
-            database=db_info['db_name'],
-            cursorclass=pymysql.cursors.DictCursor
+    """Check out a pooled database connection for an info dict"""
+    try:
+        return get_connection_pool().connection(
+            db_info['db_host'],
+            db_info['db_user'],
+            db_info['db_password'],
+            db_info['db_name']
         )
-    except:
+    except Exception as e:
+        print(f"Error connecting to database {db_info.get('db_name')}: {e}")
         return None
 
 @app.route('/api/site/<domain>/wordpress/plugins', methods=['GET'])
 def get_wordpress_plugins(domain):
     """Get list of WordPress plugins"""
-    site = next((s for s in SITES if s['domain'] == domain), None)
+    site = find_site(domain)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
     
@@ -1996,15 +2485,7 @@ def get_active_theme(wp_path):
         if not connection:
             return None
         
-        # Get table prefix
-        wp_config = wp_path / 'wp-config.php'
-        table_prefix = 'wp_'
-        if wp_config.exists():
-            with open(wp_config, 'r', encoding='utf-8', errors='ignore') as f:
-                config_content = f.read()
-                prefix_match = re.search(r"\$table_prefix\s*=\s*['\"]([^'\"]+)['\"]", config_content)
-                if prefix_match:
-                    table_prefix = prefix_match.group(1)
+        table_prefix = get_table_prefix(wp_path)
         
         try:
             with connection:
@@ -2056,7 +2537,7 @@ def find_plugin_main_file(wp_path, plugin_slug):
 @app.route('/api/site/<domain>/wordpress/plugins/<plugin>/<action>', methods=['POST'])
 def manage_wordpress_plugin(domain, plugin, action):
     """Enable, disable, or activate a WordPress plugin"""
-    site = next((s for s in SITES if s['domain'] == domain), None)
+    site = find_site(domain)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
     
@@ -2072,15 +2553,7 @@ def manage_wordpress_plugin(domain, plugin, action):
         if not connection:
             return jsonify({'error': 'Could not connect to database'}), 500
         
-        # Get table prefix
-        wp_config = wp_path / 'wp-config.php'
-        table_prefix = 'wp_'
-        if wp_config.exists():
-            with open(wp_config, 'r', encoding='utf-8', errors='ignore') as f:
-                config_content = f.read()
-                prefix_match = re.search(r"\$table_prefix\s*=\s*['\"]([^'\"]+)['\"]", config_content)
-                if prefix_match:
-                    table_prefix = prefix_match.group(1)
+        table_prefix = get_table_prefix(wp_path)
         
         # Find plugin main file
         plugin_main_file = find_plugin_main_file(wp_path, plugin)
@@ -2123,7 +2596,7 @@ def manage_wordpress_plugin(domain, plugin, action):
 @app.route('/api/site/<domain>/wordpress/themes', methods=['GET'])
 def get_wordpress_themes(domain):
     """Get list of WordPress themes"""
-    site = next((s for s in SITES if s['domain'] == domain), None)
+    site = find_site(domain)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
     
@@ -2165,7 +2638,7 @@ def get_wordpress_themes(domain):
 @app.route('/api/site/<domain>/wordpress/themes/<theme>/activate', methods=['POST'])
 def activate_wordpress_theme(domain, theme):
     """Activate a WordPress theme"""
-    site = next((s for s in SITES if s['domain'] == domain), None)
+    site = find_site(domain)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
     
@@ -2183,15 +2656,7 @@ def activate_wordpress_theme(domain, theme):
         if not connection:
             return jsonify({'error': 'Could not connect to database'}), 500
         
-        # Get table prefix
-        wp_config = wp_path / 'wp-config.php'
-        table_prefix = 'wp_'
-        if wp_config.exists():
-            with open(wp_config, 'r', encoding='utf-8', errors='ignore') as f:
-                config_content = f.read()
-                prefix_match = re.search(r"\$table_prefix\s*=\s*['\"]([^'\"]+)['\"]", config_content)
-                if prefix_match:
-                    table_prefix = prefix_match.group(1)
+        table_prefix = get_table_prefix(wp_path)
         
         with connection:
             with connection.cursor() as cursor:
@@ -2218,7 +2683,7 @@ def enable_wordpress_theme(domain, theme):
 @app.route('/api/site/<domain>/wordpress/themes/<theme>/disable', methods=['POST'])
 def disable_wordpress_theme(domain, theme):
     """Disable a WordPress theme (switch to default theme first)"""
-    site = next((s for s in SITES if s['domain'] == domain), None)
+    site = find_site(domain)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
     
@@ -2261,15 +2726,7 @@ def disable_wordpress_theme(domain, theme):
         if not connection:
             return jsonify({'error': 'Could not connect to database'}), 500
         
-        # Get table prefix
-        wp_config = wp_path / 'wp-config.php'
-        table_prefix = 'wp_'
-        if wp_config.exists():
-            with open(wp_config, 'r', encoding='utf-8', errors='ignore') as f:
-                config_content = f.read()
-                prefix_match = re.search(r"\$table_prefix\s*=\s*['\"]([^'\"]+)['\"]", config_content)
-                if prefix_match:
-                    table_prefix = prefix_match.group(1)
+        table_prefix = get_table_prefix(wp_path)
         
         with connection:
             with connection.cursor() as cursor:
@@ -2292,7 +2749,7 @@ def disable_wordpress_theme(domain, theme):
 @app.route('/api/site/<domain>/logs/<log_type>')
 def get_site_logs(domain, log_type):
     """Get logs for a site"""
-    site = next((s for s in SITES if s['domain'] == domain), None)
+    site = find_site(domain)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
     
@@ -2939,6 +3396,8 @@ def get_cloudflare_headers():
         }
     return None
 
+mail_cloudflare.configure(get_cloudflare_headers, log_cloudflare_email_event)
+
 @app.route('/api/cloudflare/config', methods=['GET'])
 def get_cloudflare_config():
     """Get Cloudflare API configuration status"""
@@ -3738,10 +4197,23 @@ def create_email_user():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def start_background_threads():
+    """Start the inventory watcher, trash purger and auto-backup scheduler
+
+    Only called when this file runs as the server. Disk-usage worker
+    processes (forkserver/spawn) re-import it as __mp_main__ and must not
+    run any of these.
+    """
+    site_inventory.start()
+    file_trash.start()
+    backup_scheduler_thread.start()
+
 if __name__ == '__main__':
+    start_background_threads()
+    
     # Detect sites on startup
-    SITES = detect_sites()
-    print(f"Detected {len(SITES)} sites")
+    snapshot = site_inventory.refresh()
+    print(f"Detected {len(snapshot.sites)} sites")
     
     debug_mode = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
     app.run(host='127.0.0.1', port=5000, debug=debug_mode)
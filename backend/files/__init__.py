@@ -0,0 +1,40 @@
+"""File manager helpers used by the site files API."""
+
+from .paths import resolve_site_entry, resolve_site_path
+from .listing import describe_path, format_size, list_directory
+from .download import file_etag, prepare_download
+from .uploads import UploadError, UploadManager
+from .patch import PatchError, content_hash, save_file
+from .archive import build_archive
+from .bulk import BulkJobManager
+from .search import SearchIndex, get_search_index
+from .trash import TrashError, TrashManager
+from .watch import WatchLimitError, get_directory_watcher
+from .window import WINDOW_BYTES, read_bytes, read_lines, read_tail
+
+__all__ = [
+    "resolve_site_entry",
+    "resolve_site_path",
+    "format_size",
+    "describe_path",
+    "list_directory",
+    "file_etag",
+    "prepare_download",
+    "UploadError",
+    "UploadManager",
+    "WINDOW_BYTES",
+    "read_bytes",
+    "read_lines",
+    "read_tail",
+    "PatchError",
+    "content_hash",
+    "save_file",
+    "build_archive",
+    "BulkJobManager",
+    "SearchIndex",
+    "get_search_index",
+    "TrashError",
+    "TrashManager",
+    "WatchLimitError",
+    "get_directory_watcher",
+]
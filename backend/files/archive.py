@@ -0,0 +1,341 @@
+"""Streaming zip and tar.gz archives of site directories.
+
+Archives are generated while the tree is walked and yielded in chunks, with
+no temp file and only one read buffer in memory. Zip entries use data
+descriptors (sizes and CRC follow the data), and ZIP64 records where sizes or
+offsets need them; only the small central directory records are kept until
+the end. A stored (uncompressed) zip's exact length is known from the
+``stat`` sizes alone, so for that format alone the tree is walked up front
+and the archive is sent with a Content-Length.
+
+Each file contributes exactly the size it had when the tree was walked:
+a file that grows meanwhile is cut at that size, one that shrinks is padded
+with zeros, so the archive always matches the announced length.
+"""
+
+from __future__ import annotations
+
+import os
+import stat
+import struct
+import tarfile
+import time
+import zlib
+from typing import Iterable, Iterator, List, Tuple
+
+CHUNK_SIZE = 1024 * 1024
+
+FORMATS = ("zip", "tar.gz")
+ZIP_COMPRESSION = ("store", "deflate")
+
+# Same conservative limit as zipfile, for readers that treat fields as signed
+ZIP64_LIMIT = (1 << 31) - 1
+ZIP_FILECOUNT_LIMIT = 0xFFFF
+
+_METHOD_STORED = 0
+_METHOD_DEFLATED = 8
+_FLAG_DATA_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+_VERSION = 20
+_ZIP64_VERSION = 45
+_MADE_BY_UNIX = 3 << 8
+
+
+class _Entry:
+    __slots__ = ("path", "name", "kind", "size", "mtime", "mode", "uid", "gid", "link",
+                 "offset", "crc", "compressed", "zip64")
+
+    def __init__(self, path: str, name: str, st: os.stat_result):
+        self.path = path
+        self.name = name
+        self.mtime = st.st_mtime
+        self.mode = st.st_mode
+        self.uid = st.st_uid
+        self.gid = st.st_gid
+        self.link = None
+        if stat.S_ISDIR(st.st_mode):
+            self.kind, self.size = "dir", 0
+        elif stat.S_ISLNK(st.st_mode):
+            self.kind = "link"
+            self.link = os.readlink(path)
+            self.size = len(os.fsencode(self.link))
+        else:
+            self.kind, self.size = "file", st.st_size
+        self.offset = 0
+        self.crc = 0
+        self.compressed = 0
+        self.zip64 = False
+
+
+def iter_entries(directory: str, arc_root: str) -> Iterator[_Entry]:
+    """Walk ``directory`` (without following symlinks), yielding archive entries."""
+    yield _Entry(directory, arc_root, os.lstat(directory))
+    stack = [(directory, arc_root)]
+    while stack:
+        path, name = stack.pop()
+        try:
+            with os.scandir(path) as it:
+                children = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+        for child in children:
+            try:
+                entry = _Entry(child.path, f"{name}/{child.name}", child.stat(follow_symlinks=False))
+            except OSError:
+                continue
+            if entry.kind == "file" and not child.is_file(follow_symlinks=False):
+                # Sockets, fifos and devices
+                continue
+            yield entry
+            if entry.kind == "dir":
+                stack.append((child.path, entry.name))
+
+
+def collect_entries(directory: str, arc_root: str) -> List[_Entry]:
+    """All of ``directory``'s entries, for when the archive size must be known first."""
+    return list(iter_entries(directory, arc_root))
+
+
+def _read_exact(entry: _Entry) -> Iterator[bytes]:
+    """Yield exactly ``entry.size`` bytes of the entry's content."""
+    if entry.kind == "link":
+        yield os.fsencode(entry.link)
+        return
+    remaining = entry.size
+    try:
+        with open(entry.path, "rb") as f:
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+    except OSError:
+        pass
+    while remaining > 0:
+        pad = min(CHUNK_SIZE, remaining)
+        remaining -= pad
+        yield b"\0" * pad
+
+
+# ---- zip ----
+
+def _zip_name(entry: _Entry) -> Tuple[bytes, int]:
+    name = entry.name + ("/" if entry.kind == "dir" else "")
+    raw = os.fsencode(name)
+    try:
+        raw.decode("ascii")
+        return raw, 0
+    except UnicodeDecodeError:
+        try:
+            raw.decode("utf-8")
+            return raw, _FLAG_UTF8
+        except UnicodeDecodeError:
+            return raw, 0
+
+
+def _dos_time(mtime: float) -> Tuple[int, int]:
+    t = time.localtime(mtime)
+    if t.tm_year < 1980:
+        return 0, (0 << 9) | (1 << 5) | 1
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), \
+        ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+
+def _needs_zip64(entry: _Entry, deflate: bool) -> bool:
+    # Deflate can slightly expand incompressible data; keep the same margin as zipfile
+    return entry.size * (1.05 if deflate else 1) > ZIP64_LIMIT
+
+
+def _local_header(entry: _Entry, name: bytes, flags: int, method: int) -> bytes:
+    dostime, dosdate = _dos_time(entry.mtime)
+    if entry.kind == "dir":
+        return struct.pack("<IHHHHHIIIHH", 0x04034B50, _VERSION, flags, _METHOD_STORED,
+                           dostime, dosdate, 0, 0, 0, len(name), 0) + name
+    extra = b""
+    sizes = 0
+    version = _VERSION
+    if entry.zip64:
+        extra = struct.pack("<HHQQ", 1, 16, 0, 0)
+        sizes = 0xFFFFFFFF
+        version = _ZIP64_VERSION
+    return struct.pack("<IHHHHHIIIHH", 0x04034B50, version, flags | _FLAG_DATA_DESCRIPTOR, method,
+                       dostime, dosdate, 0, sizes, sizes, len(name), len(extra)) + name + extra
+
+
+def _central_header(entry: _Entry, name: bytes, flags: int, method: int) -> bytes:
+    dostime, dosdate = _dos_time(entry.mtime)
+    extra_fields = []
+    usize, csize, offset = entry.size, entry.compressed, entry.offset
+    if usize > ZIP64_LIMIT:
+        extra_fields.append(usize)
+        usize = 0xFFFFFFFF
+    if csize > ZIP64_LIMIT:
+        extra_fields.append(csize)
+        csize = 0xFFFFFFFF
+    if offset > ZIP64_LIMIT:
+        extra_fields.append(offset)
+        offset = 0xFFFFFFFF
+    extra = b""
+    if extra_fields:
+        extra = struct.pack("<HH", 1, 8 * len(extra_fields)) + struct.pack(f"<{len(extra_fields)}Q", *extra_fields)
+    version = _ZIP64_VERSION if extra_fields or entry.zip64 else _VERSION
+    if entry.kind == "dir":
+        method = _METHOD_STORED
+    else:
+        flags |= _FLAG_DATA_DESCRIPTOR
+    attrs = ((entry.mode & 0xFFFF) << 16) | (0x10 if entry.kind == "dir" else 0)
+    return struct.pack("<IHHHHHHIIIHHHHHII", 0x02014B50, _MADE_BY_UNIX | version, version, flags, method,
+                       dostime, dosdate, entry.crc, csize, usize, len(name), len(extra), 0, 0, 0,
+                       attrs, offset) + name + extra
+
+
+def _end_records(count: int, cd_offset: int, cd_size: int) -> bytes:
+    records = b""
+    if count > ZIP_FILECOUNT_LIMIT or cd_offset > ZIP64_LIMIT or cd_size > ZIP64_LIMIT:
+        zip64_offset = cd_offset + cd_size
+        records += struct.pack("<IQHHIIQQQQ", 0x06064B50, 44, _MADE_BY_UNIX | _ZIP64_VERSION, _ZIP64_VERSION,
+                               0, 0, count, count, cd_size, cd_offset)
+        records += struct.pack("<IIQI", 0x07064B50, 0, zip64_offset, 1)
+    records += struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+                           min(cd_size, 0xFFFFFFFF), min(cd_offset, 0xFFFFFFFF), 0)
+    return records
+
+
+def zip_stored_length(entries: List[_Entry]) -> int:
+    """Exact size of the stored zip ``stream_zip`` would produce for ``entries``."""
+    offset = 0
+    cd_size = 0
+    for entry in entries:
+        name, _ = _zip_name(entry)
+        zip64 = entry.kind != "dir" and _needs_zip64(entry, False)
+        local = 30 + len(name)
+        if entry.kind != "dir":
+            local += (20 if zip64 else 0) + entry.size + (24 if zip64 else 16)
+        overflow = (2 if entry.size > ZIP64_LIMIT else 0) + (1 if offset > ZIP64_LIMIT else 0)
+        cd_size += 46 + len(name) + (4 + 8 * overflow if overflow else 0)
+        offset += local
+    return offset + cd_size + len(_end_records(len(entries), offset, cd_size))
+
+
+def stream_zip(entries: Iterable[_Entry], deflate: bool = True) -> Iterator[bytes]:
+    method = _METHOD_DEFLATED if deflate else _METHOD_STORED
+    offset = 0
+    central: List[bytes] = []
+    for entry in entries:
+        name, flags = _zip_name(entry)
+        entry.offset = offset
+        entry.zip64 = entry.kind != "dir" and _needs_zip64(entry, deflate)
+        header = _local_header(entry, name, flags, method)
+        yield header
+        offset += len(header)
+        if entry.kind == "dir":
+            central.append(_central_header(entry, name, flags, method))
+            continue
+
+        crc = 0
+        compressed = 0
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15) if deflate else None
+        for chunk in _read_exact(entry):
+            crc = zlib.crc32(chunk, crc)
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                compressed += len(chunk)
+                yield chunk
+        if compressor:
+            tail = compressor.flush()
+            compressed += len(tail)
+            yield tail
+        entry.crc = crc
+        entry.compressed = compressed
+
+        if entry.zip64:
+            descriptor = struct.pack("<IIQQ", 0x08074B50, crc, compressed, entry.size)
+        else:
+            descriptor = struct.pack("<IIII", 0x08074B50, crc, compressed, entry.size)
+        yield descriptor
+        offset += compressed + len(descriptor)
+        central.append(_central_header(entry, name, flags, method))
+
+    cd_offset = offset
+    cd_size = 0
+    for record in central:
+        cd_size += len(record)
+        yield record
+    yield _end_records(len(central), cd_offset, cd_size)
+
+
+# ---- tar.gz ----
+
+def _tar_info(entry: _Entry) -> tarfile.TarInfo:
+    info = tarfile.TarInfo(entry.name)
+    info.mtime = int(entry.mtime)
+    info.mode = stat.S_IMODE(entry.mode)
+    info.uid = entry.uid
+    info.gid = entry.gid
+    if entry.kind == "dir":
+        info.type = tarfile.DIRTYPE
+    elif entry.kind == "link":
+        info.type = tarfile.SYMTYPE
+        info.linkname = entry.link
+    else:
+        info.type = tarfile.REGTYPE
+        info.size = entry.size
+    return info
+
+
+def stream_tar_gz(entries: Iterable[_Entry], level: int = 6) -> Iterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    written = 0
+
+    def emit(data: bytes) -> bytes:
+        nonlocal written
+        written += len(data)
+        return compressor.compress(data)
+
+    for entry in entries:
+        out = emit(_tar_info(entry).tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape"))
+        if out:
+            yield out
+        if entry.kind != "file":
+            continue
+        for chunk in _read_exact(entry):
+            out = emit(chunk)
+            if out:
+                yield out
+        remainder = entry.size % tarfile.BLOCKSIZE
+        if remainder:
+            out = emit(b"\0" * (tarfile.BLOCKSIZE - remainder))
+            if out:
+                yield out
+
+    # End-of-archive marker, padded to a full record as tarfile does
+    trailer = b"\0" * (tarfile.BLOCKSIZE * 2)
+    record = tarfile.RECORDSIZE
+    trailer += b"\0" * (-(written + len(trailer)) % record)
+    out = emit(trailer)
+    if out:
+        yield out
+    yield compressor.flush()
+
+
+def build_archive(directory, fmt: str = "zip", compression: str = "deflate"):
+    """Return ``(chunks, content_length, mimetype, filename)`` for ``directory``.
+
+    ``content_length`` is only known for stored zips, which walk the tree
+    first; the other formats walk it as the archive streams. Raises
+    ``ValueError`` for an unknown format or compression.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported archive format: {fmt}")
+    if compression not in ZIP_COMPRESSION:
+        raise ValueError(f"Unsupported compression: {compression}")
+    directory = str(directory)
+    arc_root = os.path.basename(os.path.normpath(directory)) or "archive"
+    if fmt == "tar.gz":
+        return stream_tar_gz(iter_entries(directory, arc_root)), None, "application/gzip", f"{arc_root}.tar.gz"
+    if compression == "store":
+        entries = collect_entries(directory, arc_root)
+        return stream_zip(entries, deflate=False), zip_stored_length(entries), "application/zip", f"{arc_root}.zip"
+    return stream_zip(iter_entries(directory, arc_root), deflate=True), None, "application/zip", f"{arc_root}.zip"
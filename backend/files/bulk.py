@@ -0,0 +1,225 @@
+"""Bulk file operations run as tracked background jobs.
+
+A job takes one operation (delete, move, copy or chmod) and a list of paths
+relative to the site's base directory. The base is resolved once per job;
+items run on a bounded worker pool shared by all jobs, and each records its
+own result, so progress and failures can be polled while the job runs.
+"""
+
+from __future__ import annotations
+
+import os
+import secrets
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from .paths import resolve_site_entry, resolve_site_path
+from .trash import TrashError
+
+OPERATIONS = ("delete", "move", "copy", "chmod")
+
+MAX_WORKERS = 4
+MAX_ITEMS = 10000
+# Finished jobs are kept this long for polling
+JOB_TTL = 60 * 60
+
+
+def _delete(target: Path, options: dict) -> None:
+    if target.is_dir() and not target.is_symlink():
+        shutil.rmtree(target)
+    else:
+        target.unlink()
+
+
+def _destination(target: Path, options: dict) -> Path:
+    destination = options["destination"] / target.name
+    if destination == target:
+        raise ValueError("Source and destination are the same")
+    if target.is_dir() and not target.is_symlink() and target in destination.parents:
+        raise ValueError("Cannot copy or move a directory into itself")
+    if os.path.lexists(destination) and not options.get("overwrite"):
+        raise FileExistsError(f"{destination.name} already exists at destination")
+    return destination
+
+
+def _move(target: Path, options: dict) -> None:
+    destination = _destination(target, options)
+    if os.path.lexists(destination):
+        # The replaced file or directory goes to the trash like any other delete
+        if options.get("discard"):
+            options["discard"](destination, options)
+        elif destination.is_dir() and not destination.is_symlink():
+            shutil.rmtree(destination)
+    shutil.move(str(target), str(destination))
+
+
+def _copy(target: Path, options: dict) -> None:
+    destination = _destination(target, options)
+    if target.is_dir() and not target.is_symlink():
+        shutil.copytree(target, destination, symlinks=True, dirs_exist_ok=bool(options.get("overwrite")))
+    else:
+        shutil.copy2(target, destination, follow_symlinks=False)
+
+
+def _chmod(target: Path, options: dict) -> None:
+    mode = options["mode"]
+    if target.is_symlink():
+        # Linux can't chmod a link itself, and following it could leave the site
+        return
+    os.chmod(target, mode)
+    if options.get("recursive") and target.is_dir():
+        for root, dirs, files in os.walk(target):
+            for name in dirs + files:
+                path = os.path.join(root, name)
+                if not os.path.islink(path):
+                    os.chmod(path, mode)
+
+
+_HANDLERS = {
+    "delete": _delete,
+    "move": _move,
+    "copy": _copy,
+    "chmod": _chmod,
+}
+
+
+class BulkJobManager:
+    """Runs bulk file jobs on a shared worker pool and keeps their status."""
+
+    def __init__(self, workers: int = MAX_WORKERS, ttl: float = JOB_TTL, trash=None,
+                 on_finished: Optional[Callable[[str], None]] = None):
+        self.ttl = ttl
+        # TrashManager; when set, deletes go to the site's trash instead of rmtree
+        self.trash = trash
+        # Called with the job's domain once all of its items have run
+        self.on_finished = on_finished
+        self._jobs: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk-files")
+
+    def _prune(self) -> None:
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job["finished_at"] and now - job["finished_at"] > self.ttl:
+                del self._jobs[job_id]
+
+    def submit(self, domain: str, base_path, operation: str, paths: List[str],
+               destination: Optional[str] = None, mode: Optional[str] = None,
+               recursive: bool = False, overwrite: bool = False, site_root=None) -> dict:
+        """Validate the request and start the job; raises ``ValueError`` if it is malformed."""
+        if operation not in OPERATIONS:
+            raise ValueError(f"Unknown operation: {operation}")
+        if not isinstance(paths, list) or not paths:
+            raise ValueError("Paths required")
+        if len(paths) > MAX_ITEMS:
+            raise ValueError(f"At most {MAX_ITEMS} paths per job")
+
+        base = Path(base_path).resolve()
+        options = {"recursive": bool(recursive), "overwrite": bool(overwrite)}
+        if operation in ("move", "copy"):
+            if destination is None:
+                raise ValueError("Destination required")
+            options["destination"] = resolve_site_path(base, destination)
+            if not options["destination"].is_dir():
+                raise ValueError("Destination directory not found")
+        if operation == "chmod":
+            try:
+                options["mode"] = int(str(mode), 8)
+            except (TypeError, ValueError):
+                raise ValueError("Mode must be an octal string such as 644")
+            if options["mode"] & ~0o7777:
+                raise ValueError("Mode must be an octal string such as 644")
+
+        job_id = secrets.token_hex(8)
+        job = {
+            "job_id": job_id,
+            "domain": domain,
+            "operation": operation,
+            "status": "running",
+            "total": len(paths),
+            "done": 0,
+            "failed": 0,
+            "progress": 0,
+            "cancelled": False,
+            "results": [None] * len(paths),
+            "created_at": time.time(),
+            "finished_at": None,
+        }
+        with self._lock:
+            self._prune()
+            self._jobs[job_id] = job
+
+        handler = _HANDLERS[operation]
+        if self.trash is not None and site_root is not None:
+            if operation == "delete":
+                handler = partial(self._trash_item, site_root, base)
+            elif operation == "move":
+                options["discard"] = partial(self._trash_item, site_root, base)
+        for index, rel_path in enumerate(paths):
+            self._executor.submit(self._run_item, job, index, str(rel_path), base, handler, options)
+        return self.status(domain, job_id, include_results=False)
+
+    def _trash_item(self, site_root, base: Path, target: Path, options: dict) -> dict:
+        return {"trash_id": self.trash.trash(site_root, base, target)["id"]}
+
+    def _run_item(self, job: dict, index: int, rel_path: str, base: Path, handler, options: dict) -> None:
+        result = {"index": index, "path": rel_path, "status": "ok"}
+        if job["cancelled"]:
+            result["status"] = "cancelled"
+        else:
+            try:
+                target = resolve_site_entry(base, rel_path)
+                if not os.path.lexists(target):
+                    raise FileNotFoundError("Path not found")
+                outcome = handler(target, options)
+                if outcome:
+                    result.update(outcome)
+            except PermissionError as e:
+                result.update(status="error", error=str(e) or "Access denied")
+            except (OSError, ValueError, shutil.Error, TrashError) as e:
+                result.update(status="error", error=str(e))
+
+        with self._lock:
+            job["results"][index] = result
+            job["done"] += 1
+            if result["status"] == "error":
+                job["failed"] += 1
+            job["progress"] = int(job["done"] * 100 / job["total"])
+            finished = job["done"] == job["total"]
+            if finished:
+                job["finished_at"] = time.time()
+                if job["cancelled"]:
+                    job["status"] = "cancelled"
+                else:
+                    job["status"] = "completed" if not job["failed"] else "completed_with_errors"
+
+        if finished and self.on_finished is not None and job["operation"] != "chmod":
+            try:
+                self.on_finished(job["domain"])
+            except Exception as e:
+                print(f"Error in bulk job {job['job_id']} callback: {e}")
+
+    def status(self, domain: str, job_id: str, include_results: bool = True, offset: int = 0) -> Optional[dict]:
+        """Return the job's progress; ``results`` holds the finished items at index ``offset`` or later."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["domain"] != domain:
+                return None
+            status = {key: value for key, value in job.items() if key not in ("results", "domain")}
+            if include_results:
+                status["results"] = [r for r in job["results"][offset:] if r is not None]
+            return status
+
+    def cancel(self, domain: str, job_id: str) -> Optional[dict]:
+        """Skip the job's items that haven't started yet."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["domain"] != domain:
+                return None
+            job["cancelled"] = True
+        return self.status(domain, job_id, include_results=False)
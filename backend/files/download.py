@@ -0,0 +1,96 @@
+"""Conditional and ranged file downloads for the site files API.
+
+The validator is built from the inode, mtime and size, so it changes whenever
+the file is replaced or rewritten, without reading its contents. Bodies are
+handed to the server's ``wsgi.file_wrapper`` when it provides one (gunicorn
+and uWSGI send those with ``sendfile``); otherwise the requested byte range
+is streamed in fixed-size chunks.
+"""
+
+from __future__ import annotations
+
+import mimetypes
+import os
+from datetime import datetime, timezone
+from typing import Iterator, Optional, Tuple
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import http_date, is_resource_modified, parse_if_range_header, parse_range_header
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def file_etag(st: os.stat_result) -> str:
+    return f"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+def _iter_range(path: str, start: int, length: int, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _range_applies(environ: dict, etag: str, last_modified: datetime) -> bool:
+    """Honour ``If-Range``: only serve a partial body if the validator still matches."""
+    if_range = parse_if_range_header(environ.get("HTTP_IF_RANGE"))
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    if if_range.date is not None:
+        return if_range.date >= last_modified
+    return True
+
+
+def prepare_download(path, environ: dict, as_attachment: bool = True) -> Tuple[int, Headers, Optional[object]]:
+    """Evaluate the request's conditional and range headers against ``path``.
+
+    Returns ``(status, headers, body)``; ``body`` is None for 304, 416 and
+    HEAD responses. Raises ``OSError`` if the file cannot be stat'ed or opened.
+    """
+    path = str(path)
+    st = os.stat(path)
+    size = st.st_size
+    etag = file_etag(st)
+    last_modified = datetime.fromtimestamp(int(st.st_mtime), timezone.utc)
+
+    headers = Headers()
+    headers["ETag"] = f'"{etag}"'
+    headers["Last-Modified"] = http_date(last_modified)
+    headers["Accept-Ranges"] = "bytes"
+
+    if not is_resource_modified(environ, etag=etag, last_modified=last_modified, ignore_if_range=True):
+        return 304, headers, None
+
+    mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    headers["Content-Type"] = mimetype
+    if as_attachment:
+        headers.set("Content-Disposition", "attachment", filename=os.path.basename(path))
+
+    status, start, length = 200, 0, size
+    byte_range = parse_range_header(environ.get("HTTP_RANGE"))
+    # Multi-range requests are answered with the whole file
+    if byte_range is not None and len(byte_range.ranges) == 1 and _range_applies(environ, etag, last_modified):
+        bounds = byte_range.range_for_length(size)
+        if bounds is None:
+            headers["Content-Range"] = f"bytes */{size}"
+            return 416, headers, None
+        start, stop = bounds
+        status, length = 206, stop - start
+        headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+
+    headers["Content-Length"] = str(length)
+    if environ.get("REQUEST_METHOD") == "HEAD":
+        return status, headers, None
+
+    file_wrapper = environ.get("wsgi.file_wrapper")
+    if file_wrapper is not None:
+        # PEP 3333 servers send from the current offset and stop at Content-Length
+        f = open(path, "rb")
+        f.seek(start)
+        return status, headers, file_wrapper(f, CHUNK_SIZE)
+    return status, headers, _iter_range(path, start, length)
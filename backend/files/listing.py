@@ -0,0 +1,149 @@
+"""Paged directory listings built on ``os.scandir``.
+
+Names and entry types come from the directory read itself, so filtering and
+sorting by name cost no ``stat`` calls; only the entries on the returned page
+are stat'ed (and only when stat fields are wanted). Sorting by size or mtime
+needs a ``stat`` per entry, once. Pages are addressed by an opaque cursor
+holding the sort key of the last entry returned.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import fnmatch
+import json
+import os
+import stat
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+SORT_FIELDS = ("name", "size", "mtime")
+MAX_LIMIT = 5000
+
+
+def format_size(size):
+    """Format file size"""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024.0:
+            return f"{size:.2f} {unit}"
+        size /= 1024.0
+    return f"{size:.2f} TB"
+
+
+def _encode_cursor(key: tuple) -> str:
+    raw = json.dumps(list(key), separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, binascii.Error):
+        raise ValueError("Invalid cursor")
+    if not isinstance(key, list) or len(key) != 3:
+        raise ValueError("Invalid cursor")
+    return tuple(key)
+
+
+def _matcher(pattern: Optional[str]):
+    """Glob when the pattern has wildcards, case-insensitive substring otherwise."""
+    if not pattern:
+        return None
+    pattern = pattern.lower()
+    if any(ch in pattern for ch in "*?["):
+        return lambda name: fnmatch.fnmatchcase(name.lower(), pattern)
+    return lambda name: pattern in name.lower()
+
+
+def _entry_info(name: str, path: str, base: Path, is_dir: bool, st: Optional[os.stat_result]) -> dict:
+    info = {
+        'name': name,
+        'path': os.path.relpath(path, base),
+        'type': 'directory' if is_dir else 'file',
+    }
+    if st is not None:
+        info.update({
+            'size': st.st_size if not is_dir else 0,
+            'size_human': format_size(st.st_size) if not is_dir else '-',
+            'modified': datetime.fromtimestamp(st.st_mtime).isoformat(),
+            'permissions': oct(st.st_mode)[-3:],
+        })
+    return info
+
+
+def describe_path(path: str, base: Path) -> dict:
+    """Describe one path in the same format as listing entries; raises ``OSError``."""
+    st = os.stat(path)
+    return _entry_info(os.path.basename(path), path, base, stat.S_ISDIR(st.st_mode), st)
+
+
+def list_directory(directory: Path, base: Path, sort: str = "name", descending: bool = False,
+                   pattern: Optional[str] = None, limit: Optional[int] = None,
+                   cursor: Optional[str] = None, with_stat: bool = True) -> dict:
+    """List one page of ``directory``; directories always come before files.
+
+    Returns ``{'files', 'total', 'next_cursor'}``. Raises ``ValueError`` for a
+    bad sort field or cursor and ``OSError`` if the directory can't be read.
+    """
+    if sort not in SORT_FIELDS:
+        raise ValueError(f"Invalid sort field: {sort}")
+    match = _matcher(pattern)
+
+    needs_stat_to_sort = sort != "name"
+    rows: List[Tuple[tuple, os.DirEntry, bool, Optional[os.stat_result]]] = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if match and not match(entry.name):
+                continue
+            try:
+                is_dir = entry.is_dir()
+                st = entry.stat() if needs_stat_to_sort else None
+            except OSError:
+                continue
+            if sort == "size":
+                value = 0 if is_dir else st.st_size
+            elif sort == "mtime":
+                value = st.st_mtime
+            else:
+                value = entry.name.lower()
+            rows.append(((not is_dir, value, entry.name), entry, is_dir, st))
+
+    # Directories first in either direction; only the value order flips
+    rows.sort(key=lambda row: row[0][1:], reverse=descending)
+    rows.sort(key=lambda row: row[0][0])
+
+    def after(key: tuple, last: tuple) -> bool:
+        if key[0] != last[0]:
+            return key[0] > last[0]
+        return key[1:] < last[1:] if descending else key[1:] > last[1:]
+
+    start = 0
+    if cursor:
+        last = _decode_cursor(cursor)
+        last = (bool(last[0]), last[1], last[2])
+        try:
+            start = next((i for i, row in enumerate(rows) if after(row[0], last)), len(rows))
+        except TypeError:
+            raise ValueError("Cursor does not match sort order")
+
+    if limit is not None:
+        limit = max(1, min(limit, MAX_LIMIT))
+        page = rows[start:start + limit]
+    else:
+        page = rows[start:]
+
+    files = []
+    for key, entry, is_dir, st in page:
+        if with_stat and st is None:
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+        files.append(_entry_info(entry.name, entry.path, base, is_dir, st if with_stat else None))
+
+    end = start + len(page)
+    next_cursor = _encode_cursor(page[-1][0]) if page and limit is not None and end < len(rows) else None
+    return {'files': files, 'total': len(rows), 'next_cursor': next_cursor}
@@ -0,0 +1,225 @@
+"""Delta writes for the file editor.
+
+Clients send the hash of the content they edited plus either byte-range
+edits or a unified diff, instead of the whole file. The edit is applied to
+the current file only if its hash still matches (optimistic concurrency).
+Overwriting an existing file with full content needs the hash too, so an
+editor can't save over changes it never loaded. The result replaces the
+file atomically: temp file in the same directory, ``fsync``, ``rename``.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence
+
+HASH_ALGORITHM = "sha256"
+
+_HUNK_RE = re.compile(rb"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+def _process_umask() -> int:
+    # Read once at import, before any worker threads could create files
+    # while the umask is briefly cleared
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# mkstemp creates files as 0600; new files get the mode open() would give them
+NEW_FILE_MODE = 0o666 & ~_process_umask()
+
+
+class PatchError(Exception):
+    """Raised when an edit can't be applied; carries an HTTP status."""
+
+    def __init__(self, message: str, status: int = 400, current_hash: Optional[str] = None):
+        super().__init__(message)
+        self.status = status
+        self.current_hash = current_hash
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.new(HASH_ALGORITHM, data).hexdigest()
+
+
+def apply_edits(data: bytes, edits: Sequence[dict]) -> bytes:
+    """Apply ``[{start, end, text}]`` edits, given as byte offsets into ``data``."""
+    parsed = []
+    for edit in edits:
+        try:
+            start = int(edit["start"])
+            end = int(edit.get("end", start))
+            text = edit.get("text", "")
+        except (KeyError, TypeError, ValueError):
+            raise PatchError("Each edit needs integer start/end and text")
+        if not 0 <= start <= end <= len(data):
+            raise PatchError(f"Edit range {start}-{end} is outside the file")
+        parsed.append((start, end, text.encode("utf-8")))
+
+    parsed.sort(key=lambda e: (e[0], e[1]))
+    for previous, current in zip(parsed, parsed[1:]):
+        if current[0] < previous[1]:
+            raise PatchError("Edits overlap")
+
+    parts: List[bytes] = []
+    position = 0
+    for start, end, text in parsed:
+        parts.append(data[position:start])
+        parts.append(text)
+        position = end
+    parts.append(data[position:])
+    return b"".join(parts)
+
+
+def apply_unified_diff(data: bytes, diff: str) -> bytes:
+    """Apply a single-file unified diff to ``data``; context must match exactly."""
+    source = data.splitlines(keepends=True)
+    output: List[bytes] = []
+    position = 0
+    previous_tag = None
+    lines = diff.encode("utf-8").splitlines(keepends=True)
+    i = 0
+    while i < len(lines):
+        match = _HUNK_RE.match(lines[i])
+        i += 1
+        if not match:
+            # File headers (---/+++) and anything before the first hunk
+            continue
+        old_start = int(match.group(1))
+        # A zero-length hunk's start is the line *before* the insertion
+        hunk_start = old_start - 1 if match.group(2) != b"0" else old_start
+        if hunk_start < position or hunk_start > len(source):
+            raise PatchError("Hunks are out of order or outside the file")
+        output.extend(source[position:hunk_start])
+        position = hunk_start
+
+        while i < len(lines) and not lines[i].startswith(b"@@"):
+            line = lines[i]
+            i += 1
+            if line.startswith(b"\\"):
+                # "\ No newline at end of file" applies to the previous line
+                if output and output[-1].endswith(b"\n") and previous_tag in (b" ", b"+"):
+                    output[-1] = output[-1][:-1]
+                continue
+            tag, body = line[:1], line[1:]
+            previous_tag = tag
+            if tag in (b" ", b"-"):
+                if position >= len(source) or source[position].rstrip(b"\r\n") != body.rstrip(b"\r\n"):
+                    raise PatchError(f"Diff does not apply at line {position + 1}", 409)
+                if tag == b" ":
+                    output.append(source[position])
+                position += 1
+            elif tag == b"+":
+                output.append(body if body.endswith(b"\n") else body + b"\n")
+            elif line.strip() == b"":
+                # Some tools drop the leading space on empty context lines
+                if position >= len(source) or source[position].strip() != b"":
+                    raise PatchError(f"Diff does not apply at line {position + 1}", 409)
+                output.append(source[position])
+                position += 1
+            else:
+                raise PatchError("Malformed diff line")
+    output.extend(source[position:])
+    return b"".join(output)
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """Replace ``path`` with ``data`` via temp file, fsync and rename."""
+    directory = os.path.dirname(path) or "."
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        st = None
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            if st is not None:
+                os.fchmod(f.fileno(), st.st_mode & 0o7777)
+                try:
+                    os.fchown(f.fileno(), st.st_uid, st.st_gid)
+                except PermissionError:
+                    pass
+            else:
+                os.fchmod(f.fileno(), NEW_FILE_MODE)
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+# path -> [lock, number of saves holding or waiting for it]; entries are
+# dropped when the last one finishes so the table doesn't grow forever
+_path_locks: Dict[str, list] = {}
+_path_locks_lock = threading.Lock()
+
+
+@contextmanager
+def _path_lock(path: str) -> Iterator[None]:
+    with _path_locks_lock:
+        entry = _path_locks.setdefault(path, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _path_locks_lock:
+            entry[1] -= 1
+            if not entry[1]:
+                del _path_locks[path]
+
+
+def save_file(path, base_hash: Optional[str] = None, content: Optional[str] = None,
+              edits: Optional[Sequence[dict]] = None, diff: Optional[str] = None) -> dict:
+    """Write ``content``, or apply ``edits``/``diff`` to the current file.
+
+    ``base_hash`` is required for edits and diffs, and for full content
+    whenever the file already exists. A missing or mismatched hash raises
+    ``PatchError`` (409) with the current hash. Returns the new size and hash.
+    """
+    path = str(path)
+    if content is None and edits is None and diff is None:
+        raise PatchError("Content, edits or diff required")
+    if content is None and not base_hash:
+        raise PatchError("base_hash required for edits and diffs")
+
+    with _path_lock(path):
+        try:
+            with open(path, "rb") as f:
+                current = f.read()
+        except FileNotFoundError:
+            if content is None:
+                raise PatchError("File not found", 404)
+            current = None
+
+        current_hash = content_hash(current) if current is not None else None
+        if current is not None and not base_hash:
+            raise PatchError("base_hash required to overwrite an existing file", 409, current_hash)
+        if base_hash and current_hash != base_hash:
+            raise PatchError("File changed since it was loaded", 409, current_hash)
+
+        if content is not None:
+            data = content.encode("utf-8")
+        elif edits is not None:
+            data = apply_edits(current, edits)
+        else:
+            data = apply_unified_diff(current, diff)
+
+        atomic_write(path, data)
+        return {"size": len(data), "hash": content_hash(data)}
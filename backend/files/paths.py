@@ -0,0 +1,34 @@
+"""Path resolution for the site files API."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+
+def resolve_site_path(base_path, file_path: str) -> Path:
+    """Resolve ``file_path`` (relative to ``base_path``) and keep it inside it.
+
+    Raises ``PermissionError`` if the resolved path escapes ``base_path``
+    and ``ValueError`` if it cannot be resolved.
+    """
+    base = Path(base_path).resolve()
+    try:
+        target = (base / (file_path or "").lstrip("/")).resolve()
+    except (OSError, RuntimeError) as err:
+        raise ValueError(f"Invalid path: {err}")
+    if target != base and base not in target.parents:
+        raise PermissionError("Access denied")
+    return target
+
+
+def resolve_site_entry(base_path, file_path: str) -> Path:
+    """Like ``resolve_site_path`` but leave the last component unresolved.
+
+    Operations on the entry itself (delete, move, chmod) then act on a
+    symlink rather than on whatever it points to.
+    """
+    file_path = (file_path or "").strip("/")
+    parent, _, name = file_path.rpartition("/")
+    if name in ("", ".", ".."):
+        raise ValueError("Invalid path")
+    return resolve_site_path(base_path, parent) / name
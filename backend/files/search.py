@@ -0,0 +1,435 @@
+"""Per-site file search backed by a trigram index.
+
+Every text file under ``MAX_FILE_SIZE`` is broken into the set of byte
+trigrams it contains (ASCII case-folded) and its id is added to the posting
+list of each. A query is reduced to the trigrams any match must contain; the
+intersection of their postings gives the candidate files, and only those are
+opened and checked with the real regular expression. Filenames are matched
+straight from the index.
+
+Refreshes compare each file's ``(mtime_ns, size)`` with the index and only
+re-read files that changed. Changed and deleted files are tombstoned rather
+than removed from the postings; the index is rebuilt once too many entries
+are dead. The index is persisted, so restarts only pay for what changed.
+"""
+
+from __future__ import annotations
+
+import fnmatch
+import hashlib
+import os
+import pickle
+import re
+import string
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+DEFAULT_INDEX_DIR = ROOT_DIR / ".cache" / "search_index"
+
+SEARCH_INDEX_DIR = Path(os.environ.get("SEARCH_INDEX_DIR", DEFAULT_INDEX_DIR))
+
+INDEX_VERSION = 1
+
+# Larger files are matched by name only
+MAX_FILE_SIZE = 1024 * 1024
+SKIP_DIRS = {".git", ".svn", ".hg", "node_modules"}
+
+# Queries trigger a background refresh when the index is older than this
+REFRESH_INTERVAL = 5 * 60
+# Rebuild from scratch once this share of file entries is dead
+MAX_DEAD_RATIO = 0.25
+
+MAX_RESULTS = 200
+MAX_MATCHES_PER_FILE = 20
+MAX_LINE_LENGTH = 300
+SEARCH_TIME_BUDGET = 5.0
+
+_REGEX_SPECIAL = set(".^$*+?{}[]()|\\")
+# Hex digits taken by \x, \u and \U escapes
+_ESCAPE_HEX_DIGITS = {"x": 2, "u": 4, "U": 8}
+
+
+def _default_index_path(root: Path) -> Path:
+    digest = hashlib.sha1(str(root).encode("utf-8")).hexdigest()[:12]
+    return SEARCH_INDEX_DIR / f"{root.name}-{digest}.pickle"
+
+
+def _trigrams(data: bytes) -> Set[int]:
+    data = data.lower()
+    return {(a << 16) | (b << 8) | c for a, b, c in set(zip(data, data[1:], data[2:]))}
+
+
+def _is_binary(data: bytes) -> bool:
+    return b"\0" in data[:8192]
+
+
+def _escape_end(pattern: str, i: int) -> int:
+    """Index just past the alphanumeric escape sequence starting at ``pattern[i]``."""
+    nxt = pattern[i + 1]
+    end = i + 2
+    if nxt in _ESCAPE_HEX_DIGITS:
+        limit = end + _ESCAPE_HEX_DIGITS[nxt]
+        while end < min(limit, len(pattern)) and pattern[end] in string.hexdigits:
+            end += 1
+    elif nxt == "N" and pattern.startswith("{", end):
+        close = pattern.find("}", end)
+        end = len(pattern) if close == -1 else close + 1
+    elif nxt.isdigit():
+        # Octal (\0, \012, \123) or a backreference (\1 to \99)
+        while end < min(i + 4, len(pattern)) and pattern[end].isdigit():
+            end += 1
+    return end
+
+
+def required_literals(pattern: str, regex: bool) -> List[str]:
+    """Return substrings every match of ``pattern`` must contain.
+
+    Plain queries are their own literal. For regexes only top-level literal
+    runs are used, and none at all when the pattern has a top-level
+    alternation, so the result never excludes a real match.
+    """
+    if not regex:
+        return [pattern]
+    literals: List[str] = []
+    run: List[str] = []
+    depth = 0
+    i = 0
+
+    def flush():
+        if run:
+            literals.append("".join(run))
+            run.clear()
+
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "\\" and i + 1 < len(pattern):
+            nxt = pattern[i + 1]
+            if depth == 0 and not nxt.isalnum():
+                run.append(nxt)
+                i += 2
+            else:
+                # Classes, anchors, \x.. / \u.... / \N{...} and octal or
+                # backreference escapes all end the literal run
+                flush()
+                i = _escape_end(pattern, i)
+            continue
+        if ch == "[":
+            flush()
+            end = pattern.find("]", i + 2)
+            i = len(pattern) if end == -1 else end + 1
+            continue
+        if ch == "(":
+            flush()
+            depth += 1
+        elif ch == ")":
+            depth = max(0, depth - 1)
+        elif ch == "|" and depth == 0:
+            return []
+        elif ch in "*?{":
+            # The preceding character may be absent
+            if run:
+                run.pop()
+            flush()
+            if ch == "{":
+                end = pattern.find("}", i)
+                i = len(pattern) if end == -1 else end + 1
+                continue
+        elif ch in _REGEX_SPECIAL:
+            flush()
+        elif depth == 0:
+            run.append(ch)
+        i += 1
+    flush()
+    return literals
+
+
+class SearchIndex:
+    """Trigram and filename index for one site tree."""
+
+    def __init__(self, root, index_path: Optional[Path] = None):
+        self.root = Path(root)
+        self.index_path = Path(index_path) if index_path else _default_index_path(self.root)
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._loaded = False
+        # id -> [rel_path, mtime_ns, size, indexed_content] or None once dead
+        self._files: List[Optional[list]] = []
+        self._by_path: Dict[str, int] = {}
+        self._postings: Dict[int, array] = {}
+        self._dead = 0
+        self.indexed_at = 0.0
+        self.building = False
+
+    @property
+    def ready(self) -> bool:
+        return self.indexed_at > 0
+
+    def _load(self) -> None:
+        self._loaded = True
+        try:
+            with open(self.index_path, "rb") as f:
+                data = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            return
+        if data.get("version") != INDEX_VERSION or data.get("root") != str(self.root):
+            return
+        self._files = data["files"]
+        self._postings = data["postings"]
+        self._dead = data["dead"]
+        self.indexed_at = data["indexed_at"]
+        self._by_path = {entry[0]: i for i, entry in enumerate(self._files) if entry is not None}
+
+    def _save(self) -> None:
+        # Only refresh() mutates the index and it holds _refresh_lock, so
+        # this can run without blocking queries
+        payload = {
+            "version": INDEX_VERSION,
+            "root": str(self.root),
+            "files": self._files,
+            "postings": self._postings,
+            "dead": self._dead,
+            "indexed_at": self.indexed_at,
+        }
+        try:
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.index_path.with_suffix(".tmp")
+            with open(tmp_path, "wb") as f:
+                pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.index_path)
+        except OSError as err:
+            print(f"Error saving search index for {self.root}: {err}")
+
+    def _walk(self) -> Iterable[Tuple[str, os.stat_result]]:
+        stack = [""]
+        while stack:
+            rel = stack.pop()
+            path = os.path.join(self.root, rel) if rel else str(self.root)
+            try:
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if entry.name not in SKIP_DIRS:
+                                    stack.append(os.path.join(rel, entry.name) if rel else entry.name)
+                            elif entry.is_file(follow_symlinks=False):
+                                yield (os.path.join(rel, entry.name) if rel else entry.name,
+                                       entry.stat(follow_symlinks=False))
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+
+    def _add(self, rel: str, st: os.stat_result, trigrams: Optional[Set[int]]) -> None:
+        """Register a file version; caller holds ``_lock``."""
+        old = self._by_path.get(rel)
+        if old is not None:
+            self._files[old] = None
+            self._dead += 1
+        file_id = len(self._files)
+        self._files.append([rel, st.st_mtime_ns, st.st_size, trigrams is not None])
+        self._by_path[rel] = file_id
+        for trigram in trigrams or ():
+            postings = self._postings.get(trigram)
+            if postings is None:
+                postings = self._postings[trigram] = array("I")
+            postings.append(file_id)
+
+    def _remove(self, rel: str) -> None:
+        file_id = self._by_path.pop(rel, None)
+        if file_id is not None:
+            self._files[file_id] = None
+            self._dead += 1
+
+    def _update(self) -> dict:
+        """Re-read files whose ``(mtime_ns, size)`` changed and drop deleted ones."""
+        with self._lock:
+            known = {rel: self._files[i] for rel, i in self._by_path.items()}
+
+        seen: Set[str] = set()
+        updated = 0
+        for rel, st in self._walk():
+            seen.add(rel)
+            entry = known.get(rel)
+            if entry is not None and entry[1] == st.st_mtime_ns and entry[2] == st.st_size:
+                continue
+            trigrams = None
+            if st.st_size <= MAX_FILE_SIZE:
+                try:
+                    with open(os.path.join(self.root, rel), "rb") as f:
+                        data = f.read()
+                    if not _is_binary(data):
+                        trigrams = _trigrams(data)
+                except OSError:
+                    pass
+            with self._lock:
+                self._add(rel, st, trigrams)
+            updated += 1
+
+        with self._lock:
+            removed = [rel for rel in self._by_path if rel not in seen]
+            for rel in removed:
+                self._remove(rel)
+            self.indexed_at = time.time()
+            return {"files": len(self._by_path), "updated": updated, "removed": len(removed)}
+
+    def refresh(self, full: bool = False) -> dict:
+        """Bring the index up to date with the tree; returns refresh stats."""
+        with self._refresh_lock:
+            self.building = True
+            try:
+                with self._lock:
+                    if not self._loaded:
+                        self._load()
+                    rebuild = full or (bool(self._files) and self._dead > len(self._files) * MAX_DEAD_RATIO)
+
+                if rebuild:
+                    # Build a fresh index on the side; queries keep using this one
+                    fresh = SearchIndex(self.root, self.index_path)
+                    fresh._loaded = True
+                    stats = fresh._update()
+                    with self._lock:
+                        self._files, self._by_path = fresh._files, fresh._by_path
+                        self._postings, self._dead = fresh._postings, fresh._dead
+                        self.indexed_at = fresh.indexed_at
+                else:
+                    stats = self._update()
+                stats["rebuilt"] = rebuild
+
+                if stats["updated"] or stats["removed"] or rebuild:
+                    self._save()
+                return stats
+            finally:
+                self.building = False
+
+    def refresh_async(self, force: bool = False, full: bool = False) -> bool:
+        """Start a background refresh if one is due and none is running."""
+        with self._lock:
+            if self.building or (not force and self.ready and time.time() - self.indexed_at < REFRESH_INTERVAL):
+                return False
+            self.building = True
+
+        def run():
+            try:
+                self.refresh(full=full)
+            except Exception as e:
+                print(f"Error refreshing search index for {self.root}: {e}")
+
+        threading.Thread(target=run, name="site-search-index", daemon=True).start()
+        return True
+
+    def ensure_loaded(self) -> None:
+        with self._lock:
+            if not self._loaded:
+                self._load()
+
+    def _candidates(self, literals: List[str], ignore_case: bool) -> List[Tuple[int, list]]:
+        """Return live ``(id, entry)`` pairs whose content may match; caller holds ``_lock``."""
+        trigrams: Set[int] = set()
+        for literal in literals:
+            raw = literal.encode("utf-8")
+            if ignore_case and not raw.isascii():
+                # Only ASCII is case-folded in the index
+                continue
+            trigrams |= _trigrams(raw)
+
+        if not trigrams:
+            return [(i, entry) for i, entry in enumerate(self._files) if entry is not None and entry[3]]
+
+        lists = sorted((self._postings.get(t, ()) for t in trigrams), key=len)
+        if not lists[0]:
+            return []
+        ids = set(lists[0])
+        for postings in lists[1:]:
+            ids.intersection_update(postings)
+            if not ids:
+                return []
+        return [(i, self._files[i]) for i in sorted(ids) if self._files[i] is not None]
+
+    def search(self, query: str, regex: bool = False, case_sensitive: bool = False,
+               path_glob: Optional[str] = None, limit: int = MAX_RESULTS,
+               time_budget: float = SEARCH_TIME_BUDGET) -> dict:
+        """Search file contents and names; raises ``ValueError`` for a bad regex."""
+        started = time.time()
+        limit = max(1, min(limit, MAX_RESULTS))
+        flags = 0 if case_sensitive else re.IGNORECASE
+        try:
+            compiled = re.compile((query if regex else re.escape(query)).encode("utf-8"), flags | re.MULTILINE)
+        except re.error as err:
+            raise ValueError(f"Invalid regex: {err}")
+        name_pattern = query if case_sensitive else query.lower()
+
+        with self._lock:
+            candidates = self._candidates(required_literals(query, regex), not case_sensitive)
+            names = []
+            if not regex:
+                for rel in self._by_path:
+                    name = os.path.basename(rel)
+                    if name_pattern in (name if case_sensitive else name.lower()):
+                        names.append(rel)
+                        if len(names) >= limit:
+                            break
+
+        if path_glob:
+            candidates = [(i, e) for i, e in candidates if fnmatch.fnmatch(e[0], path_glob)]
+            names = [rel for rel in names if fnmatch.fnmatch(rel, path_glob)]
+
+        results = []
+        scanned = 0
+        partial = False
+        for _, (rel, _mtime, _size, _indexed) in candidates:
+            if len(results) >= limit:
+                partial = True
+                break
+            if time.time() - started > time_budget:
+                partial = True
+                break
+            try:
+                with open(os.path.join(self.root, rel), "rb") as f:
+                    data = f.read(MAX_FILE_SIZE + 1)
+            except OSError:
+                continue
+            scanned += 1
+            matches = []
+            for match in compiled.finditer(data):
+                line_start = data.rfind(b"\n", 0, match.start()) + 1
+                line_end = data.find(b"\n", match.end())
+                line_end = len(data) if line_end == -1 else line_end
+                matches.append({
+                    "line": data.count(b"\n", 0, match.start()) + 1,
+                    "text": data[line_start:line_end][:MAX_LINE_LENGTH].decode("utf-8", errors="replace"),
+                })
+                if len(matches) >= MAX_MATCHES_PER_FILE:
+                    break
+            if matches:
+                results.append({"path": rel, "matches": matches})
+
+        return {
+            "query": query,
+            "regex": regex,
+            "results": results,
+            "filenames": sorted(names),
+            "candidates": len(candidates),
+            "scanned": scanned,
+            "partial": partial,
+            "indexed_at": self.indexed_at or None,
+            "elapsed": round(time.time() - started, 3),
+        }
+
+
+_indexes: Dict[str, SearchIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_search_index(root) -> SearchIndex:
+    """Return the shared search index for ``root``, creating it on first use."""
+    key = str(Path(root))
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = SearchIndex(key)
+            _indexes[key] = index
+        return index
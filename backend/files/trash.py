@@ -0,0 +1,262 @@
+"""Per-site trash with deferred background purging.
+
+Deleting renames the target into ``<site>/.trash/<id>/`` (outside
+public_html, on the same filesystem, so the rename is atomic and instant)
+next to a small JSON record of where it came from. Items can be restored
+until their retention window ends; after that a background purger removes
+them. The purger runs at idle I/O priority and lowest CPU priority where
+the platform allows, and caps how many entries it unlinks per second so a
+500k-file cache directory doesn't starve the sites being served.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import json
+import os
+import secrets
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional
+
+TRASH_DIR_NAME = ".trash"
+
+# Seconds a trashed item can be restored before it is purged
+TRASH_RETENTION = int(os.environ.get("TRASH_RETENTION", 24 * 60 * 60))
+PURGE_INTERVAL = 60
+# Upper bound on unlink/rmdir calls per second while purging
+PURGE_RATE = 2000
+
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_CLASS_IDLE = 3
+_IOPRIO_CLASS_SHIFT = 13
+_SYS_IOPRIO_SET = {"x86_64": 251, "aarch64": 30, "i686": 289, "i386": 289}
+
+
+class TrashError(Exception):
+    """Raised when a trash operation can't be done; carries an HTTP status."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def _lower_thread_priority() -> None:
+    """Best effort: idle I/O class and nice 19 for the calling thread (Linux)."""
+    tid = threading.get_native_id()
+    try:
+        os.setpriority(os.PRIO_PROCESS, tid, 19)
+    except (AttributeError, OSError):
+        pass
+    syscall_nr = _SYS_IOPRIO_SET.get(os.uname().machine)
+    if syscall_nr is None:
+        return
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.syscall(syscall_nr, _IOPRIO_WHO_PROCESS, tid, _IOPRIO_CLASS_IDLE << _IOPRIO_CLASS_SHIFT)
+    except (OSError, AttributeError):
+        pass
+
+
+class TrashManager:
+    """Moves files into per-site trash directories and purges them later."""
+
+    def __init__(self, site_roots: Callable[[], Iterable], retention: float = TRASH_RETENTION,
+                 rate: int = PURGE_RATE, interval: float = PURGE_INTERVAL):
+        self._site_roots = site_roots
+        self.retention = retention
+        self.rate = rate
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def trash_dir(site_root) -> Path:
+        return Path(site_root) / TRASH_DIR_NAME
+
+    def trash(self, site_root, base, target: Path) -> dict:
+        """Rename ``target`` into the site's trash; raises ``TrashError``.
+
+        ``base`` is the directory paths are reported relative to (public_html).
+        Returns the trash record.
+        """
+        trash_dir = self.trash_dir(site_root)
+        base = Path(base).resolve()
+        if target == base or target == trash_dir or trash_dir in target.parents:
+            raise TrashError("Cannot delete this path", 403)
+        item_id = f"{int(time.time())}-{secrets.token_hex(4)}"
+        item_dir = trash_dir / item_id
+        item_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            os.chmod(trash_dir, 0o700)
+        except OSError:
+            pass
+
+        now = time.time()
+        record = {
+            "id": item_id,
+            "name": target.name,
+            "path": os.path.relpath(target, base),
+            "type": "directory" if target.is_dir() and not target.is_symlink() else "file",
+            "trashed_at": now,
+            "purge_after": now + self.retention,
+        }
+        try:
+            os.rename(target, item_dir / target.name)
+        except OSError as e:
+            shutil.rmtree(item_dir, ignore_errors=True)
+            if e.errno == errno.EXDEV:
+                raise TrashError("Path is on a different filesystem from the site's trash", 409)
+            raise
+        self._write_record(trash_dir, record)
+        return record
+
+    @staticmethod
+    def _write_record(trash_dir: Path, record: dict) -> None:
+        path = trash_dir / f"{record['id']}.json"
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(record, f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read_record(trash_dir: Path, item_id: str) -> dict:
+        if not item_id.replace("-", "").isalnum():
+            raise TrashError("Trash item not found", 404)
+        try:
+            with open(trash_dir / f"{item_id}.json", "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise TrashError("Trash item not found", 404)
+
+    def list(self, site_root) -> List[dict]:
+        """Return the site's trashed items, newest first."""
+        trash_dir = self.trash_dir(site_root)
+        items = []
+        try:
+            names = os.listdir(trash_dir)
+        except OSError:
+            return items
+        for name in names:
+            if name.endswith(".json"):
+                try:
+                    items.append(self._read_record(trash_dir, name[:-5]))
+                except TrashError:
+                    continue
+        items.sort(key=lambda item: item["trashed_at"], reverse=True)
+        return items
+
+    def restore(self, site_root, base, item_id: str) -> dict:
+        """Move an item back to where it was deleted from."""
+        trash_dir = self.trash_dir(site_root)
+        with self._lock:
+            record = self._read_record(trash_dir, item_id)
+            if record.get("purging"):
+                raise TrashError("Item is already being purged", 409)
+            source = trash_dir / item_id / record["name"]
+            destination = Path(base).resolve() / record["path"]
+            if os.path.lexists(destination):
+                raise TrashError("A file already exists at the original path", 409)
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            os.rename(source, destination)
+            os.unlink(trash_dir / f"{item_id}.json")
+            shutil.rmtree(trash_dir / item_id, ignore_errors=True)
+        return record
+
+    def purge(self, site_root, item_id: str) -> None:
+        """End an item's restore window now; the purger removes it shortly."""
+        trash_dir = self.trash_dir(site_root)
+        with self._lock:
+            record = self._read_record(trash_dir, item_id)
+            record["purge_after"] = 0
+            self._write_record(trash_dir, record)
+        self._wake.set()
+
+    def _remove_tree(self, path: Path) -> None:
+        """Delete ``path`` bottom-up, at most ``rate`` entries per second."""
+        budget = self.rate
+        window_start = time.monotonic()
+
+        def tick():
+            nonlocal budget, window_start
+            budget -= 1
+            if budget <= 0:
+                elapsed = time.monotonic() - window_start
+                if elapsed < 1.0:
+                    time.sleep(1.0 - elapsed)
+                budget = self.rate
+                window_start = time.monotonic()
+
+        for root, dirs, files in os.walk(path, topdown=False):
+            for name in files:
+                try:
+                    os.unlink(os.path.join(root, name))
+                except FileNotFoundError:
+                    pass
+                tick()
+            for name in dirs:
+                full = os.path.join(root, name)
+                try:
+                    if os.path.islink(full):
+                        os.unlink(full)
+                    else:
+                        os.rmdir(full)
+                except FileNotFoundError:
+                    pass
+                tick()
+        try:
+            os.rmdir(path)
+        except FileNotFoundError:
+            pass
+
+    def purge_expired(self) -> int:
+        """Remove every item whose restore window has passed; returns how many."""
+        purged = 0
+        now = time.time()
+        for site_root in list(self._site_roots()):
+            trash_dir = self.trash_dir(site_root)
+            for record in self.list(site_root):
+                if record["purge_after"] > now:
+                    continue
+                with self._lock:
+                    # The listing was read without the lock; the item may have
+                    # been restored (or its window changed) since
+                    try:
+                        record = self._read_record(trash_dir, record["id"])
+                    except TrashError:
+                        continue
+                    if record["purge_after"] > now:
+                        continue
+                    # Restores check this flag, so nothing is restored half-deleted
+                    record["purging"] = True
+                    try:
+                        self._write_record(trash_dir, record)
+                    except OSError:
+                        continue
+                try:
+                    self._remove_tree(trash_dir / record["id"])
+                    os.unlink(trash_dir / f"{record['id']}.json")
+                    purged += 1
+                except OSError as e:
+                    print(f"Error purging trash item {record['id']} in {trash_dir}: {e}")
+        return purged
+
+    def _run(self) -> None:
+        _lower_thread_priority()
+        while True:
+            try:
+                self.purge_expired()
+            except Exception as e:
+                print(f"Error purging trash: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="trash-purger", daemon=True)
+            self._thread.start()
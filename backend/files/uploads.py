@@ -0,0 +1,235 @@
+"""Resumable chunked uploads for the site files API.
+
+A session is created with the target path and total size. The data file is
+a sparse temp file in the target's directory, preallocated to that size, so
+the final rename is atomic and on the same filesystem. Each chunk is read
+from the request stream and written at its offset with ``os.pwrite``; only
+the chunk in flight is buffered. Session state (including the committed
+offset) is kept in a small JSON file so uploads survive a restart.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import secrets
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional
+
+from .paths import resolve_site_path
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+DEFAULT_STATE_DIR = ROOT_DIR / ".cache" / "uploads"
+
+UPLOAD_STATE_DIR = Path(os.environ.get("UPLOAD_STATE_DIR", DEFAULT_STATE_DIR))
+
+# Suggested chunk size; must stay below the app's MAX_CONTENT_LENGTH
+CHUNK_SIZE = 8 * 1024 * 1024
+COPY_BUFFER = 1024 * 1024
+
+# Sessions untouched for this long are discarded with their temp file
+SESSION_TTL = 24 * 60 * 60
+
+CHECKSUM_ALGORITHMS = ("sha256", "sha1", "md5")
+
+
+class UploadError(Exception):
+    """Raised when an upload request can't be applied; carries an HTTP status."""
+
+    def __init__(self, message: str, status: int = 400, offset: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class UploadManager:
+    """Creates, appends to and finalizes chunked upload sessions."""
+
+    def __init__(self, state_dir: Path = UPLOAD_STATE_DIR, ttl: float = SESSION_TTL):
+        self.state_dir = Path(state_dir)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # One lock per session so chunks for the same upload are applied in order
+        self._session_locks: Dict[str, threading.Lock] = {}
+
+    def _state_path(self, upload_id: str) -> Path:
+        if not upload_id.isalnum():
+            raise UploadError("Upload not found", 404)
+        return self.state_dir / f"{upload_id}.json"
+
+    def _session_lock(self, upload_id: str) -> threading.Lock:
+        with self._lock:
+            return self._session_locks.setdefault(upload_id, threading.Lock())
+
+    def _load(self, upload_id: str, domain: str) -> dict:
+        try:
+            with open(self._state_path(upload_id), "r") as f:
+                session = json.load(f)
+        except (OSError, ValueError):
+            raise UploadError("Upload not found", 404)
+        if session.get("domain") != domain:
+            raise UploadError("Upload not found", 404)
+        return session
+
+    def _save(self, session: dict) -> None:
+        session["updated_at"] = time.time()
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        path = self._state_path(session["id"])
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(session, f)
+        os.replace(tmp_path, path)
+
+    def _discard(self, session: dict) -> None:
+        for path in (session.get("temp_path"), str(self._state_path(session["id"]))):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        with self._lock:
+            self._session_locks.pop(session["id"], None)
+
+    def cleanup(self) -> int:
+        """Remove expired sessions and their temp files; returns how many."""
+        removed = 0
+        now = time.time()
+        try:
+            names = os.listdir(self.state_dir)
+        except OSError:
+            return 0
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(self.state_dir / name, "r") as f:
+                    session = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if now - session.get("updated_at", 0) > self.ttl:
+                self._discard(session)
+                removed += 1
+        return removed
+
+    @staticmethod
+    def status(session: dict) -> dict:
+        return {
+            "upload_id": session["id"],
+            "path": session["path"],
+            "size": session["size"],
+            "offset": session["offset"],
+            "complete": session["offset"] >= session["size"],
+            "chunk_size": CHUNK_SIZE,
+        }
+
+    def create(self, domain: str, base_path, rel_path: str, size: int, overwrite: bool = False) -> dict:
+        """Start a session for ``rel_path`` (relative to ``base_path``)."""
+        if size < 0:
+            raise UploadError("Size must not be negative")
+        target = resolve_site_path(base_path, rel_path)
+        if target == Path(base_path).resolve() or target.is_dir():
+            raise UploadError("Target is a directory")
+        if target.exists() and not overwrite:
+            raise UploadError("File already exists", 409)
+
+        self.cleanup()
+        target.parent.mkdir(parents=True, exist_ok=True)
+        upload_id = secrets.token_hex(16)
+        temp_path = target.parent / f".{target.name}.upload-{upload_id}"
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            # Sparse: blocks are only allocated as chunks arrive
+            os.ftruncate(fd, size)
+        finally:
+            os.close(fd)
+
+        session = {
+            "id": upload_id,
+            "domain": domain,
+            "path": os.path.relpath(target, Path(base_path).resolve()),
+            "target_path": str(target),
+            "temp_path": str(temp_path),
+            "size": size,
+            "offset": 0,
+            "overwrite": overwrite,
+            "created_at": time.time(),
+        }
+        self._save(session)
+        return self.status(session)
+
+    def get(self, domain: str, upload_id: str) -> dict:
+        return self.status(self._load(upload_id, domain))
+
+    def write_chunk(self, domain: str, upload_id: str, offset: int, stream: BinaryIO,
+                    length: Optional[int] = None) -> dict:
+        """Append the bytes in ``stream`` at ``offset``, which must be the committed offset.
+
+        A mismatched offset raises ``UploadError`` (409) carrying the
+        committed offset, so the client can resume from there.
+        """
+        with self._session_lock(upload_id):
+            session = self._load(upload_id, domain)
+            if offset != session["offset"]:
+                raise UploadError("Offset does not match committed offset", 409, session["offset"])
+            remaining = session["size"] - offset
+            if length is not None and length > remaining:
+                raise UploadError("Chunk extends past the declared size", 413, session["offset"])
+
+            fd = os.open(session["temp_path"], os.O_WRONLY)
+            position = offset
+            try:
+                while True:
+                    data = stream.read(COPY_BUFFER)
+                    if not data:
+                        break
+                    if position + len(data) > session["size"]:
+                        raise UploadError("Chunk extends past the declared size", 413, session["offset"])
+                    view = memoryview(data)
+                    while view:
+                        written = os.pwrite(fd, view, position)
+                        position += written
+                        view = view[written:]
+                # The offset is only advanced once the data is on disk
+                os.fdatasync(fd)
+            except OSError:
+                raise UploadError("Failed to write chunk", 500, session["offset"])
+            finally:
+                os.close(fd)
+
+            session["offset"] = position
+            self._save(session)
+            return self.status(session)
+
+    def complete(self, domain: str, upload_id: str, checksum: Optional[str] = None,
+                 algorithm: str = "sha256") -> dict:
+        """Verify the checksum and atomically move the file into place."""
+        with self._session_lock(upload_id):
+            session = self._load(upload_id, domain)
+            if session["offset"] != session["size"]:
+                raise UploadError("Upload is incomplete", 409, session["offset"])
+
+            digest = None
+            if checksum:
+                if algorithm not in CHECKSUM_ALGORITHMS:
+                    raise UploadError(f"Unsupported checksum algorithm: {algorithm}")
+                hasher = hashlib.new(algorithm)
+                with open(session["temp_path"], "rb") as f:
+                    for block in iter(lambda: f.read(COPY_BUFFER), b""):
+                        hasher.update(block)
+                digest = hasher.hexdigest()
+                if digest != checksum.strip().lower():
+                    raise UploadError("Checksum mismatch", 422, session["offset"])
+
+            target = Path(session["target_path"])
+            if target.exists() and not session.get("overwrite"):
+                raise UploadError("File already exists", 409)
+            os.replace(session["temp_path"], target)
+            self._discard(session)
+            return {"path": session["path"], "size": session["size"], "checksum": digest,
+                    "algorithm": algorithm if digest else None}
+
+    def abort(self, domain: str, upload_id: str) -> None:
+        with self._session_lock(upload_id):
+            self._discard(self._load(upload_id, domain))
@@ -0,0 +1,323 @@
+"""Change notifications for directories open in the file manager.
+
+One watcher thread serves every subscriber. On Linux it uses inotify
+through ctypes, with one watch per directory shared by all clients viewing
+it; elsewhere (or when inotify is unavailable) it falls back to comparing
+``scandir`` snapshots. Events are coalesced per entry over a short window,
+then delivered as ``created``/``modified``/``deleted`` with the entry in the
+same format as directory listings. A subscriber that falls too far behind,
+or a kernel queue overflow, gets a single ``resync`` event instead. A
+watched directory that is deleted and recreated is watched again when its
+(watched) parent reports the new directory.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Set, Tuple
+
+from .listing import describe_path
+
+# Pending events are coalesced and flushed this often
+FLUSH_INTERVAL = 0.25
+# Snapshot interval when inotify isn't available
+POLL_INTERVAL = 2.0
+
+MAX_WATCHED_DIRS = 256
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class WatchLimitError(Exception):
+    """Raised when no more directories can be watched."""
+
+
+def _load_inotify():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        init = libc.inotify_init1
+        add = libc.inotify_add_watch
+        rm = libc.inotify_rm_watch
+    except (OSError, AttributeError):
+        return None
+    init.argtypes = [ctypes.c_int]
+    add.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    rm.argtypes = [ctypes.c_int, ctypes.c_int]
+    return init, add, rm
+
+
+class Subscription:
+    """One client's view of one directory; events arrive on ``queue``."""
+
+    def __init__(self, watcher: "DirectoryWatcher", directory: str, base: Path):
+        self.watcher = watcher
+        self.directory = directory
+        self.base = base
+        self.queue: "queue.Queue[dict]" = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def deliver(self, event: dict) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # Too far behind to patch incrementally; tell the client to re-list
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.queue.put_nowait({"event": "resync", "reason": "too many changes"})
+
+    def get(self, timeout: float) -> Optional[dict]:
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self) -> None:
+        self.watcher.unsubscribe(self)
+
+
+class DirectoryWatcher:
+    """Shares one inotify instance (or poller) across all subscribers."""
+
+    def __init__(self, use_inotify: bool = True):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._wd_to_dir: Dict[int, str] = {}
+        self._dir_to_wd: Dict[str, int] = {}
+        # directory -> {name: created_seen}
+        self._pending: Dict[str, Dict[str, bool]] = {}
+        self._snapshots: Dict[str, Dict[str, Tuple[int, int]]] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._fd = -1
+        self._inotify = _load_inotify() if use_inotify else None
+        if self._inotify:
+            fd = self._inotify[0](IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                self._inotify = None
+            else:
+                self._fd = fd
+
+    @property
+    def backend(self) -> str:
+        return "inotify" if self._inotify else "polling"
+
+    def _start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            target = self._run_inotify if self._inotify else self._run_polling
+            self._thread = threading.Thread(target=target, name="file-watcher", daemon=True)
+            self._thread.start()
+
+    def subscribe(self, directory, base) -> Subscription:
+        """Start receiving events for ``directory``; raises ``WatchLimitError`` or ``OSError``."""
+        directory = str(directory)
+        subscription = Subscription(self, directory, Path(base))
+        with self._lock:
+            if directory not in self._subscribers:
+                if len(self._subscribers) >= MAX_WATCHED_DIRS:
+                    raise WatchLimitError("Too many directories are being watched")
+                if self._inotify:
+                    self._add_watch(directory)
+                else:
+                    self._snapshots[directory] = self._snapshot(directory)
+                self._subscribers[directory] = set()
+            self._subscribers[directory].add(subscription)
+            self._start()
+        return subscription
+
+    def _add_watch(self, directory: str) -> None:
+        """Add the inotify watch for ``directory``; caller holds ``_lock``."""
+        wd = self._inotify[1](self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), directory)
+        self._wd_to_dir[wd] = directory
+        self._dir_to_wd[directory] = wd
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.directory)
+            if subscribers is None:
+                return
+            subscribers.discard(subscription)
+            if subscribers:
+                return
+            del self._subscribers[subscription.directory]
+            self._pending.pop(subscription.directory, None)
+            self._snapshots.pop(subscription.directory, None)
+            wd = self._dir_to_wd.pop(subscription.directory, None)
+            if wd is not None:
+                self._wd_to_dir.pop(wd, None)
+                self._inotify[2](self._fd, wd)
+
+    def _broadcast(self, directory: str, make_event) -> None:
+        """Deliver ``make_event(subscription)`` to the directory's subscribers; caller holds ``_lock``."""
+        for subscription in list(self._subscribers.get(directory, ())):
+            subscription.deliver(make_event(subscription))
+
+    def _flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            for directory, names in pending.items():
+                for name, created in names.items():
+                    path = os.path.join(directory, name)
+                    try:
+                        entry = describe_path(path, Path(directory))
+                        kind = "created" if created else "modified"
+                    except OSError:
+                        entry, kind = None, "deleted"
+
+                    def make_event(subscription, name=name, path=path, entry=entry, kind=kind):
+                        event = {"event": kind, "name": name,
+                                 "path": os.path.relpath(path, subscription.base)}
+                        if entry is not None:
+                            event["entry"] = dict(entry, path=event["path"])
+                        return event
+
+                    self._broadcast(directory, make_event)
+
+    def _run_inotify(self) -> None:
+        next_flush = 0.0
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            timeout = FLUSH_INTERVAL if self._pending else 1.0
+            readable, _, _ = select.select([self._fd], [], [], timeout)
+            if readable:
+                try:
+                    data = os.read(self._fd, 64 * 1024)
+                except BlockingIOError:
+                    data = b""
+                self._handle_inotify(data)
+            now = time.monotonic()
+            if self._pending and now >= next_flush:
+                self._flush()
+                next_flush = now + FLUSH_INTERVAL
+
+    def _handle_inotify(self, data: bytes) -> None:
+        offset = 0
+        with self._lock:
+            while offset + _EVENT_HEADER.size <= len(data):
+                wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+
+                if mask & IN_Q_OVERFLOW:
+                    for directory in self._subscribers:
+                        self._broadcast(directory, lambda s: {"event": "resync", "reason": "overflow"})
+                    continue
+                directory = self._wd_to_dir.get(wd)
+                if directory is None:
+                    continue
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    self._broadcast(directory, lambda s: {"event": "gone"})
+                    continue
+                if mask & IN_IGNORED:
+                    # The kernel dropped the watch (directory deleted or unmounted)
+                    del self._wd_to_dir[wd]
+                    if self._dir_to_wd.get(directory) == wd:
+                        del self._dir_to_wd[directory]
+                    continue
+                if not name:
+                    continue
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    self._rewatch(os.path.join(directory, name))
+                names = self._pending.setdefault(directory, {})
+                names[name] = names.get(name, False) or bool(mask & (IN_CREATE | IN_MOVED_TO))
+
+    def _rewatch(self, directory: str) -> None:
+        """Watch a subscribed directory again after it was recreated; caller holds ``_lock``."""
+        if directory not in self._subscribers or directory in self._dir_to_wd:
+            return
+        try:
+            self._add_watch(directory)
+        except OSError:
+            return
+        # Whatever the clients listed belonged to the old directory
+        self._broadcast(directory, lambda s: {"event": "resync", "reason": "recreated"})
+
+    @staticmethod
+    def _snapshot(directory: str) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                snapshot[entry.name] = (st.st_mtime_ns, st.st_size)
+        return snapshot
+
+    def _run_polling(self) -> None:
+        while True:
+            time.sleep(POLL_INTERVAL)
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+                directories = list(self._subscribers)
+            for directory in directories:
+                try:
+                    current = self._snapshot(directory)
+                except OSError:
+                    with self._lock:
+                        self._broadcast(directory, lambda s: {"event": "gone"})
+                    continue
+                with self._lock:
+                    previous = self._snapshots.get(directory)
+                    if previous is None:
+                        continue
+                    self._snapshots[directory] = current
+                    names = self._pending.setdefault(directory, {})
+                    for name, signature in current.items():
+                        if name not in previous:
+                            names[name] = True
+                        elif previous[name] != signature:
+                            names.setdefault(name, False)
+                    for name in previous.keys() - current.keys():
+                        names.setdefault(name, False)
+            self._flush()
+
+
+_watcher: Optional[DirectoryWatcher] = None
+_watcher_lock = threading.Lock()
+
+
+def get_directory_watcher() -> DirectoryWatcher:
+    """Return the process-wide watcher, creating it on first use."""
+    global _watcher
+    with _watcher_lock:
+        if _watcher is None:
+            _watcher = DirectoryWatcher()
+        return _watcher
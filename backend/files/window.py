@@ -0,0 +1,247 @@
+"""Windowed reads of large text files for the file viewer.
+
+Byte windows are one ``seek`` plus one read, trimmed to whole lines. Line
+windows use a sparse line index: while scanning the file once, the first
+line starting in every ``CHECKPOINT_BYTES`` block is recorded as
+``(line_number, offset)``, so any line is at most one block's read away from
+a checkpoint. Indexes are cached per file and extended, not rebuilt, when a
+log file only grows. Tail windows read backwards from the end and need no
+index at all.
+"""
+
+from __future__ import annotations
+
+import bisect
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+WINDOW_BYTES = 64 * 1024
+MAX_WINDOW_BYTES = 1024 * 1024
+MAX_LINES = 5000
+CHECKPOINT_BYTES = 64 * 1024
+MAX_CACHED_INDEXES = 32
+
+ENCODING = "utf-8"
+
+
+def _decode(data: bytes) -> str:
+    return data.decode(ENCODING, errors="ignore")
+
+
+class LineIndex:
+    """Sparse map from line numbers to byte offsets for one file."""
+
+    __slots__ = ("path", "ino", "mtime_ns", "size", "lines", "checkpoint_lines", "checkpoint_offsets",
+                 "_ends_with_newline")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.ino = None
+        self.mtime_ns = None
+        self.size = 0
+        # Newlines seen so far; line N (0-based) starts after the Nth newline
+        self.lines = 0
+        self.checkpoint_lines: List[int] = [0]
+        self.checkpoint_offsets: List[int] = [0]
+        self._ends_with_newline = True
+
+    @property
+    def total_lines(self) -> int:
+        return self.lines + (0 if self._ends_with_newline else 1)
+
+    def matches(self, st: os.stat_result) -> bool:
+        return st.st_ino == self.ino and st.st_mtime_ns == self.mtime_ns and st.st_size == self.size
+
+    def _can_extend(self, st: os.stat_result) -> bool:
+        """True if the file looks appended to since it was indexed."""
+        if self.ino is None or st.st_ino != self.ino or st.st_size <= self.size:
+            return False
+        offset = self.checkpoint_offsets[-1]
+        if offset == 0:
+            return True
+        # Cheap sanity check that the indexed prefix wasn't rewritten
+        with open(self.path, "rb") as f:
+            f.seek(offset - 1)
+            return f.read(1) == b"\n"
+
+    def build(self, st: os.stat_result) -> None:
+        """Index the file, continuing from the previous end if it only grew."""
+        if not self._can_extend(st):
+            self.size = 0
+            self.lines = 0
+            self.checkpoint_lines = [0]
+            self.checkpoint_offsets = [0]
+            self._ends_with_newline = True
+
+        pos = self.size
+        with open(self.path, "rb") as f:
+            f.seek(pos)
+            while True:
+                block_start = pos - pos % CHECKPOINT_BYTES
+                data = f.read(block_start + CHECKPOINT_BYTES - pos)
+                if not data:
+                    break
+                # One checkpoint per block: the first line starting inside it
+                if self.checkpoint_offsets[-1] <= block_start:
+                    first = data.find(b"\n")
+                    if first != -1:
+                        self.checkpoint_lines.append(self.lines + 1)
+                        self.checkpoint_offsets.append(pos + first + 1)
+                self.lines += data.count(b"\n")
+                self._ends_with_newline = data.endswith(b"\n")
+                pos += len(data)
+
+        self.ino = st.st_ino
+        self.mtime_ns = st.st_mtime_ns
+        self.size = pos
+
+    def seek_point(self, line: int) -> Tuple[int, int]:
+        """Return the closest ``(line_number, offset)`` checkpoint at or before ``line``."""
+        i = bisect.bisect_right(self.checkpoint_lines, line) - 1
+        return self.checkpoint_lines[i], self.checkpoint_offsets[i]
+
+
+_indexes: "OrderedDict[str, LineIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+_build_locks: Dict[str, threading.Lock] = {}
+
+
+def get_line_index(path: str, st: Optional[os.stat_result] = None) -> LineIndex:
+    """Return an up-to-date index for ``path``, building it on first access."""
+    path = str(path)
+    st = st or os.stat(path)
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = LineIndex(path)
+            _indexes[path] = index
+        _indexes.move_to_end(path)
+        while len(_indexes) > MAX_CACHED_INDEXES:
+            evicted, _ = _indexes.popitem(last=False)
+            _build_locks.pop(evicted, None)
+        build_lock = _build_locks.setdefault(path, threading.Lock())
+    with build_lock:
+        if not index.matches(st):
+            index.build(st)
+    return index
+
+
+def _window(content: bytes, **fields) -> dict:
+    result = {"content": _decode(content), "bytes": len(content)}
+    result.update(fields)
+    return result
+
+
+def read_bytes(path: str, offset: int = 0, length: int = WINDOW_BYTES) -> dict:
+    """Read ``length`` bytes at ``offset``, trimmed to whole lines.
+
+    A partial first line is dropped unless ``offset`` is 0, and a partial last
+    line unless the window reaches EOF. A window holding no complete line is
+    returned as is.
+    """
+    size = os.stat(path).st_size
+    offset = max(0, min(offset, size))
+    length = max(1, min(length, MAX_WINDOW_BYTES))
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(length)
+
+    start, end = 0, len(data)
+    if offset > 0:
+        first = data.find(b"\n")
+        if first != -1 and first + 1 < len(data):
+            start = first + 1
+    if offset + end < size:
+        last = data.rfind(b"\n", start)
+        if last != -1:
+            end = last + 1
+    return _window(data[start:end], size=size, offset=offset + start, end=offset + end,
+                   eof=offset + end >= size)
+
+
+def read_lines(path: str, start_line: int = 0, count: int = 100) -> dict:
+    """Read ``count`` lines starting at 0-based ``start_line``."""
+    st = os.stat(path)
+    index = get_line_index(path, st)
+    start_line = max(0, start_line)
+    count = max(1, min(count, MAX_LINES))
+    line, pos = index.seek_point(start_line)
+
+    collected = bytearray()
+    start_offset = None
+    with open(path, "rb") as f:
+        f.seek(pos)
+        buffer = b""
+        while True:
+            block = f.read(CHECKPOINT_BYTES)
+            buffer += block
+            # Skip lines before the window
+            skip = 0
+            while line < start_line:
+                nl = buffer.find(b"\n", skip)
+                if nl == -1:
+                    break
+                skip = nl + 1
+                line += 1
+            pos += skip
+            buffer = buffer[skip:]
+            if line >= start_line:
+                if start_offset is None:
+                    start_offset = pos
+                collected += buffer
+                pos += len(buffer)
+                buffer = b""
+                if collected.count(b"\n") >= count or len(collected) >= MAX_WINDOW_BYTES:
+                    break
+            if not block:
+                break
+
+    if start_offset is None:
+        start_offset = pos
+    # Cut at the requested line count
+    end = 0
+    for _ in range(count):
+        nl = collected.find(b"\n", end)
+        if nl == -1:
+            end = len(collected)
+            break
+        end = nl + 1
+    content = bytes(collected[:min(end, MAX_WINDOW_BYTES)])
+    returned = content.count(b"\n") + (1 if content and not content.endswith(b"\n") else 0)
+    return _window(content, size=st.st_size, offset=start_offset, end=start_offset + len(content),
+                   start_line=start_line, line_count=returned, total_lines=index.total_lines,
+                   eof=start_offset + len(content) >= st.st_size)
+
+
+def read_tail(path: str, count: int = 100) -> dict:
+    """Read the last ``count`` lines by scanning backwards from EOF."""
+    size = os.stat(path).st_size
+    count = max(1, min(count, MAX_LINES))
+    data = b""
+    pos = size
+    with open(path, "rb") as f:
+        while pos > 0 and len(data) < MAX_WINDOW_BYTES:
+            step = min(CHECKPOINT_BYTES, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+            # A trailing newline ends the last line rather than starting a new one
+            if data.count(b"\n", 0, len(data) - 1) >= count:
+                break
+
+    body = data[:-1] if data.endswith(b"\n") else data
+    cut = len(body)
+    for _ in range(count):
+        cut = body.rfind(b"\n", 0, cut)
+        if cut == -1:
+            break
+    start = cut + 1 if cut != -1 else 0
+    if cut == -1 and pos > 0:
+        # Window filled before enough lines were found; drop the partial first line
+        first = data.find(b"\n")
+        start = first + 1 if first != -1 else 0
+    content = data[start:]
+    returned = content.count(b"\n") + (1 if content and not content.endswith(b"\n") else 0)
+    return _window(content, size=size, offset=pos + start, end=size, line_count=returned, eof=True)
@@ -3,26 +3,36 @@
 from __future__ import annotations
 
 import logging
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
 
 import requests
 
 from backend.mail.exceptions import MailServiceError
 from backend.mail.models import Domain
 
-from app import get_cloudflare_headers, log_cloudflare_email_event  # type: ignore
-
 CF_API_BASE = "https://api.cloudflare.com/client/v4"
 logger = logging.getLogger(__name__)
 
+# Set by the app with configure(); importing app here would load it twice
+_get_headers: Optional[Callable[[], Optional[dict]]] = None
+_log_event: Optional[Callable[..., None]] = None
+
+
+def configure(get_headers: Callable[[], Optional[dict]], log_event: Optional[Callable[..., None]] = None) -> None:
+    """Register the app's Cloudflare credentials lookup and event logger."""
+    global _get_headers, _log_event
+    _get_headers = get_headers
+    _log_event = log_event
+
 
 def _request(method: str, path: str, *, params=None, json=None):
-    headers = get_cloudflare_headers()
+    headers = _get_headers() if _get_headers is not None else None
     if not headers:
         raise MailServiceError("Cloudflare API not configured")
     url = f"{CF_API_BASE}{path}"
     response = requests.request(method, url, headers=headers, params=params, json=json, timeout=30)
-    log_cloudflare_email_event('cloudflare_api', info=f"{method} {path}", status=response.status_code)
+    if _log_event is not None:
+        _log_event('cloudflare_api', info=f"{method} {path}", status=response.status_code)
     if response.status_code >= 400:
         raise MailServiceError(response.text)
     data = response.json()
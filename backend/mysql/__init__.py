@@ -0,0 +1,34 @@
+"""MySQL helpers shared by the site and database manager routes."""
+
+from .browse import browse_table
+from .export import MAX_RESULT_ROWS, MAX_STREAM_ROWS, StreamedQuery, release_stream, reserve_stream
+from .pool import ConnectionPool, PoolTimeout, get_connection_pool, open_unpooled_connection
+from .result_cache import QueryResultCache, get_query_cache, normalize_sql, referenced_tables
+from .running import (
+    EXPORT_TIMEOUT, MAX_QUERY_TIMEOUT, QUERY_TIMEOUT, QueryRegistry, get_query_registry, limit_execution_time
+)
+from .stats import collect_db_stats
+
+__all__ = [
+    "EXPORT_TIMEOUT",
+    "MAX_QUERY_TIMEOUT",
+    "MAX_RESULT_ROWS",
+    "MAX_STREAM_ROWS",
+    "QUERY_TIMEOUT",
+    "ConnectionPool",
+    "PoolTimeout",
+    "QueryRegistry",
+    "QueryResultCache",
+    "StreamedQuery",
+    "browse_table",
+    "collect_db_stats",
+    "get_connection_pool",
+    "get_query_cache",
+    "get_query_registry",
+    "limit_execution_time",
+    "normalize_sql",
+    "open_unpooled_connection",
+    "referenced_tables",
+    "release_stream",
+    "reserve_stream",
+]
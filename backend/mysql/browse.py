@@ -0,0 +1,197 @@
+"""Paged table reads for the database browser.
+
+Pages are fetched by seeking on the table's primary key (or its first
+unique index over NOT NULL columns) rather than ``LIMIT .. OFFSET``, so
+any page costs one index range read no matter how deep it is. The total
+comes from ``information_schema.TABLES.TABLE_ROWS`` (an InnoDB estimate)
+unless an exact ``COUNT(*)`` is asked for. Tables without a usable key
+fall back to offset paging.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+from typing import List, Optional, Sequence
+
+MAX_PER_PAGE = 1000
+
+COLUMNS_QUERY = """
+    SELECT COLUMN_NAME AS name, IS_NULLABLE AS nullable
+    FROM information_schema.COLUMNS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    ORDER BY ORDINAL_POSITION
+"""
+
+UNIQUE_INDEXES_QUERY = """
+    SELECT INDEX_NAME AS index_name, COLUMN_NAME AS column_name, SUB_PART AS sub_part
+    FROM information_schema.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND NON_UNIQUE = 0
+    ORDER BY INDEX_NAME = 'PRIMARY' DESC, INDEX_NAME, SEQ_IN_INDEX
+"""
+
+ROW_ESTIMATE_QUERY = """
+    SELECT TABLE_ROWS AS table_rows
+    FROM information_schema.TABLES
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+"""
+
+
+def quote_identifier(name: str) -> str:
+    return "`" + name.replace("`", "``") + "`"
+
+
+def _encode_value(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (bytes, bytearray)):
+        return {"hex": bytes(value).hex()}
+    # datetime, date, Decimal, ...: MySQL compares their string forms correctly
+    return str(value)
+
+
+def _encode_cursor(values: Sequence) -> str:
+    raw = json.dumps([_encode_value(v) for v in values], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str, width: int) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, binascii.Error):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != width:
+        raise ValueError("Invalid cursor")
+    try:
+        return [bytes.fromhex(v["hex"]) if isinstance(v, dict) else v for v in values]
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+
+def table_key(cursor, table: str, nullable: Optional[dict] = None) -> Optional[List[str]]:
+    """Columns of the primary key, else of the first unique index over NOT NULL
+    columns (a NULL breaks the seek comparison), or ``None``."""
+    if nullable is None:
+        cursor.execute(COLUMNS_QUERY, (table,))
+        nullable = {row["name"]: row["nullable"] == "YES" for row in cursor.fetchall()}
+    cursor.execute(UNIQUE_INDEXES_QUERY, (table,))
+    indexes = {}
+    for row in cursor.fetchall():
+        indexes.setdefault(row["index_name"], []).append(row)
+    for rows in indexes.values():
+        # A prefix index can't return rows in full-column order
+        if any(row["sub_part"] is not None or nullable.get(row["column_name"], True) for row in rows):
+            continue
+        return [row["column_name"] for row in rows]
+    return None
+
+
+def _escaped(name: str) -> str:
+    """Quoted identifier safe to embed in a query that is %-formatted with parameters."""
+    return quote_identifier(name).replace("%", "%%")
+
+
+def _seek_predicate(key: List[str], op: str) -> str:
+    """``(a, b) > (%s, %s)`` expanded to ORs, which every MySQL/MariaDB version can range-scan."""
+    terms = []
+    for i, column in enumerate(key):
+        equal = [f"{_escaped(c)} = %s" for c in key[:i]]
+        terms.append("(" + " AND ".join(equal + [f"{_escaped(column)} {op} %s"]) + ")")
+    return " OR ".join(terms)
+
+
+def _seek_params(values: list) -> list:
+    params = []
+    for i in range(len(values)):
+        params.extend(values[:i + 1])
+    return params
+
+
+def browse_table(cursor, table: str, per_page: int = 50, after: Optional[str] = None,
+                 before: Optional[str] = None, page: int = 1, exact_count: bool = False) -> dict:
+    """Return one page of ``table`` as ``{'columns', 'rows', 'total', ...}``.
+
+    ``after``/``before`` are cursors from a previous response's
+    ``next_cursor``/``prev_cursor``. ``page`` is only used (as an offset)
+    when there is no cursor, so page 1 is always a key seek. Raises
+    ``LookupError`` for an unknown table and ``ValueError`` for a bad cursor.
+    """
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+    page = max(1, page)
+
+    cursor.execute(COLUMNS_QUERY, (table,))
+    column_rows = cursor.fetchall()
+    if not column_rows:
+        raise LookupError(f"Table {table} not found")
+    columns = [row["name"] for row in column_rows]
+    key = table_key(cursor, table, {row["name"]: row["nullable"] == "YES" for row in column_rows})
+
+    if exact_count:
+        cursor.execute(f"SELECT COUNT(*) AS count FROM {quote_identifier(table)}")
+        total = int(cursor.fetchone()["count"])
+    else:
+        cursor.execute(ROW_ESTIMATE_QUERY, (table,))
+        row = cursor.fetchone()
+        total = int(row["table_rows"] or 0) if row else 0
+
+    result = {
+        "columns": columns,
+        "total": total,
+        "total_exact": exact_count,
+        "per_page": per_page,
+        "key": key,
+        "next_cursor": None,
+        "prev_cursor": None,
+    }
+
+    if key is None or (page > 1 and not after and not before):
+        if after or before:
+            raise ValueError("Table has no unique key to page by cursor")
+        order = ", ".join(quote_identifier(c) for c in key) if key else None
+        cursor.execute(
+            f"SELECT * FROM {quote_identifier(table)}"
+            + (f" ORDER BY {order}" if order else "")
+            + f" LIMIT {per_page + 1} OFFSET {(page - 1) * per_page}"
+        )
+        rows = cursor.fetchall()
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        if key and rows:
+            result["next_cursor"] = _encode_cursor([rows[-1][c] for c in key]) if has_more else None
+            result["prev_cursor"] = _encode_cursor([rows[0][c] for c in key]) if page > 1 else None
+        result.update(rows=rows, page=page, has_more=has_more)
+        return result
+
+    backward = bool(before) and not after
+    direction = "DESC" if backward else "ASC"
+    order = ", ".join(f"{_escaped(c)} {direction}" for c in key)
+    sql = f"SELECT * FROM {_escaped(table)}"
+    # Always formatted (even with no parameters) so the %% escaping holds
+    params: list = []
+    if after or before:
+        values = _decode_cursor(after or before, len(key))
+        sql += f" WHERE {_seek_predicate(key, '<' if backward else '>')}"
+        params = _seek_params(values)
+    sql += f" ORDER BY {order} LIMIT {per_page + 1}"
+    cursor.execute(sql, params)
+    rows = list(cursor.fetchall())
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backward:
+        rows.reverse()
+
+    if rows:
+        first = _encode_cursor([rows[0][c] for c in key])
+        last = _encode_cursor([rows[-1][c] for c in key])
+        if backward:
+            result["prev_cursor"] = first if has_more else None
+            result["next_cursor"] = last
+        else:
+            result["prev_cursor"] = first if after else None
+            result["next_cursor"] = last if has_more else None
+    elif backward:
+        result["next_cursor"] = before
+    result.update(rows=rows, page=None if after or before else 1, has_more=has_more)
+    return result
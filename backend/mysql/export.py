@@ -0,0 +1,240 @@
+"""Unbuffered query results for the SQL console and exports.
+
+Queries run on an ``SSCursor``, so rows are read off the socket in batches
+as they are written out instead of being buffered in full on the client.
+Output stops at a row cap and a byte cap. A result stopped early can't be
+handed back to the pool (the server would still be sending its remaining
+rows), so that connection is closed instead of drained.
+
+Streamed exports can run for minutes, so they use unpooled connections and
+are capped per site with ``reserve_stream``; otherwise a few downloads would
+hold every pooled connection the site's pages and console need.
+"""
+
+from __future__ import annotations
+
+import base64
+import csv
+import datetime
+import decimal
+import io
+import json
+import os
+import threading
+from typing import Callable, Dict, Iterator, List, Optional
+
+import pymysql
+
+from .pool import PooledConnection
+
+FETCH_BATCH = 500
+# Output is yielded in chunks of roughly this size
+CHUNK_BYTES = 64 * 1024
+
+MAX_STREAM_ROWS = int(os.environ.get("SQL_EXPORT_MAX_ROWS", 1_000_000))
+MAX_STREAM_BYTES = int(os.environ.get("SQL_EXPORT_MAX_BYTES", 256 * 1024 * 1024))
+# Rows returned inline by the JSON (non-streaming) query mode
+MAX_RESULT_ROWS = int(os.environ.get("SQL_QUERY_MAX_ROWS", 10000))
+# Concurrent streamed exports per site
+MAX_STREAMS_PER_SITE = int(os.environ.get("SQL_EXPORT_MAX_PER_SITE", 2))
+
+_active_streams: Dict[str, int] = {}
+_streams_lock = threading.Lock()
+
+
+def reserve_stream(key: str) -> bool:
+    """Take one of ``key``'s export slots; ``False`` if all are in use."""
+    with _streams_lock:
+        if _active_streams.get(key, 0) >= MAX_STREAMS_PER_SITE:
+            return False
+        _active_streams[key] = _active_streams.get(key, 0) + 1
+        return True
+
+
+def release_stream(key: str) -> None:
+    with _streams_lock:
+        remaining = _active_streams.get(key, 0) - 1
+        if remaining > 0:
+            _active_streams[key] = remaining
+        else:
+            _active_streams.pop(key, None)
+
+
+def _column_names(cursor) -> List[str]:
+    """Result column names; a repeated name gets its table prefix, as DictCursor does."""
+    result = getattr(cursor, "_result", None)
+    fields = getattr(result, "fields", None)
+    if not fields:
+        return [column[0] for column in cursor.description or ()]
+    names: List[str] = []
+    for field in fields:
+        name = field.name
+        if name in names:
+            name = f"{field.table_name}.{name}"
+        names.append(name)
+    return names
+
+
+def _json_default(value):
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        try:
+            return bytes(value).decode("utf-8")
+        except UnicodeDecodeError:
+            return "base64:" + base64.b64encode(value).decode("ascii")
+    if isinstance(value, set):
+        return sorted(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (bytes, bytearray, datetime.date, datetime.time, datetime.timedelta, set)):
+        return _json_default(value)
+    return value
+
+
+class StreamedQuery:
+    """Executes ``query`` unbuffered; iterate ``ndjson()``/``csv()`` or call ``fetch()`` once.
+
+    The connection is released when the output ends, or when the generator
+    is closed early (client disconnect); ``on_close`` runs just before that.
+    """
+
+    def __init__(self, connection, query: str, max_rows: int = MAX_STREAM_ROWS,
+                 max_bytes: int = MAX_STREAM_BYTES, on_close: Optional[Callable[[], None]] = None):
+        self.connection = connection
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.on_close = on_close
+        self.row_count = 0
+        self.byte_count = 0
+        self.truncated: Optional[str] = None
+        self.error: Optional[str] = None
+        self._drained = False
+        self._cursor = connection.cursor(pymysql.cursors.SSCursor)
+        try:
+            self._cursor.execute(query)
+        except Exception:
+            # No result is pending, so the connection can go back to the pool
+            self._drained = True
+            self.close()
+            raise
+        self.columns: List[str] = _column_names(self._cursor)
+
+    def close(self) -> None:
+        """Release the connection; discarded if the result wasn't read to the end."""
+        if self.connection is None:
+            return
+        connection, self.connection = self.connection, None
+        if self.on_close is not None:
+            self.on_close()
+        if self._drained:
+            try:
+                self._cursor.close()
+            except Exception:
+                self._drained = False
+        if isinstance(connection, PooledConnection):
+            connection.close(discard=not self._drained)
+        else:
+            connection.close()
+
+    def __del__(self):
+        # Safety net for a response dropped before its output was started,
+        # which never runs the generator's cleanup
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def _rows(self) -> Iterator[tuple]:
+        while True:
+            batch = self._cursor.fetchmany(FETCH_BATCH)
+            if not batch:
+                self._drained = True
+                return
+            for row in batch:
+                if self.row_count >= self.max_rows:
+                    self.truncated = "row limit"
+                    return
+                self.row_count += 1
+                yield row
+
+    def _chunks(self, lines: Iterator[bytes], trailer=None) -> Iterator[bytes]:
+        buffer = []
+        size = 0
+        try:
+            try:
+                for line in lines:
+                    if self.byte_count + len(line) > self.max_bytes:
+                        self.truncated = "byte limit"
+                        # The row that didn't fit was counted but not written
+                        self.row_count = max(0, self.row_count - 1)
+                        break
+                    self.byte_count += len(line)
+                    buffer.append(line)
+                    size += len(line)
+                    if size >= CHUNK_BYTES:
+                        yield b"".join(buffer)
+                        buffer, size = [], 0
+            except pymysql.MySQLError as e:
+                # Headers are already sent; report it in the trailer if the
+                # format has one, otherwise abort the response
+                if trailer is None:
+                    raise
+                self.error = str(e)
+            if trailer is not None:
+                buffer.append(trailer())
+            if buffer:
+                yield b"".join(buffer)
+        finally:
+            self.close()
+
+    def summary(self) -> dict:
+        summary = {"row_count": self.row_count, "truncated": bool(self.truncated), "reason": self.truncated}
+        if self.error:
+            summary["error"] = self.error
+        return summary
+
+    def ndjson(self) -> Iterator[bytes]:
+        """A ``{"columns": [...]}`` line, one JSON array per row, then a summary line."""
+        def lines():
+            yield json.dumps({"columns": self.columns}).encode("utf-8") + b"\n"
+            for row in self._rows():
+                yield json.dumps(row, default=_json_default, ensure_ascii=False).encode("utf-8") + b"\n"
+
+        return self._chunks(lines(), lambda: json.dumps(self.summary()).encode("utf-8") + b"\n")
+
+    def csv(self) -> Iterator[bytes]:
+        """A header row then the data rows, RFC 4180 quoting."""
+        def lines():
+            out = io.StringIO()
+            writer = csv.writer(out)
+            writer.writerow(self.columns)
+            yield from self._take(out)
+            for row in self._rows():
+                writer.writerow([_csv_value(value) for value in row])
+                yield from self._take(out)
+
+        return self._chunks(lines())
+
+    @staticmethod
+    def _take(out: io.StringIO) -> Iterator[bytes]:
+        data = out.getvalue()
+        if data:
+            out.seek(0)
+            out.truncate()
+            yield data.encode("utf-8")
+
+    def fetch(self) -> List[dict]:
+        """Read up to ``max_rows`` rows as dicts, for the inline JSON response."""
+        try:
+            return [dict(zip(self.columns, row)) for row in self._rows()]
+        finally:
+            self.close()
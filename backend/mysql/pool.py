@@ -0,0 +1,306 @@
+"""Thread-safe pool of site database connections.
+
+Connections are pooled per ``(host, user, database)``. Callers keep the
+existing ``with connection:`` idiom: leaving the block hands the connection
+back to the pool (rolled back, so no transaction or snapshot leaks into the
+next checkout) instead of closing it. Connections idle longer than
+``ping_interval`` are pinged on checkout, and ones idle past
+``idle_timeout`` are closed by a reaper thread so quiet sites don't hold
+server connection slots.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+import pymysql
+
+CONNECT_TIMEOUT = 5
+POOL_MAX_PER_KEY = int(os.environ.get("DB_POOL_MAX_PER_KEY", 5))
+POOL_MAX_TOTAL = int(os.environ.get("DB_POOL_MAX_TOTAL", 50))
+# Seconds an unused connection stays open
+POOL_IDLE_TIMEOUT = float(os.environ.get("DB_POOL_IDLE_TIMEOUT", 300))
+# Connections idle longer than this are pinged before being handed out
+PING_INTERVAL = 30
+# Seconds a checkout waits for a slot when the pool is at its limits
+CHECKOUT_TIMEOUT = 10
+
+PoolKey = Tuple[str, str, str]
+
+
+class PoolTimeout(pymysql.err.OperationalError):
+    """Raised when no connection frees up within the checkout timeout."""
+
+
+def open_unpooled_connection(host: str, user: str, password: str, database: str):
+    """A plain connection outside the pool's limits, for short side channels
+    such as ``KILL QUERY``; the caller closes it."""
+    return pymysql.connect(
+        host=host,
+        user=user,
+        password=password,
+        database=database,
+        connect_timeout=CONNECT_TIMEOUT,
+        cursorclass=pymysql.cursors.DictCursor,
+    )
+
+
+class _Idle:
+    __slots__ = ("connection", "password", "returned_at")
+
+    def __init__(self, connection, password: str):
+        self.connection = connection
+        self.password = password
+        self.returned_at = time.monotonic()
+
+
+class PooledConnection:
+    """Proxy for a checked-out connection; ``close()`` or leaving ``with`` releases it."""
+
+    def __init__(self, pool: "ConnectionPool", key: PoolKey, password: str, connection):
+        self._pool = pool
+        self._key = key
+        self._password = password
+        self._connection = connection
+
+    def __getattr__(self, name):
+        if self._connection is None:
+            raise pymysql.err.InterfaceError(0, "Connection already returned to the pool")
+        return getattr(self._connection, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(discard=exc_type is not None and issubclass(exc_type, pymysql.err.OperationalError))
+
+    def close(self, discard: bool = False) -> None:
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            self._pool._release(self._key, self._password, connection, discard)
+
+    def __del__(self):
+        # Safety net for code paths that return before entering ``with``
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Hands out reusable connections keyed by host, user and database."""
+
+    def __init__(self, max_per_key: int = POOL_MAX_PER_KEY, max_total: int = POOL_MAX_TOTAL,
+                 idle_timeout: float = POOL_IDLE_TIMEOUT, ping_interval: float = PING_INTERVAL,
+                 checkout_timeout: float = CHECKOUT_TIMEOUT, connect: Optional[Callable] = None):
+        self.max_per_key = max_per_key
+        self.max_total = max_total
+        self.idle_timeout = idle_timeout
+        self.ping_interval = ping_interval
+        self.checkout_timeout = checkout_timeout
+        self._connect = connect or pymysql.connect
+        self._cond = threading.Condition()
+        self._idle: Dict[PoolKey, Deque[_Idle]] = {}
+        self._in_use: Dict[PoolKey, int] = {}
+        self._total = 0
+        self._reaper: Optional[threading.Thread] = None
+        self._stats = {
+            "created": 0,
+            "reused": 0,
+            "closed": 0,
+            "evicted_idle": 0,
+            "failed_pings": 0,
+            "waits": 0,
+            "timeouts": 0,
+        }
+
+    def _close(self, connection) -> None:
+        """Close a connection that no longer counts against the pool; caller holds ``_cond``."""
+        self._total -= 1
+        self._stats["closed"] += 1
+        self._cond.notify()
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _take_idle(self, key: PoolKey, password: str) -> Optional[_Idle]:
+        idle = self._idle.get(key)
+        while idle:
+            entry = idle.pop()
+            if entry.password == password:
+                return entry
+            # wp-config credentials changed; connections made with the old ones are stale
+            self._close(entry.connection)
+        return None
+
+    def _evict_one_idle(self) -> bool:
+        """Close the longest-idle connection of any key to make room; caller holds ``_cond``."""
+        oldest_key, oldest = None, None
+        for key, idle in self._idle.items():
+            if idle and (oldest is None or idle[0].returned_at < oldest.returned_at):
+                oldest_key, oldest = key, idle[0]
+        if oldest is None:
+            return False
+        self._idle[oldest_key].popleft()
+        self._close(oldest.connection)
+        return True
+
+    def connection(self, host: str, user: str, password: str, database: str) -> PooledConnection:
+        """Check out a connection, creating one if the limits allow.
+
+        Raises ``PoolTimeout`` when the pool stays full, or the driver's error
+        if connecting fails.
+        """
+        key = (host, user, database)
+        deadline = time.monotonic() + self.checkout_timeout
+        self._start_reaper()
+        while True:
+            with self._cond:
+                while True:
+                    entry = self._take_idle(key, password)
+                    if entry is not None:
+                        break
+                    in_use = self._in_use.get(key, 0)
+                    if in_use < self.max_per_key and (self._total < self.max_total or self._evict_one_idle()):
+                        self._total += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(2013, f"No database connection available for {user}@{host}/{database}")
+                    self._stats["waits"] += 1
+                    self._cond.wait(remaining)
+                self._in_use[key] = self._in_use.get(key, 0) + 1
+
+            if entry is None:
+                try:
+                    raw = self._connect(
+                        host=host,
+                        user=user,
+                        password=password,
+                        database=database,
+                        connect_timeout=CONNECT_TIMEOUT,
+                        cursorclass=pymysql.cursors.DictCursor,
+                    )
+                except Exception:
+                    with self._cond:
+                        self._in_use[key] -= 1
+                        self._total -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._stats["created"] += 1
+                return PooledConnection(self, key, password, raw)
+
+            if time.monotonic() - entry.returned_at < self.ping_interval or self._ping(entry.connection):
+                with self._cond:
+                    self._stats["reused"] += 1
+                return PooledConnection(self, key, password, entry.connection)
+
+            # Dead connection (server restart, wait_timeout); drop it and try again
+            with self._cond:
+                self._stats["failed_pings"] += 1
+                self._in_use[key] -= 1
+                self._close(entry.connection)
+
+    @staticmethod
+    def _ping(connection) -> bool:
+        try:
+            connection.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _release(self, key: PoolKey, password: str, connection, discard: bool = False) -> None:
+        result = getattr(connection, "_result", None)
+        if result is not None and getattr(result, "unbuffered_active", False):
+            # An unbuffered result was abandoned mid-read; the socket is unusable
+            discard = True
+        if not discard:
+            try:
+                # Ends any open transaction so the next user sees fresh data
+                connection.rollback()
+            except Exception:
+                discard = True
+        with self._cond:
+            self._in_use[key] -= 1
+            if not self._in_use[key]:
+                del self._in_use[key]
+            if discard or not getattr(connection, "open", True):
+                self._close(connection)
+                return
+            self._idle.setdefault(key, deque()).append(_Idle(connection, password))
+            self._cond.notify()
+
+    def evict_idle(self) -> int:
+        """Close connections unused for longer than ``idle_timeout``; returns how many."""
+        cutoff = time.monotonic() - self.idle_timeout
+        evicted = 0
+        with self._cond:
+            for key in list(self._idle):
+                idle = self._idle[key]
+                while idle and idle[0].returned_at < cutoff:
+                    self._close(idle.popleft().connection)
+                    evicted += 1
+                if not idle:
+                    del self._idle[key]
+            self._stats["evicted_idle"] += evicted
+        return evicted
+
+    def _run_reaper(self) -> None:
+        while True:
+            time.sleep(max(1.0, min(self.idle_timeout, 60) / 2))
+            try:
+                self.evict_idle()
+            except Exception as e:
+                print(f"Error evicting idle database connections: {e}")
+
+    def _start_reaper(self) -> None:
+        if self._reaper is None:
+            with self._cond:
+                if self._reaper is None:
+                    self._reaper = threading.Thread(target=self._run_reaper, name="db-pool-reaper", daemon=True)
+                    self._reaper.start()
+
+    def stats(self) -> dict:
+        """Pool counters plus current in-use/idle connections per key."""
+        with self._cond:
+            keys = sorted(set(self._idle) | set(self._in_use))
+            pools = [
+                {
+                    "host": host,
+                    "user": user,
+                    "database": database,
+                    "in_use": self._in_use.get((host, user, database), 0),
+                    "idle": len(self._idle.get((host, user, database), ())),
+                }
+                for host, user, database in keys
+            ]
+            return {
+                **self._stats,
+                "total": self._total,
+                "in_use": sum(self._in_use.values()),
+                "idle": sum(len(idle) for idle in self._idle.values()),
+                "max_per_key": self.max_per_key,
+                "max_total": self.max_total,
+                "idle_timeout": self.idle_timeout,
+                "pools": pools,
+            }
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_connection_pool() -> ConnectionPool:
+    """Return the process-wide pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+        return _pool
@@ -0,0 +1,274 @@
+"""LRU cache for read-only SQL console results.
+
+Entries are keyed by host, database and the normalized statement, and hold
+the serialized response. Each entry remembers a fingerprint of the tables
+the statement reads (``UPDATE_TIME``, ``CREATE_TIME`` and the live
+``CHECKSUM`` where the engine keeps one, from ``information_schema.TABLES``).
+A lookup re-reads those with one cheap query and treats any change as a
+miss. Statements whose result can change without a table changing (NOW(),
+RAND(), variables, views, other schemas, ...) are never cached, and every
+entry also expires after a TTL in case a change isn't reflected in
+``information_schema``.
+"""
+
+from __future__ import annotations
+
+import datetime
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import pymysql
+
+QUERY_CACHE_ENTRIES = int(os.environ.get("QUERY_CACHE_ENTRIES", 256))
+QUERY_CACHE_BYTES = int(os.environ.get("QUERY_CACHE_BYTES", 64 * 1024 * 1024))
+QUERY_CACHE_TTL = float(os.environ.get("QUERY_CACHE_TTL", 300))
+# Results larger than this are not worth holding
+MAX_ENTRY_BYTES = 4 * 1024 * 1024
+
+ALL_TABLES = "*"
+
+# Tables written this recently aren't cached: UPDATE_TIME has one-second
+# resolution, so a second write in the same second wouldn't change it
+RECENT_WRITE_SECONDS = 2
+
+FINGERPRINT_QUERY = """
+    SELECT TABLE_NAME AS name, TABLE_TYPE AS type, UPDATE_TIME AS update_time,
+           CREATE_TIME AS create_time, CHECKSUM AS checksum, NOW() AS server_now
+    FROM information_schema.TABLES
+    WHERE TABLE_SCHEMA = DATABASE(){filter}
+    ORDER BY TABLE_NAME
+"""
+
+_TOKEN = re.compile(
+    r"""('(?:[^'\\]|\\.|'')*')"""       # single-quoted string
+    r"""|("(?:[^"\\]|\\.|"")*")"""      # double-quoted string
+    r"""|(`(?:[^`]|``)*`)"""            # quoted identifier
+    r"""|(/\*.*?\*/|--[ \t][^\n]*|\#[^\n]*)"""  # comment
+    r"""|(\s+)""",                      # whitespace
+    re.DOTALL,
+)
+
+_NON_DETERMINISTIC = re.compile(
+    r"\b(?:NOW|SYSDATE|CURDATE|CURTIME|UNIX_TIMESTAMP|UTC_DATE|UTC_TIME|UTC_TIMESTAMP|RAND|UUID|UUID_SHORT"
+    r"|CONNECTION_ID|LAST_INSERT_ID|FOUND_ROWS|ROW_COUNT|SLEEP|BENCHMARK|GET_LOCK|IS_FREE_LOCK|IS_USED_LOCK"
+    r"|USER|CURRENT_USER|SESSION_USER|SYSTEM_USER|DATABASE|SCHEMA|VERSION|LOAD_FILE)\s*\("
+    r"|\b(?:CURRENT_TIMESTAMP|CURRENT_DATE|CURRENT_TIME|LOCALTIME|LOCALTIMESTAMP|INTO|FOR\s+UPDATE"
+    r"|LOCK\s+IN\s+SHARE\s+MODE|SQL_NO_CACHE)\b"
+    r"|@",
+    re.IGNORECASE,
+)
+
+_QUOTED = r"`(?:[^`]|``)+`"
+_IDENT = r"((?:" + _QUOTED + r"|[A-Za-z0-9_$]+)(?:\.(?:" + _QUOTED + r"|[A-Za-z0-9_$]+))?)"
+_FROM_CLAUSE = re.compile(
+    r"\bFROM\s+(.+?)(?=\b(?:WHERE|GROUP|HAVING|ORDER|LIMIT|UNION|WINDOW|FOR|JOIN|STRAIGHT_JOIN|INNER|CROSS"
+    r"|LEFT|RIGHT|NATURAL|ON|USING)\b|\)|$)",
+    re.IGNORECASE | re.DOTALL,
+)
+_JOIN_TABLE = re.compile(r"\b(?:JOIN|STRAIGHT_JOIN)\s+" + _IDENT, re.IGNORECASE)
+_SHOW_ALL = re.compile(r"^SHOW\s+(?:FULL\s+)?TABLES?(?:\s+STATUS)?(?:\s+(?:LIKE|WHERE)\b.*)?$", re.IGNORECASE | re.DOTALL)
+_SHOW_ONE = re.compile(
+    r"^SHOW\s+(?:(?:FULL\s+)?(?:COLUMNS|FIELDS)|INDEX|INDEXES|KEYS)\s+(?:FROM|IN)\s+" + _IDENT + r"(?:\s+LIKE\b.*)?$"
+    r"|^SHOW\s+CREATE\s+TABLE\s+" + _IDENT + r"$",
+    re.IGNORECASE | re.DOTALL,
+)
+_DESCRIBE = re.compile(r"^(?:DESCRIBE|DESC)\s+" + _IDENT + r"(?:\s+\S+)?$", re.IGNORECASE)
+
+
+def normalize_sql(query: str) -> str:
+    """Drop comments and collapse whitespace outside literals; strip a trailing ``;``."""
+    parts = []
+    pos = 0
+    for match in _TOKEN.finditer(query):
+        parts.append(query[pos:match.start()])
+        if match.group(4) or match.group(5):
+            parts.append(" ")
+        else:
+            parts.append(match.group(0))
+        pos = match.end()
+    parts.append(query[pos:])
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def _table_name(token: str) -> Optional[str]:
+    """Unquoted table name, or ``None`` for a schema-qualified reference."""
+    if re.fullmatch(_QUOTED, token):
+        return token[1:-1].replace("``", "`")
+    if "." in token:
+        return None
+    return token
+
+
+def referenced_tables(normalized: str) -> Optional[List[str]]:
+    """Tables a cacheable statement reads (``['*']`` for the whole schema), or
+    ``None`` if the statement shouldn't be cached."""
+    # Literals can't name tables and may contain anything
+    bare = _TOKEN.sub(lambda m: " '' " if m.group(1) or m.group(2) else m.group(0), normalized)
+    if _NON_DETERMINISTIC.search(bare):
+        return None
+    verb = bare.split(None, 1)[0].upper() if bare else ""
+
+    if verb == "SHOW":
+        if _SHOW_ALL.match(bare):
+            return [ALL_TABLES]
+        match = _SHOW_ONE.match(bare)
+        if not match:
+            return None
+        name = _table_name(match.group(1) or match.group(2))
+        return [name] if name else None
+
+    if verb in ("DESCRIBE", "DESC"):
+        match = _DESCRIBE.match(bare)
+        if not match or match.group(1).upper() in ("SELECT", "FORMAT", "ANALYZE", "EXTENDED", "PARTITIONS"):
+            return None
+        name = _table_name(match.group(1))
+        return [name] if name else None
+
+    # Subqueries and CTEs aren't parsed, so their tables can't be tracked
+    if verb != "SELECT" or re.search(r"\(\s*SELECT\b|^WITH\b", bare, re.IGNORECASE):
+        return None
+    tables = []
+    for clause in _FROM_CLAUSE.findall(bare):
+        for item in clause.split(","):
+            item = item.strip()
+            if not item or item.startswith("("):
+                continue
+            token = re.match(_IDENT, item)
+            if not token:
+                return None
+            tables.append(token.group(1))
+    tables.extend(_JOIN_TABLE.findall(bare))
+    names = []
+    for token in tables:
+        name = _table_name(token)
+        if name is None:
+            return None
+        if token.lower() != "dual":
+            names.append(name)
+    # A SELECT without tables (SELECT 1) is cheap enough to just run
+    return sorted(set(names)) or None
+
+
+class QueryResultCache:
+    """Bounded LRU of serialized query results, validated against table metadata."""
+
+    def __init__(self, max_entries: int = QUERY_CACHE_ENTRIES, max_bytes: int = QUERY_CACHE_BYTES,
+                 ttl: float = QUERY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stale": 0, "stores": 0, "evictions": 0, "uncacheable": 0}
+
+    def fingerprint(self, connection, tables: List[str]) -> Optional[Tuple]:
+        """Current metadata of ``tables``; ``None`` if one is missing, a view,
+        was written in the last couple of seconds or has nothing that tracks
+        writes."""
+        with connection.cursor() as cursor:
+            # MySQL 8 otherwise serves UPDATE_TIME from a cache refreshed daily.
+            # The connection is pooled, so the old value is put back afterwards
+            # rather than making every later information_schema query slower.
+            try:
+                cursor.execute("SELECT @@SESSION.information_schema_stats_expiry AS expiry")
+                previous_expiry = cursor.fetchone()["expiry"]
+                cursor.execute("SET SESSION information_schema_stats_expiry = 0")
+            except pymysql.MySQLError:
+                previous_expiry = None
+            try:
+                if tables == [ALL_TABLES]:
+                    cursor.execute(FINGERPRINT_QUERY.format(filter=""))
+                else:
+                    placeholders = ", ".join(["%s"] * len(tables))
+                    cursor.execute(FINGERPRINT_QUERY.format(filter=f" AND TABLE_NAME IN ({placeholders})"), tables)
+                rows = cursor.fetchall()
+            finally:
+                if previous_expiry is not None:
+                    cursor.execute("SET SESSION information_schema_stats_expiry = %s", (previous_expiry,))
+        if tables != [ALL_TABLES] and len(rows) != len(tables):
+            return None
+        if any(row["type"] != "BASE TABLE" for row in rows):
+            return None
+        # Without UPDATE_TIME or CHECKSUM (e.g. InnoDB tables not written since
+        # the server started) the next write wouldn't change the fingerprint
+        if any(row["update_time"] is None and row["checksum"] is None for row in rows):
+            return None
+        recent = datetime.timedelta(seconds=RECENT_WRITE_SECONDS)
+        if any(row["update_time"] and row["update_time"] >= row["server_now"] - recent for row in rows):
+            return None
+        return tuple(
+            (row["name"], str(row["update_time"]), str(row["create_time"]), row["checksum"])
+            for row in rows
+        )
+
+    def _drop(self, key: tuple) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry["body"])
+
+    def get(self, key: tuple, fingerprint: Tuple) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            if entry["fingerprint"] != fingerprint or time.monotonic() - entry["stored_at"] > self.ttl:
+                self._drop(key)
+                self._stats["stale"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry["body"]
+
+    def put(self, key: tuple, fingerprint: Tuple, body: bytes) -> None:
+        if len(body) > MAX_ENTRY_BYTES:
+            return
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = {"fingerprint": fingerprint, "body": body, "stored_at": time.monotonic()}
+            self._bytes += len(body)
+            self._stats["stores"] += 1
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def note_uncacheable(self) -> None:
+        with self._lock:
+            self._stats["uncacheable"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else None,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+            }
+
+
+_cache: Optional[QueryResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_query_cache() -> QueryResultCache:
+    """Return the process-wide result cache, creating it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = QueryResultCache()
+        return _cache
@@ -0,0 +1,195 @@
+"""Time limits and cancellation for SQL console queries.
+
+Each query gets a server-side limit: ``SET STATEMENT max_statement_time``
+on MariaDB, or a ``MAX_EXECUTION_TIME`` optimizer hint on a MySQL SELECT.
+Running queries are tracked with their connection thread id, so they can be
+listed and cancelled with ``KILL QUERY`` from a second connection. A
+watchdog thread does the same for any query still running shortly after its
+limit (statements the server-side limit doesn't cover, such as SHOW on
+MySQL).
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import secrets
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pymysql
+
+QUERY_TIMEOUT = float(os.environ.get("SQL_QUERY_TIMEOUT", 30))
+EXPORT_TIMEOUT = float(os.environ.get("SQL_EXPORT_TIMEOUT", 600))
+MAX_QUERY_TIMEOUT = float(os.environ.get("SQL_QUERY_MAX_TIMEOUT", 3600))
+# The watchdog steps in this long after a query's limit
+WATCHDOG_GRACE = 2.0
+WATCHDOG_INTERVAL = 0.5
+
+# MySQL max_execution_time exceeded, MariaDB max_statement_time exceeded
+TIMEOUT_ERRORS = (3024, 1969)
+MAX_SQL_PREVIEW = 500
+
+_LEADING_SELECT = re.compile(
+    r"^(\s*(?:(?:/\*(?!\+).*?\*/|--[ \t][^\n]*\n|\#[^\n]*\n)\s*)*)SELECT\b",
+    re.IGNORECASE | re.DOTALL,
+)
+_QUERY_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def limit_execution_time(query: str, seconds: float, server_info: str) -> str:
+    """Return ``query`` rewritten to carry a server-side time limit where supported."""
+    if "mariadb" in (server_info or "").lower():
+        return f"SET STATEMENT max_statement_time={seconds:g} FOR {query}"
+    match = _LEADING_SELECT.match(query)
+    if not match:
+        return query
+    return f"{query[:match.end()]} /*+ MAX_EXECUTION_TIME({max(1, int(seconds * 1000))}) */{query[match.end():]}"
+
+
+class RunningQuery:
+    """One in-flight query; ``interrupted`` is set to ``'cancelled'`` or ``'timeout'`` when it is killed."""
+
+    def __init__(self, registry: "QueryRegistry", query_id: str, domain: str, sql: str, thread_id: int,
+                 timeout: float, open_connection: Callable):
+        self.registry = registry
+        self.id = query_id
+        self.domain = domain
+        self.sql = sql
+        self.thread_id = thread_id
+        self.timeout = timeout
+        self.started_at = time.time()
+        self.deadline = time.monotonic() + timeout
+        self.interrupted: Optional[str] = None
+        self._open_connection = open_connection
+        self._lock = threading.Lock()
+        self._done = False
+
+    def info(self) -> dict:
+        return {
+            "query_id": self.id,
+            "sql": self.sql[:MAX_SQL_PREVIEW],
+            "thread_id": self.thread_id,
+            "started_at": self.started_at,
+            "elapsed": round(time.time() - self.started_at, 3),
+            "timeout": self.timeout,
+            "interrupted": self.interrupted,
+        }
+
+    def finish(self) -> None:
+        """Unregister; must run before the connection goes back to the pool,
+        so a late KILL can't hit whatever runs on that thread next."""
+        self.registry._remove(self.id)
+        # Waits for a KILL already in flight
+        with self._lock:
+            self._done = True
+
+    def kill(self, reason: str) -> bool:
+        """``KILL QUERY`` on this query's thread; ``False`` if it had already finished."""
+        with self._lock:
+            if self._done:
+                return False
+            if self.interrupted:
+                return True
+        # Connecting can take a while; finish() must not wait on it
+        connection = self._open_connection()
+        if connection is None:
+            raise pymysql.err.OperationalError(2003, "Could not open a connection to cancel the query")
+        try:
+            with self._lock:
+                if self._done:
+                    return False
+                if self.interrupted:
+                    return True
+                with connection.cursor() as cursor:
+                    cursor.execute("KILL QUERY %s", (self.thread_id,))
+                self.interrupted = reason
+                return True
+        finally:
+            connection.close()
+
+    def failure(self, error: Exception) -> Optional[Tuple[str, int]]:
+        """``(message, HTTP status)`` if ``error`` came from a timeout or cancel."""
+        if self.interrupted == "cancelled":
+            return "Query was cancelled", 409
+        code = error.args[0] if isinstance(error, pymysql.MySQLError) and error.args else None
+        if self.interrupted == "timeout" or code in TIMEOUT_ERRORS:
+            return f"Query exceeded the {self.timeout:g}s time limit", 504
+        return None
+
+
+class QueryRegistry:
+    """Tracks running queries per site and kills the ones that overrun."""
+
+    def __init__(self, grace: float = WATCHDOG_GRACE):
+        self.grace = grace
+        self._queries: Dict[str, RunningQuery] = {}
+        self._lock = threading.Lock()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def register(self, domain: str, sql: str, connection, timeout: float, open_connection: Callable,
+                 query_id: Optional[str] = None) -> RunningQuery:
+        """Track a query about to run on ``connection``; raises ``ValueError`` for a bad or reused id.
+
+        ``open_connection()`` returns a second, unpooled connection to send
+        ``KILL QUERY`` on; it is closed after use.
+        """
+        if query_id is not None and not _QUERY_ID.match(str(query_id)):
+            raise ValueError("query_id may only contain letters, digits, '-' and '_'")
+        with self._lock:
+            query_id = str(query_id) if query_id is not None else secrets.token_hex(8)
+            if query_id in self._queries:
+                raise ValueError("A query with this query_id is already running")
+            running = RunningQuery(self, query_id, domain, sql, connection.thread_id(), timeout, open_connection)
+            self._queries[query_id] = running
+            if self._watchdog is None:
+                self._watchdog = threading.Thread(target=self._run_watchdog, name="query-watchdog", daemon=True)
+                self._watchdog.start()
+        return running
+
+    def _remove(self, query_id: str) -> None:
+        with self._lock:
+            self._queries.pop(query_id, None)
+
+    def running(self, domain: str) -> List[dict]:
+        with self._lock:
+            queries = [q for q in self._queries.values() if q.domain == domain]
+        return sorted((q.info() for q in queries), key=lambda info: info["started_at"])
+
+    def cancel(self, domain: str, query_id: str) -> Optional[dict]:
+        """Kill a running query; ``None`` if it isn't running (or belongs to another site)."""
+        with self._lock:
+            running = self._queries.get(query_id)
+        if running is None or running.domain != domain:
+            return None
+        if not running.kill("cancelled"):
+            return None
+        return running.info()
+
+    def _run_watchdog(self) -> None:
+        while True:
+            time.sleep(WATCHDOG_INTERVAL)
+            now = time.monotonic()
+            with self._lock:
+                overdue = [q for q in self._queries.values()
+                           if not q.interrupted and now > q.deadline + self.grace]
+            for running in overdue:
+                try:
+                    if running.kill("timeout"):
+                        print(f"Killed query {running.id} on {running.domain} after {running.timeout:g}s")
+                except Exception as e:
+                    print(f"Error killing overdue query {running.id}: {e}")
+
+
+_registry: Optional[QueryRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_query_registry() -> QueryRegistry:
+    """Return the process-wide registry, creating it on first use."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = QueryRegistry()
+        return _registry
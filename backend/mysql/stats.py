@@ -0,0 +1,127 @@
+"""Batched table counts and sizes for every site database.
+
+Sites are grouped by MySQL host and each group is answered by one grouped
+``information_schema.tables`` query. When a privileged account is configured
+(a my.cnf style defaults file), that single query covers every schema on the
+host. Schemas it cannot see fall back to the sites' own credentials, still
+batched per distinct credential set rather than per site, on connections
+from the shared site pool.
+"""
+
+from __future__ import annotations
+
+import os
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import pymysql
+
+from .pool import CONNECT_TIMEOUT, get_connection_pool
+
+STATS_DEFAULTS_FILE = Path(os.environ.get("MYSQL_STATS_DEFAULTS_FILE", Path.home() / ".my.cnf"))
+
+STATS_QUERY = """
+    SELECT
+        table_schema AS db_name,
+        COUNT(*) AS table_count,
+        COALESCE(ROUND(SUM(data_length + index_length) / 1024 / 1024, 2), 0) AS size_mb
+    FROM information_schema.tables
+    WHERE table_schema IN ({placeholders})
+    GROUP BY table_schema
+"""
+
+StatsKey = Tuple[str, str]
+
+
+def _fetch_schema_stats(connection, schemas: List[str]) -> Dict[str, dict]:
+    placeholders = ", ".join(["%s"] * len(schemas))
+    with connection.cursor() as cursor:
+        cursor.execute(STATS_QUERY.format(placeholders=placeholders), schemas)
+        rows = cursor.fetchall()
+    return {
+        row["db_name"]: {
+            "size_mb": float(row["size_mb"] or 0),
+            "table_count": int(row["table_count"] or 0),
+        }
+        for row in rows
+    }
+
+
+def _privileged_connection(host: str):
+    if not STATS_DEFAULTS_FILE.exists():
+        return None
+    try:
+        return pymysql.connect(
+            host=host,
+            read_default_file=str(STATS_DEFAULTS_FILE),
+            connect_timeout=CONNECT_TIMEOUT,
+            cursorclass=pymysql.cursors.DictCursor,
+        )
+    except pymysql.MySQLError as err:
+        print(f"Privileged stats connection to {host} failed: {err}")
+        return None
+
+
+def _site_connection(host: str, db_info: dict):
+    try:
+        return get_connection_pool().connection(
+            host,
+            db_info["db_user"],
+            db_info["db_password"],
+            db_info["db_name"],
+        )
+    except pymysql.MySQLError as err:
+        print(f"Stats connection to {db_info.get('db_name')} failed: {err}")
+        return None
+
+
+def _query(connection, schemas: List[str]) -> Dict[str, dict]:
+    if connection is None or not schemas:
+        return {}
+    try:
+        with connection:
+            return _fetch_schema_stats(connection, schemas)
+    except pymysql.MySQLError as err:
+        print(f"Error collecting database stats: {err}")
+        return {}
+
+
+def collect_db_stats(sites: Iterable[dict],
+                     credentials_for: Callable[[dict], dict],
+                     privileged_connect: Optional[Callable[[str], object]] = None) -> Dict[StatsKey, dict]:
+    """Return ``{(db_host, db_name): {'size_mb', 'table_count'}}`` for ``sites``.
+
+    ``credentials_for(site)`` returns the site's wp-config DB info and is
+    only called for schemas the privileged connection could not report.
+    """
+    privileged_connect = privileged_connect or _privileged_connection
+
+    by_host: Dict[str, List[dict]] = defaultdict(list)
+    for site in sites:
+        if site.get("db_name"):
+            by_host[site.get("db_host") or "127.0.0.1"].append(site)
+
+    stats: Dict[StatsKey, dict] = {}
+    for host, host_sites in by_host.items():
+        schemas = sorted({site["db_name"] for site in host_sites})
+        found = _query(privileged_connect(host), schemas)
+
+        by_credentials: Dict[tuple, List[str]] = defaultdict(list)
+        credentials: Dict[tuple, dict] = {}
+        for site in host_sites:
+            if site["db_name"] in found:
+                continue
+            db_info = credentials_for(site) or {}
+            if not db_info.get("db_password") or not db_info.get("db_user"):
+                continue
+            key = (db_info["db_user"], db_info["db_password"])
+            credentials.setdefault(key, {**db_info, "db_name": site["db_name"]})
+            by_credentials[key].append(site["db_name"])
+
+        for key, names in by_credentials.items():
+            found.update(_query(_site_connection(host, credentials[key]), sorted(set(names))))
+
+        for db_name, row in found.items():
+            stats[(host, db_name)] = row
+    return stats
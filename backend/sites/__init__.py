@@ -0,0 +1,6 @@
+"""Site discovery, sizing and inventory helpers."""
+
+from .registry import SiteRecord, SiteRegistry
+from .size_index import SizeIndex, get_size_index
+
+__all__ = ["SiteRecord", "SiteRegistry", "SizeIndex", "get_size_index"]
@@ -0,0 +1,178 @@
+"""Parallel site discovery.
+
+Discovery is split in two phases. ``discover_sites`` returns the cheap
+identity of every site (domain, paths, DB name, vhost state and aliases)
+using one directory listing of the sites root, one pass over the Apache vhost
+confs and a cached parse of each ``wp-config.php``. ``enrich_sites`` then fills in the
+expensive fields (disk size, WordPress version) for callers that need them.
+Both phases fan out over a bounded thread pool.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, List, Optional, Set, Tuple
+
+from backend.wordpress.config import load_wp_config
+
+from .size_index import get_size_index
+
+MAX_WORKERS = 8
+
+WP_VERSION_REGEX = re.compile(r"\$wp_version\s*=\s*['\"]([^'\"]+)['\"]")
+VHOST_DIRECTIVE_REGEX = re.compile(
+    r"^\s*(ServerName|ServerAlias|DocumentRoot)\s+(.+?)\s*$", re.IGNORECASE | re.MULTILINE
+)
+
+ENRICH_FIELDS = ("size_mb", "wordpress_version")
+
+
+def _read_vhosts(apache_sites_dir: Path) -> List[Tuple[str, Set[str], List[str]]]:
+    """Return ``(conf_name, server_names, document_roots)`` for each vhost conf."""
+    vhosts = []
+    try:
+        with os.scandir(apache_sites_dir) as entries:
+            confs = [entry for entry in entries if entry.name.endswith(".conf")]
+    except OSError:
+        return vhosts
+    for entry in confs:
+        try:
+            with open(entry.path, "r", encoding="utf-8", errors="ignore") as f:
+                content = f.read()
+        except OSError:
+            continue
+        names: Set[str] = set()
+        roots: List[str] = []
+        for directive, value in VHOST_DIRECTIVE_REGEX.findall(content):
+            if directive.lower() == "documentroot":
+                roots.append(value.strip().strip("\"'").rstrip("/"))
+            else:
+                names.update(name.lower() for name in value.split())
+        vhosts.append((entry.name[:-len(".conf")], names, roots))
+    return vhosts
+
+
+def _match_vhost(site_dir: Path, domain: str, vhosts) -> Tuple[Optional[str], Set[str]]:
+    """Find the vhost conf serving ``site_dir`` and return its name and hostnames."""
+    # Apache confs are sometimes named without the TLD, e.g. aplusacademytt.conf
+    conf_names = (domain, domain.rsplit(".", 1)[0])
+    site_root = str(site_dir)
+    for conf_name in conf_names:
+        for name, hostnames, _ in vhosts:
+            if name == conf_name:
+                return name, hostnames
+    for name, hostnames, roots in vhosts:
+        if domain in hostnames or any(root == site_root or root.startswith(site_root + "/") for root in roots):
+            return name, hostnames
+    return None, set()
+
+
+def _list_names(directory: Path) -> Set[str]:
+    """Return the entry names of ``directory`` (empty if it is unreadable)."""
+    try:
+        with os.scandir(directory) as entries:
+            return {entry.name for entry in entries}
+    except OSError:
+        return set()
+
+
+def _site_identity(site_dir: Path, vhosts, enabled: Set[str],
+                   apache_sites_dir: Path, log_dir: Path) -> Optional[dict]:
+    public_html = site_dir / "public_html"
+    wp_config = load_wp_config(public_html / "wp-config.php")
+    if wp_config is None:
+        return None
+    db_info = wp_config.db_info()
+
+    domain = site_dir.name
+    conf_name, hostnames = _match_vhost(site_dir, domain, vhosts)
+    apache_enabled = (
+        f"{domain}.conf" in enabled
+        or f"{domain.rsplit('.', 1)[0]}.conf" in enabled
+        or (conf_name is not None and f"{conf_name}.conf" in enabled)
+    )
+
+    return {
+        "domain": domain,
+        "path": str(site_dir),
+        "public_html": str(public_html),
+        "apache_config": str(apache_sites_dir / f"{conf_name}.conf") if conf_name else None,
+        "apache_conf_name": conf_name,
+        "apache_enabled": apache_enabled,
+        "aliases": sorted(hostnames - {domain}),
+        "db_name": db_info.get("db_name"),
+        "db_user": db_info.get("db_user"),
+        "db_host": db_info.get("db_host", "127.0.0.1"),
+        "error_log": str(log_dir / f"{domain}_error.log"),
+        "access_log": str(log_dir / f"{domain}_access.log"),
+    }
+
+
+def discover_sites(base_dir: Path, apache_sites_dir: Path, apache_sites_enabled: Path,
+                   log_dir: Path, max_workers: int = MAX_WORKERS) -> List[dict]:
+    """Return the identity record of every WordPress site under ``base_dir``."""
+    try:
+        with os.scandir(base_dir) as entries:
+            site_dirs = [Path(entry.path) for entry in entries if entry.is_dir()]
+    except OSError:
+        return []
+    if not site_dirs:
+        return []
+
+    vhosts = _read_vhosts(apache_sites_dir)
+    enabled = _list_names(apache_sites_enabled)
+
+    workers = max(1, min(max_workers, len(site_dirs)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="site-discovery") as pool:
+        results = pool.map(
+            lambda site_dir: _site_identity(site_dir, vhosts, enabled, apache_sites_dir, log_dir),
+            site_dirs,
+        )
+        sites = [site for site in results if site]
+
+    return sorted(sites, key=lambda x: x["domain"])
+
+
+def read_wordpress_version(public_html) -> Optional[str]:
+    """Return ``$wp_version`` from wp-includes/version.php, if present."""
+    version_file = Path(public_html) / "wp-includes" / "version.php"
+    try:
+        with open(version_file, "r", encoding="utf-8", errors="ignore") as f:
+            match = WP_VERSION_REGEX.search(f.read())
+    except OSError:
+        return None
+    return match.group(1) if match else None
+
+
+def site_size(site: dict) -> dict:
+    """Return the site's size totals (apparent and allocated) from its size index."""
+    try:
+        return get_size_index(site["path"]).refresh()
+    except Exception as err:
+        print(f"Error sizing {site.get('domain')}: {err}")
+        return {"size_mb": 0, "allocated_mb": 0}
+
+
+def _enrich_site(site: dict, fields: Iterable[str]) -> dict:
+    if "size_mb" in fields:
+        totals = site_size(site)
+        site["size_mb"] = totals["size_mb"]
+        site["allocated_mb"] = totals["allocated_mb"]
+    if "wordpress_version" in fields:
+        site["wordpress_version"] = read_wordpress_version(site["public_html"])
+    return site
+
+
+def enrich_sites(sites: List[dict], fields: Iterable[str] = ENRICH_FIELDS,
+                 max_workers: int = MAX_WORKERS) -> List[dict]:
+    """Fill in the expensive ``fields`` of each site in place, in parallel."""
+    fields = frozenset(fields)
+    if not sites or not fields:
+        return sites
+    workers = max(1, min(max_workers, len(sites)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="site-enrich") as pool:
+        list(pool.map(lambda site: _enrich_site(site, fields), sites))
+    return sites
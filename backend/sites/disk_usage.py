@@ -0,0 +1,208 @@
+"""Disk-usage engine built on recursive ``os.scandir``.
+
+Reports both apparent bytes (``st_size``) and allocated bytes
+(``st_blocks * 512``, what ``du`` and ``df`` count). Files with more than one
+link are only counted once per ``(st_dev, st_ino)``. Large subtrees such as
+``wp-content/uploads`` and cache directories are handed to worker processes,
+and the whole measurement stops at a time budget, returning partial totals.
+"""
+
+from __future__ import annotations
+
+import fnmatch
+import heapq
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+
+MAX_WORKERS = 4
+TIME_BUDGET = 30.0
+
+# Relative paths (fnmatch patterns) measured in their own worker process
+FANOUT_PATTERNS = (
+    "public_html/wp-content/uploads/*",
+    "public_html/wp-content/cache",
+    "public_html/wp-content/cache/*",
+    "public_html/wp-content/*-cache",
+    "backups",
+)
+
+LinkKey = Tuple[int, int]
+
+_mp_context = None
+
+
+def _worker_context():
+    """Process context for the workers.
+
+    Requests run on threads, and forking a threaded process can copy locks
+    held by other threads into the child, so workers are started from a
+    forkserver (a clean single-threaded process) where available, else spawned.
+    """
+    global _mp_context
+    if _mp_context is None:
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("forkserver")
+            # Workers still re-import __main__, so the app must not start
+            # background threads at import time
+            context.set_forkserver_preload([__name__])
+        else:
+            context = multiprocessing.get_context("spawn")
+        _mp_context = context
+    return _mp_context
+
+
+def scan_directory(path: str, links: Dict[LinkKey, Tuple[int, int]], top: Optional[list] = None,
+                   top_n: int = 0) -> Tuple[int, int, int, List[str]]:
+    """Account for the files directly inside ``path``.
+
+    Returns ``(apparent, allocated, file_count, subdir_names)``; the byte
+    totals include the subdirectory entries themselves, as ``du`` does. Files with
+    ``st_nlink > 1`` are not added to the totals; they are recorded in
+    ``links`` keyed by ``(st_dev, st_ino)`` so the caller counts them (and
+    their file count) once. When ``top`` is given it is kept as a min-heap of
+    the ``top_n`` largest ``(size, name)`` files seen.
+    Raises ``OSError`` if the directory itself cannot be listed.
+    """
+    apparent = 0
+    allocated = 0
+    count = 0
+    subdirs: List[str] = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                st = entry.stat(follow_symlinks=False)
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                    apparent += st.st_size
+                    allocated += st.st_blocks * 512
+                    continue
+            except OSError:
+                continue
+            if top is not None:
+                if len(top) < top_n:
+                    heapq.heappush(top, (st.st_size, entry.name))
+                elif top and st.st_size > top[0][0]:
+                    heapq.heapreplace(top, (st.st_size, entry.name))
+            if st.st_nlink > 1:
+                links[(st.st_dev, st.st_ino)] = (st.st_size, st.st_blocks * 512)
+            else:
+                apparent += st.st_size
+                allocated += st.st_blocks * 512
+                count += 1
+    return apparent, allocated, count, subdirs
+
+
+def _new_totals() -> dict:
+    return {"apparent": 0, "allocated": 0, "files": 0, "dirs": 0, "errors": 0,
+            "partial": False, "links": {}}
+
+
+def _walk(root: str, deadline: float, totals: dict, fanout_root: Optional[str] = None,
+          patterns=(), pending: Optional[List[str]] = None) -> dict:
+    """Walk ``root`` depth-first into ``totals`` until ``deadline``.
+
+    When ``patterns`` are given, directories whose path relative to
+    ``fanout_root`` matches one are appended to ``pending`` instead of walked.
+    """
+    stack = [root]
+    while stack:
+        if time.time() > deadline:
+            totals["partial"] = True
+            break
+        path = stack.pop()
+        try:
+            apparent, allocated, count, subdirs = scan_directory(path, totals["links"])
+        except OSError:
+            totals["errors"] += 1
+            continue
+        totals["apparent"] += apparent
+        totals["allocated"] += allocated
+        totals["files"] += count
+        totals["dirs"] += 1
+        for name in subdirs:
+            child = os.path.join(path, name)
+            if patterns:
+                rel = os.path.relpath(child, fanout_root)
+                if any(fnmatch.fnmatchcase(rel, pattern) for pattern in patterns):
+                    pending.append(child)
+                    continue
+            stack.append(child)
+    return totals
+
+
+def _measure_subtree(path: str, deadline: float) -> dict:
+    """Worker-process entry point: measure one subtree without fan-out."""
+    return _walk(path, deadline, _new_totals())
+
+
+def _merge(into: dict, part: dict) -> None:
+    for key in ("apparent", "allocated", "files", "dirs", "errors"):
+        into[key] += part[key]
+    into["partial"] = into["partial"] or part["partial"]
+    into["links"].update(part["links"])
+
+
+def measure_disk_usage(root, time_budget: float = TIME_BUDGET, max_workers: int = MAX_WORKERS,
+                       patterns=FANOUT_PATTERNS) -> dict:
+    """Measure ``root`` and return apparent/allocated totals.
+
+    ``partial`` is True when the time budget ran out (or a worker failed)
+    before every directory was visited.
+    """
+    started = time.time()
+    deadline = started + time_budget
+    root = str(root)
+    pending: List[str] = []
+    totals = _new_totals()
+    try:
+        st = os.lstat(root)
+        totals["apparent"] += st.st_size
+        totals["allocated"] += st.st_blocks * 512
+    except OSError:
+        totals["errors"] += 1
+    _walk(root, deadline, totals, fanout_root=root,
+          patterns=patterns if max_workers > 1 else (), pending=pending)
+
+    if pending:
+        pool = ProcessPoolExecutor(max_workers=min(max_workers, len(pending)), mp_context=_worker_context())
+        try:
+            futures = [pool.submit(_measure_subtree, path, deadline) for path in pending]
+            # Give workers a moment past the deadline to hand back partial totals
+            done, not_done = wait(futures, timeout=max(0.0, deadline - time.time()) + 2.0)
+            for future in done:
+                try:
+                    _merge(totals, future.result())
+                except Exception as e:
+                    print(f"Disk usage worker failed: {e}")
+                    totals["errors"] += 1
+                    totals["partial"] = True
+            if not_done:
+                totals["partial"] = True
+        finally:
+            # Don't hold the request past the deadline waiting for stragglers;
+            # they stop on their own once they see the deadline
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    links = totals.pop("links")
+    for size, blocks in links.values():
+        totals["apparent"] += size
+        totals["allocated"] += blocks
+    totals["files"] += len(links)
+
+    return {
+        "path": root,
+        "apparent_bytes": totals["apparent"],
+        "allocated_bytes": totals["allocated"],
+        "apparent_mb": round(totals["apparent"] / (1024 * 1024), 2),
+        "allocated_mb": round(totals["allocated"] / (1024 * 1024), 2),
+        "files": totals["files"],
+        "dirs": totals["dirs"],
+        "hardlinked_inodes": len(links),
+        "errors": totals["errors"],
+        "subtrees_fanned_out": len(pending),
+        "partial": totals["partial"],
+        "elapsed": round(time.time() - started, 3),
+    }
@@ -0,0 +1,229 @@
+"""Field projection, sorting and pagination for site listings.
+
+Inventory records only carry cheap identity data. Expensive fields are grouped
+behind enrichers (disk size, database stats, WordPress version) that only run
+when one of their fields is requested, and only for the sites on the page
+being returned unless the listing is sorted by an enriched field.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+from backend.mysql.stats import collect_db_stats
+from backend.wordpress.config import load_wp_config
+
+from .discovery import MAX_WORKERS, read_wordpress_version, site_size
+from .registry import IDENTITY_FIELDS, SiteRecord
+
+MAX_LIMIT = 500
+
+DERIVED_FIELDS: Dict[str, Callable[[SiteRecord], object]] = {
+    "status": lambda site: "active" if site.apache_enabled else "inactive",
+    # Sites are only detected when wp-config.php exists
+    "wordpress_detected": lambda site: True,
+}
+
+# Enriched field -> enricher group that computes it
+ENRICHED_FIELDS = {
+    "size_mb": "size",
+    "allocated_mb": "size",
+    "disk_usage": "size",
+    "databases": "database",
+    "wordpress_version": "wordpress",
+}
+
+ALL_FIELDS = IDENTITY_FIELDS + tuple(DERIVED_FIELDS) + tuple(ENRICHED_FIELDS)
+
+# Freshness metadata an enricher may attach; passed through to each row as is
+META_FIELDS = ("stale", "enriched_at")
+
+
+def _map_parallel(func, sites: Sequence[SiteRecord]) -> list:
+    if len(sites) <= 1:
+        return [func(site) for site in sites]
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(sites)), thread_name_prefix="site-enrich") as pool:
+        return list(pool.map(func, sites))
+
+
+def enrich_size(sites: Sequence[SiteRecord]) -> Dict[str, dict]:
+    results = {}
+    for site, totals in zip(sites, _map_parallel(site_size, sites)):
+        results[site.domain] = {
+            "size_mb": totals["size_mb"],
+            "allocated_mb": totals["allocated_mb"],
+            # disk_usage is in bytes (converted from MB, as the dashboard expects)
+            "disk_usage": int(totals["size_mb"] * 1024 * 1024),
+        }
+    return results
+
+
+def _credentials_for(site) -> dict:
+    wp_config = load_wp_config(Path(site["public_html"]) / "wp-config.php")
+    return wp_config.db_info() if wp_config else {}
+
+
+def enrich_database(sites: Sequence[SiteRecord]) -> Dict[str, dict]:
+    stats = collect_db_stats(sites, _credentials_for)
+    results = {}
+    for site in sites:
+        databases = []
+        if site.db_name:
+            db_stats = stats.get((site.db_host or "127.0.0.1", site.db_name), {})
+            databases.append({
+                "name": site.db_name,
+                "size_mb": db_stats.get("size_mb", 0),
+                "table_count": db_stats.get("table_count", 0),
+            })
+        results[site.domain] = {"databases": databases}
+    return results
+
+
+def enrich_wordpress(sites: Sequence[SiteRecord]) -> Dict[str, dict]:
+    versions = _map_parallel(lambda site: read_wordpress_version(site.public_html), sites)
+    return {site.domain: {"wordpress_version": version} for site, version in zip(sites, versions)}
+
+
+ENRICHERS: Dict[str, Callable[[Sequence[SiteRecord]], Dict[str, dict]]] = {
+    "size": enrich_size,
+    "database": enrich_database,
+    "wordpress": enrich_wordpress,
+}
+
+
+def parse_fields(value: Optional[str]) -> Tuple[str, ...]:
+    """Parse a ``fields=`` parameter; no value means every field."""
+    if not value:
+        return ALL_FIELDS
+    fields = tuple(dict.fromkeys(f.strip() for f in value.split(",") if f.strip()))
+    unknown = [f for f in fields if f not in ALL_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    if "domain" not in fields:
+        fields = ("domain",) + fields
+    return fields
+
+
+def parse_sort(value: Optional[str]) -> Tuple[str, bool]:
+    """Parse ``sort=field`` / ``sort=-field`` into ``(field, descending)``."""
+    value = (value or "domain").strip()
+    descending = value.startswith("-")
+    field = value.lstrip("-+")
+    if field not in ALL_FIELDS or field == "databases":
+        raise ValueError(f"Cannot sort by {field}")
+    return field, descending
+
+
+def encode_cursor(key: tuple) -> str:
+    raw = json.dumps(list(key), separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, binascii.Error):
+        raise ValueError("Invalid cursor")
+    if not isinstance(key, list) or len(key) != 3:
+        raise ValueError("Invalid cursor")
+    return tuple(key)
+
+
+def enrich(sites: Sequence[SiteRecord], fields: Iterable[str]) -> Dict[str, dict]:
+    """Run the enrichers needed for ``fields`` and return values per domain."""
+    values: Dict[str, dict] = {site.domain: {} for site in sites}
+    groups = {ENRICHED_FIELDS[f] for f in fields if f in ENRICHED_FIELDS}
+    for group in sorted(groups):
+        for domain, computed in ENRICHERS[group](sites).items():
+            values[domain].update(computed)
+    return values
+
+
+def _merge_enriched(into: dict, computed: dict) -> None:
+    for key, value in computed.items():
+        if key == "stale":
+            into["stale"] = into.get("stale", False) or value
+        elif key == "enriched_at":
+            into.setdefault("enriched_at", {}).update(value)
+        else:
+            into[key] = value
+
+
+def _value(site: SiteRecord, field: str, enriched: Dict[str, dict]):
+    if field in DERIVED_FIELDS:
+        return DERIVED_FIELDS[field](site)
+    if field in ENRICHED_FIELDS:
+        return enriched.get(site.domain, {}).get(field)
+    value = getattr(site, field)
+    return list(value) if field == "aliases" else value
+
+
+def _sort_key(site: SiteRecord, field: str, enriched: Dict[str, dict]) -> tuple:
+    value = _value(site, field, enriched)
+    if isinstance(value, list):
+        value = ",".join(value)
+    # Missing values sort after present ones; the domain breaks ties so
+    # cursors are stable
+    return (value is None, value, site.domain)
+
+
+def query_sites(sites: Sequence[SiteRecord], fields: Sequence[str] = ALL_FIELDS,
+                sort: Tuple[str, bool] = ("domain", False), limit: Optional[int] = None,
+                cursor: Optional[str] = None,
+                enricher: Callable[[Sequence[SiteRecord], Iterable[str]], Dict[str, dict]] = enrich):
+    """Return ``(rows, next_cursor, total)`` for one page of sites."""
+    sort_field, descending = sort
+    enriched: Dict[str, dict] = {}
+    if sort_field in ENRICHED_FIELDS:
+        # Sorting by an expensive field needs it for every site, not just the page
+        enriched = enricher(sites, [sort_field])
+
+    ordered = sorted(sites, key=lambda s: _sort_key(s, sort_field, enriched), reverse=descending)
+    keys = [_sort_key(s, sort_field, enriched) for s in ordered]
+
+    start = 0
+    if cursor:
+        after = decode_cursor(cursor)
+        after = (bool(after[0]), after[1], after[2])
+        for index, key in enumerate(keys):
+            try:
+                past = key < after if descending else key > after
+            except TypeError:
+                raise ValueError("Cursor does not match sort order")
+            if past:
+                start = index
+                break
+        else:
+            start = len(ordered)
+
+    if limit is not None:
+        limit = max(1, min(limit, MAX_LIMIT))
+        page = ordered[start:start + limit]
+    else:
+        page = ordered[start:]
+
+    sort_group = ENRICHED_FIELDS.get(sort_field)
+    missing = [f for f in fields if f in ENRICHED_FIELDS and ENRICHED_FIELDS[f] != sort_group]
+    if missing:
+        for domain, computed in enricher(page, missing).items():
+            _merge_enriched(enriched.setdefault(domain, {}), computed)
+
+    rows = []
+    for site in page:
+        row = {field: _value(site, field, enriched) for field in fields}
+        meta = enriched.get(site.domain, {})
+        for key in META_FIELDS:
+            if key in meta:
+                row[key] = meta[key]
+        rows.append(row)
+    next_cursor = None
+    end = start + len(page)
+    if limit is not None and end < len(ordered):
+        next_cursor = encode_cursor(keys[end - 1])
+    return rows, next_cursor, len(ordered)
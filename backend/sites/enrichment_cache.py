@@ -0,0 +1,166 @@
+"""Stale-while-revalidate cache for site enrichment.
+
+Every enriched value (disk size, DB stats, WordPress version) is stored with
+the time it was computed. Reads always return what is cached straight away,
+flagged ``stale`` once it is older than its group's TTL, and queue a
+background recomputation. Recomputations are deduplicated per site and
+group, so any number of concurrent dashboard loads trigger one refresh.
+Sites never computed before get a short wait for their first value.
+Invalidating a key bumps its generation, so a refresh that started before
+the invalidation can't store its outdated result afterwards.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .enrichment import ENRICHED_FIELDS, ENRICHERS
+from .registry import SiteRecord
+
+# Seconds before a cached value is considered stale, per enricher group
+TTL = {
+    "size": 300,
+    "database": 120,
+    "wordpress": 600,
+}
+DEFAULT_TTL = 300
+
+# How long a request waits for values that have never been computed
+COLD_WAIT = 2.0
+
+REFRESH_WORKERS = 2
+
+CacheKey = Tuple[str, str, Optional[str], Optional[str], Optional[str]]
+
+
+def _cache_key(group: str, site: SiteRecord) -> CacheKey:
+    # Include what the enrichers read, so a moved site or a new DB name
+    # never serves another record's values
+    return (group, site.domain, site.path, site.db_host, site.db_name)
+
+
+class EnrichmentCache:
+    """Caches enricher output per site and refreshes it in the background."""
+
+    def __init__(self, enrichers: Dict[str, Callable[[Sequence[SiteRecord]], Dict[str, dict]]] = ENRICHERS,
+                 ttl: Optional[Dict[str, float]] = None, cold_wait: float = COLD_WAIT,
+                 workers: int = REFRESH_WORKERS):
+        self._enrichers = enrichers
+        self._ttl = dict(TTL if ttl is None else ttl)
+        self.cold_wait = cold_wait
+        self._values: Dict[CacheKey, Tuple[dict, float]] = {}
+        self._inflight: Dict[CacheKey, Future] = {}
+        self._generations: Dict[CacheKey, int] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="site-enrich-refresh")
+        self.stats = {"hits": 0, "stale": 0, "misses": 0, "refreshes": 0}
+
+    def _run_refresh(self, group: str, sites: List[SiteRecord], keys: List[CacheKey],
+                     generations: List[int], future: Future) -> None:
+        try:
+            results = self._enrichers[group](sites)
+            now = time.time()
+            with self._lock:
+                for site, key, generation in zip(sites, keys, generations):
+                    if site.domain in results and self._generations.get(key, 0) == generation:
+                        self._values[key] = (results[site.domain], now)
+        except Exception as e:
+            print(f"Error refreshing {group} enrichment: {e}")
+        finally:
+            with self._lock:
+                for key in keys:
+                    # An invalidation may have handed the key to a newer refresh
+                    if self._inflight.get(key) is future:
+                        del self._inflight[key]
+
+    def _schedule(self, group: str, sites: List[SiteRecord]) -> List[Future]:
+        """Queue a refresh for ``sites``, joining any already in flight."""
+        futures = []
+        todo: List[SiteRecord] = []
+        todo_keys: List[CacheKey] = []
+        with self._lock:
+            for site in sites:
+                key = _cache_key(group, site)
+                future = self._inflight.get(key)
+                if future is None:
+                    todo.append(site)
+                    todo_keys.append(key)
+                else:
+                    futures.append(future)
+            if todo:
+                future = Future()
+                generations = [self._generations.get(key, 0) for key in todo_keys]
+                for key in todo_keys:
+                    self._inflight[key] = future
+                self.stats["refreshes"] += 1
+                futures.append(future)
+
+        if todo:
+            def job():
+                try:
+                    self._run_refresh(group, todo, todo_keys, generations, future)
+                finally:
+                    future.set_result(None)
+            self._executor.submit(job)
+        return futures
+
+    def enrich(self, sites: Sequence[SiteRecord], fields: Iterable[str]) -> Dict[str, dict]:
+        """Return cached values for ``fields``, plus ``stale`` and ``enriched_at``.
+
+        Matches the ``enricher`` signature expected by ``query_sites``.
+        """
+        groups = sorted({ENRICHED_FIELDS[f] for f in fields if f in ENRICHED_FIELDS})
+        results: Dict[str, dict] = {site.domain: {"stale": False, "enriched_at": {}} for site in sites}
+        now = time.time()
+
+        for group in groups:
+            ttl = self._ttl.get(group, DEFAULT_TTL)
+            cold: List[SiteRecord] = []
+            stale: List[SiteRecord] = []
+            with self._lock:
+                for site in sites:
+                    cached = self._values.get(_cache_key(group, site))
+                    if cached is None:
+                        cold.append(site)
+                        self.stats["misses"] += 1
+                    elif now - cached[1] > ttl:
+                        stale.append(site)
+                        self.stats["stale"] += 1
+                    else:
+                        self.stats["hits"] += 1
+
+            if stale:
+                self._schedule(group, stale)
+            if cold:
+                wait(self._schedule(group, cold), timeout=self.cold_wait)
+
+            with self._lock:
+                for site in sites:
+                    row = results[site.domain]
+                    cached = self._values.get(_cache_key(group, site))
+                    if cached is None:
+                        row["stale"] = True
+                        row["enriched_at"][group] = None
+                        continue
+                    values, computed_at = cached
+                    row.update(values)
+                    row["enriched_at"][group] = computed_at
+                    if now - computed_at > ttl:
+                        row["stale"] = True
+        return results
+
+    def invalidate(self, domain: Optional[str] = None, group: Optional[str] = None) -> None:
+        """Drop cached values for one site and/or group (everything by default).
+
+        Refreshes already running for those keys are detached: their results
+        are discarded and the next read schedules a new one.
+        """
+        with self._lock:
+            for key in set(self._values) | set(self._inflight):
+                if (domain is None or key[1] == domain) and (group is None or key[0] == group):
+                    self._values.pop(key, None)
+                    self._inflight.pop(key, None)
+                    self._generations[key] = self._generations.get(key, 0) + 1
@@ -0,0 +1,124 @@
+"""Background site inventory publishing immutable, versioned snapshots.
+
+One ``SiteInventory`` owns the site list. A daemon thread reloads it on a
+fixed interval, or sooner when the mtime of a watched directory changes
+(a site folder added or removed, a vhost enabled or disabled). Readers take
+the current ``SiteSnapshot`` without locking; a new snapshot only gets a new
+version and ETag when its content actually changed.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from .registry import SiteRecord, SiteRegistry
+
+REFRESH_INTERVAL = 60
+WATCH_INTERVAL = 5
+
+
+@dataclass(frozen=True)
+class SiteSnapshot:
+    """A point-in-time, read-only view of every site."""
+
+    version: int
+    etag: str
+    registry: SiteRegistry
+    created_at: float
+
+    @property
+    def sites(self) -> Tuple[SiteRecord, ...]:
+        return self.registry.records
+
+    def find(self, domain: str) -> Optional[SiteRecord]:
+        return self.registry.get(domain)
+
+
+def _etag_for(sites: List[dict]) -> str:
+    payload = json.dumps(sites, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(payload).hexdigest()[:20]
+
+
+def _mtimes(paths: Iterable) -> Tuple[Optional[int], ...]:
+    result = []
+    for path in paths:
+        try:
+            result.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            result.append(None)
+    return tuple(result)
+
+
+class SiteInventory:
+    """Owns the site list and refreshes it in the background."""
+
+    def __init__(self, loader: Callable[[], List[dict]], watch_paths: Iterable = (),
+                 interval: float = REFRESH_INTERVAL, watch_interval: float = WATCH_INTERVAL):
+        self._loader = loader
+        self._watch_paths = list(watch_paths)
+        self.interval = interval
+        self.watch_interval = watch_interval
+        self._snapshot: Optional[SiteSnapshot] = None
+        self._refresh_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def snapshot(self) -> SiteSnapshot:
+        """Return the current snapshot, loading it synchronously the first time."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self.refresh()
+        return snapshot
+
+    def find(self, domain: str) -> Optional[SiteRecord]:
+        return self.snapshot().find(domain)
+
+    def refresh(self) -> SiteSnapshot:
+        """Reload the site list now and publish it if it changed."""
+        with self._refresh_lock:
+            sites = self._loader()
+            etag = _etag_for(sites)
+            current = self._snapshot
+            if current is not None and current.etag == etag:
+                return current
+            # Build the registry fully before publishing it with one assignment
+            snapshot = SiteSnapshot(
+                version=(current.version + 1) if current else 1,
+                etag=etag,
+                registry=SiteRegistry(sites),
+                created_at=time.time(),
+            )
+            self._snapshot = snapshot
+            return snapshot
+
+    def request_refresh(self) -> None:
+        """Ask the background thread to reload as soon as possible."""
+        self._wakeup.set()
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="site-inventory", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        print("Site inventory thread started")
+        last_mtimes = _mtimes(self._watch_paths)
+        next_refresh = 0.0
+        while True:
+            woken = self._wakeup.wait(self.watch_interval)
+            self._wakeup.clear()
+            mtimes = _mtimes(self._watch_paths)
+            if woken or mtimes != last_mtimes or time.monotonic() >= next_refresh:
+                last_mtimes = mtimes
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"Error refreshing site inventory: {e}")
+                next_refresh = time.monotonic() + self.interval
@@ -0,0 +1,118 @@
+"""Indexed, immutable registry of site records.
+
+A ``SiteRegistry`` is built once per inventory refresh and never mutated, so
+the inventory can publish a new one by swapping a single reference and
+concurrent requests always see either the old or the new registry in full.
+Lookups by domain, ServerAlias, Apache conf name and DB name are dict hits.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+IDENTITY_FIELDS = (
+    "domain",
+    "path",
+    "public_html",
+    "apache_config",
+    "apache_conf_name",
+    "apache_enabled",
+    "aliases",
+    "db_name",
+    "db_user",
+    "db_host",
+    "error_log",
+    "access_log",
+)
+
+
+def _normalize_host(host: str) -> str:
+    host = host.strip().lower().rstrip(".")
+    return host[4:] if host.startswith("www.") else host
+
+
+class SiteRecord:
+    """Compact site record; identity fields are slots, the rest is ``extra``.
+
+    Supports ``record['key']`` and ``record.get('key')`` so code written
+    against the old site dicts keeps working.
+    """
+
+    __slots__ = IDENTITY_FIELDS + ("extra",)
+
+    def __init__(self, data: dict):
+        for name in IDENTITY_FIELDS:
+            object.__setattr__(self, name, data.get(name))
+        object.__setattr__(self, "aliases", tuple(data.get("aliases") or ()))
+        object.__setattr__(
+            self, "extra", {k: v for k, v in data.items() if k not in IDENTITY_FIELDS}
+        )
+
+    def __setattr__(self, name, value):
+        raise AttributeError("SiteRecord is read-only")
+
+    def __getitem__(self, key: str):
+        if key in IDENTITY_FIELDS:
+            return getattr(self, key)
+        return self.extra[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in IDENTITY_FIELDS or key in self.extra
+
+    def get(self, key: str, default=None):
+        if key in IDENTITY_FIELDS:
+            value = getattr(self, key)
+            return default if value is None else value
+        return self.extra.get(key, default)
+
+    def to_dict(self) -> dict:
+        data = {name: getattr(self, name) for name in IDENTITY_FIELDS}
+        data["aliases"] = list(self.aliases)
+        data.update(self.extra)
+        return data
+
+    def __repr__(self) -> str:
+        return f"SiteRecord({self.domain!r})"
+
+
+class SiteRegistry:
+    """Read-only collection of ``SiteRecord`` objects with lookup indexes."""
+
+    __slots__ = ("records", "_by_host", "_by_conf", "_by_db")
+
+    def __init__(self, sites: Iterable[dict] = ()):
+        self.records: Tuple[SiteRecord, ...] = tuple(SiteRecord(site) for site in sites)
+        self._by_host: Dict[str, SiteRecord] = {}
+        self._by_conf: Dict[str, SiteRecord] = {}
+        self._by_db: Dict[str, List[SiteRecord]] = {}
+
+        # Canonical domains first so an alias can never shadow a real site
+        for record in self.records:
+            self._by_host[_normalize_host(record.domain)] = record
+        for record in self.records:
+            for alias in record.aliases:
+                self._by_host.setdefault(_normalize_host(alias), record)
+            if record.apache_conf_name:
+                self._by_conf.setdefault(record.apache_conf_name, record)
+            if record.db_name:
+                self._by_db.setdefault(record.db_name, []).append(record)
+
+    def __iter__(self) -> Iterator[SiteRecord]:
+        return iter(self.records)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def get(self, domain: str) -> Optional[SiteRecord]:
+        """Find a site by domain or ServerAlias (case and ``www.`` insensitive)."""
+        if not domain:
+            return None
+        return self._by_host.get(_normalize_host(domain))
+
+    def by_conf_name(self, conf_name: str) -> Optional[SiteRecord]:
+        if conf_name.endswith(".conf"):
+            conf_name = conf_name[:-len(".conf")]
+        return self._by_conf.get(conf_name)
+
+    def by_db_name(self, db_name: str) -> List[SiteRecord]:
+        return list(self._by_db.get(db_name, ()))
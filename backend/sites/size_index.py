@@ -0,0 +1,302 @@
+"""Persistent, incremental directory-size index for site sizing.
+
+Each indexed tree keeps one record per directory: the directory's mtime, the
+apparent and allocated bytes and count of the files directly inside it, and
+the names of its subdirectories; hardlinked files are counted once per inode.
+A refresh stats every known directory once and only re-lists the ones whose
+mtime moved, so the cost follows the number of changed directories rather
+than the number of files.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import heapq
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from .disk_usage import scan_directory
+
+# Determine root of project (two levels up from this file)
+ROOT_DIR = Path(__file__).resolve().parents[2]
+DEFAULT_INDEX_DIR = ROOT_DIR / ".cache" / "size_index"
+
+SIZE_INDEX_DIR = Path(os.environ.get("SIZE_INDEX_DIR", DEFAULT_INDEX_DIR))
+
+INDEX_VERSION = 3
+
+# Largest files remembered per directory; enough for an exact global top-N
+# up to this size
+TOP_FILES = 25
+
+# Rewriting a file in place changes its size without touching the parent
+# directory's mtime, so every so often the whole tree is re-listed.
+FULL_RESCAN_INTERVAL = 6 * 60 * 60
+
+# Record layout: [mtime_ns, apparent_bytes, allocated_bytes, file_count,
+#                 subdir_names, [[st_dev, st_ino, size, blocks], ...],
+#                 [[size, name], ...]]
+# LINKS holds multiply-linked files, counted once per inode in totals; TOP
+# holds the directory's largest files, largest first.
+MTIME, FILE_BYTES, ALLOCATED_BYTES, FILE_COUNT, SUBDIRS, LINKS, TOP = range(7)
+
+
+def _default_index_path(root: Path) -> Path:
+    digest = hashlib.sha1(str(root).encode("utf-8")).hexdigest()[:12]
+    return SIZE_INDEX_DIR / f"{root.name}-{digest}.json"
+
+
+def _scan_dir(path: str, mtime_ns: int) -> Optional[list]:
+    """List one directory and return its index record."""
+    links: Dict[tuple, tuple] = {}
+    top: list = []
+    try:
+        apparent, allocated, count, subdirs = scan_directory(path, links, top, TOP_FILES)
+    except OSError:
+        return None
+    linked = [[dev, ino, size, blocks] for (dev, ino), (size, blocks) in links.items()]
+    largest = [[size, name] for size, name in sorted(top, reverse=True)]
+    return [mtime_ns, apparent, allocated, count, subdirs, linked, largest]
+
+
+def classify_area(rel: str) -> Tuple[str, Optional[str]]:
+    """Map a directory path (relative to the site root) to ``(area, group)``."""
+    parts = rel.split(os.sep) if rel else []
+    if not parts:
+        return "other", None
+    if parts[0] == "backups":
+        return "backups", parts[1] if len(parts) > 1 else None
+    if parts[0] != "public_html":
+        return "other", parts[0]
+
+    parts = parts[1:]
+    if not parts or parts[0] in ("wp-admin", "wp-includes"):
+        return "core", parts[0] if parts else None
+    if parts[0] != "wp-content":
+        if any("cache" in part.lower() for part in parts):
+            return "cache", parts[0]
+        return "other", parts[0]
+
+    parts = parts[1:]
+    if not parts:
+        return "wp-content", None
+    if parts[0] == "uploads":
+        if len(parts) >= 3 and parts[1].isdigit() and parts[2].isdigit():
+            return "uploads", f"{parts[1]}/{parts[2]}"
+        if len(parts) >= 2:
+            return "uploads", parts[1] if parts[1].isdigit() else "other"
+        return "uploads", None
+    if parts[0] in ("plugins", "mu-plugins", "themes"):
+        return parts[0], parts[1] if len(parts) > 1 else None
+    if "cache" in parts[0].lower():
+        return "cache", parts[0]
+    return "wp-content", parts[0]
+
+
+def build_breakdown(dirs: Dict[str, list], top_n: int = TOP_FILES) -> dict:
+    """Aggregate index records into per-area usage and the largest files."""
+    areas: Dict[str, dict] = {}
+    seen_links = set()
+    candidates = []
+    for rel, record in dirs.items():
+        area_name, group = classify_area(rel)
+        apparent = record[FILE_BYTES]
+        allocated = record[ALLOCATED_BYTES]
+        files = record[FILE_COUNT]
+        for dev, ino, size, blocks in record[LINKS]:
+            if (dev, ino) not in seen_links:
+                seen_links.add((dev, ino))
+                apparent += size
+                allocated += blocks
+                files += 1
+
+        area = areas.setdefault(area_name, {"area": area_name, "bytes": 0, "allocated_bytes": 0,
+                                            "files": 0, "groups": {}})
+        area["bytes"] += apparent
+        area["allocated_bytes"] += allocated
+        area["files"] += files
+        if group is not None:
+            area["groups"][group] = area["groups"].get(group, 0) + apparent
+
+        for size, name in record[TOP][:top_n]:
+            candidates.append((size, os.path.join(rel, name) if rel else name))
+
+    result_areas = []
+    for area in sorted(areas.values(), key=lambda a: a["bytes"], reverse=True):
+        groups = area.pop("groups")
+        area["groups"] = [
+            {"name": name, "bytes": size}
+            for name, size in sorted(groups.items(), key=lambda item: item[1], reverse=True)
+        ]
+        result_areas.append(area)
+
+    return {
+        "areas": result_areas,
+        "largest_files": [
+            {"path": path, "size": size}
+            for size, path in heapq.nlargest(top_n, candidates)
+        ],
+    }
+
+
+class SizeIndex:
+    """On-disk index of per-directory size totals for one tree."""
+
+    def __init__(self, root, index_path: Optional[Path] = None):
+        self.root = Path(root)
+        self.index_path = Path(index_path) if index_path else _default_index_path(self.root)
+        self._lock = threading.Lock()
+        self._dirs: Dict[str, list] = {}
+        self._last_full_scan = 0.0
+        self._root_entry = [0, 0]
+        self._loaded = False
+        self._generation = 0
+        self._breakdown = None
+        self._indexed_at = 0.0
+
+    def _load(self) -> None:
+        self._loaded = True
+        try:
+            with open(self.index_path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") != INDEX_VERSION or data.get("root") != str(self.root):
+            return
+        self._dirs = data.get("dirs", {})
+        self._last_full_scan = data.get("last_full_scan", 0.0)
+        self._root_entry = data.get("root_entry", [0, 0])
+
+    def _save(self) -> None:
+        payload = {
+            "version": INDEX_VERSION,
+            "root": str(self.root),
+            "last_full_scan": self._last_full_scan,
+            "root_entry": self._root_entry,
+            "dirs": self._dirs,
+        }
+        try:
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.index_path.with_suffix(".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(payload, f, separators=(",", ":"))
+            os.replace(tmp_path, self.index_path)
+        except OSError as err:
+            print(f"Error saving size index for {self.root}: {err}")
+
+    def refresh(self, full: bool = False) -> dict:
+        """Bring the index up to date and return the tree totals."""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if time.time() - self._last_full_scan > FULL_RESCAN_INTERVAL:
+                full = True
+
+            dirs: Dict[str, list] = {}
+            scanned = 0
+            stack = [""]
+            while stack:
+                rel = stack.pop()
+                path = os.path.join(self.root, rel) if rel else str(self.root)
+                try:
+                    st = os.stat(path, follow_symlinks=False)
+                except OSError:
+                    continue
+                mtime_ns = st.st_mtime_ns
+                if not rel:
+                    # Subdirectory entries are counted by their parent; the root by us
+                    self._root_entry = [st.st_size, st.st_blocks * 512]
+
+                record = self._dirs.get(rel)
+                if full or record is None or record[MTIME] != mtime_ns:
+                    record = _scan_dir(path, mtime_ns)
+                    if record is None:
+                        continue
+                    scanned += 1
+
+                dirs[rel] = record
+                stack.extend(os.path.join(rel, name) if rel else name for name in record[SUBDIRS])
+
+            changed = scanned > 0 or dirs.keys() != self._dirs.keys()
+            self._dirs = dirs
+            self._indexed_at = time.time()
+            if changed:
+                self._generation += 1
+            if full:
+                self._last_full_scan = time.time()
+            if changed or full:
+                self._save()
+
+            totals = self._totals()
+            totals["dirs_scanned"] = scanned
+            return totals
+
+    def _totals(self) -> dict:
+        apparent, allocated = self._root_entry
+        files = 0
+        links = {}
+        for record in self._dirs.values():
+            apparent += record[FILE_BYTES]
+            allocated += record[ALLOCATED_BYTES]
+            files += record[FILE_COUNT]
+            for dev, ino, size, blocks in record[LINKS]:
+                links[(dev, ino)] = (size, blocks)
+        for size, blocks in links.values():
+            apparent += size
+            allocated += blocks
+        return {
+            "bytes": apparent,
+            "allocated_bytes": allocated,
+            "size_mb": round(apparent / (1024 * 1024), 2),
+            "allocated_mb": round(allocated / (1024 * 1024), 2),
+            "files": files + len(links),
+            "dirs": len(self._dirs),
+        }
+
+    def breakdown(self, top_n: int = TOP_FILES) -> dict:
+        """Return usage by area and the largest files, as of the last refresh.
+
+        Built from the per-directory records, so it never walks the tree;
+        the result is cached until a refresh changes the index.
+        """
+        top_n = max(1, min(top_n, TOP_FILES))
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            cached = self._breakdown
+            if cached is None or cached[0] != self._generation or cached[1] != top_n:
+                totals = self._totals()
+                result = build_breakdown(self._dirs, top_n)
+                result["total_bytes"] = totals["bytes"]
+                result["total_allocated_bytes"] = totals["allocated_bytes"]
+                cached = (self._generation, top_n, result)
+                self._breakdown = cached
+            result = dict(cached[2])
+            result["indexed_at"] = self._indexed_at or None
+            return result
+
+    def totals(self) -> dict:
+        """Return the totals recorded by the last refresh without touching disk."""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            return self._totals()
+
+
+_indexes: Dict[str, SizeIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_size_index(root) -> SizeIndex:
+    """Return the shared index for ``root``, creating it on first use."""
+    key = str(Path(root))
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = SizeIndex(key)
+            _indexes[key] = index
+        return index
@@ -0,0 +1,5 @@
+"""WordPress helpers shared by the site, database and WordPress routes."""
+
+from .config import WPConfig, load_wp_config
+
+__all__ = ["WPConfig", "load_wp_config"]
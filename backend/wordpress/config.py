@@ -0,0 +1,124 @@
+"""Parsed, cached view of a site's wp-config.php.
+
+Every ``define()`` and the ``$table_prefix`` assignment are extracted in a
+single regex pass. Parsed configs are cached per path and keyed on the file's
+``(inode, mtime, size)``, so a lookup costs one ``stat`` and the file is only
+re-read after it has been replaced or edited.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+DEFAULT_TABLE_PREFIX = "wp_"
+
+CONFIG_REGEX = re.compile(
+    r"""define\s*\(\s*['"](?P<key>[A-Za-z0-9_]+)['"]\s*,\s*"""
+    r"""(?:'(?P<single>(?:[^'\\]|\\.)*)'|"(?P<double>(?:[^"\\]|\\.)*)"|(?P<bare>[^\s)]+))\s*\)"""
+    r"""|\$table_prefix\s*=\s*['"](?P<prefix>[^'"]+)['"]"""
+)
+
+StatKey = Tuple[int, int, int]
+
+
+def _unescape(value: str) -> str:
+    return re.sub(r"\\(['\"\\])", r"\1", value)
+
+
+def _bare_value(value: str):
+    lowered = value.lower()
+    if lowered == "true":
+        return True
+    if lowered == "false":
+        return False
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+class WPConfig:
+    """All defines and the table prefix of one wp-config.php."""
+
+    __slots__ = ("path", "defines", "table_prefix", "stat_key")
+
+    def __init__(self, path: Path, defines: Dict[str, object], table_prefix: str,
+                 stat_key: Optional[StatKey] = None):
+        self.path = path
+        self.defines = defines
+        self.table_prefix = table_prefix
+        self.stat_key = stat_key
+
+    @classmethod
+    def parse(cls, path: Path, content: str, stat_key: Optional[StatKey] = None) -> "WPConfig":
+        defines: Dict[str, object] = {}
+        table_prefix = None
+        for match in CONFIG_REGEX.finditer(content):
+            if match.group("prefix") is not None:
+                if table_prefix is None:
+                    table_prefix = match.group("prefix")
+                continue
+            key = match.group("key")
+            if key in defines:
+                continue
+            if match.group("single") is not None:
+                defines[key] = _unescape(match.group("single"))
+            elif match.group("double") is not None:
+                defines[key] = _unescape(match.group("double"))
+            else:
+                defines[key] = _bare_value(match.group("bare"))
+        return cls(path, defines, table_prefix or DEFAULT_TABLE_PREFIX, stat_key)
+
+    def get(self, key: str, default=None):
+        return self.defines.get(key, default)
+
+    def db_info(self) -> Dict[str, str]:
+        """Return the DB credentials in the ``extract_db_info`` dict format."""
+        db_info = {}
+        for key in ("DB_NAME", "DB_USER", "DB_PASSWORD", "DB_HOST"):
+            value = self.defines.get(key)
+            if value not in (None, ""):
+                db_info[key.lower()] = str(value)
+        return db_info
+
+
+_cache: Dict[str, WPConfig] = {}
+_cache_lock = threading.Lock()
+
+
+def load_wp_config(path) -> Optional[WPConfig]:
+    """Return the parsed config at ``path``, or None if the file does not exist."""
+    path = Path(path)
+    key = str(path)
+    try:
+        st = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        with _cache_lock:
+            _cache.pop(key, None)
+        return None
+    except OSError as e:
+        print(f"Error reading wp-config.php: {e}")
+        return WPConfig(path, {}, DEFAULT_TABLE_PREFIX)
+
+    stat_key = (st.st_ino, st.st_mtime_ns, st.st_size)
+    cached = _cache.get(key)
+    if cached is not None and cached.stat_key == stat_key:
+        return cached
+
+    try:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            content = f.read()
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        print(f"Error reading wp-config.php: {e}")
+        return WPConfig(path, {}, DEFAULT_TABLE_PREFIX)
+
+    config = WPConfig.parse(path, content, stat_key)
+    with _cache_lock:
+        _cache[key] = config
+    return config
@@ -17,6 +17,14 @@ export interface FileContent {
   encoding?: string;
   path?: string;
   size?: number;
+  // Sent back as base_hash when saving, so newer changes on disk aren't overwritten
+  hash?: string;
+}
+
+export interface SaveFileResult {
+  success: boolean;
+  size: number;
+  hash: string;
 }
 
 export const useFiles = (domain: string, path: string = '/') => {
@@ -50,10 +58,11 @@ export const useFileContent = (domain: string) => {
 export const useSaveFile = (domain: string) => {
   const queryClient = useQueryClient();
   return useMutation({
-    mutationFn: async ({ path, content }: { path: string; content: string }) => {
-      const { data } = await apiClient.post(API_ENDPOINTS.SITES.FILES_WRITE(domain), {
+    mutationFn: async ({ path, content, baseHash }: { path: string; content: string; baseHash?: string }) => {
+      const { data } = await apiClient.post<SaveFileResult>(API_ENDPOINTS.SITES.FILES_WRITE(domain), {
         path,
-        content
+        content,
+        base_hash: baseHash
       });
       return data;
     },
@@ -67,11 +76,9 @@ export const useCreateFolder = (domain: string) => {
   const queryClient = useQueryClient();
   return useMutation({
     mutationFn: async ({ path, name }: { path: string; name: string }) => {
-      // Create folder by writing a .gitkeep file (backend will create parent dirs)
       const folderPath = path === '/' ? name : `${path}/${name}`;
-      const { data } = await apiClient.post(API_ENDPOINTS.SITES.FILES_WRITE(domain), {
-        path: `${folderPath}/.gitkeep`,
-        content: ''
+      const { data } = await apiClient.post(API_ENDPOINTS.SITES.FILES_MKDIR(domain), {
+        path: folderPath
       });
       return data;
     },
@@ -5,6 +5,7 @@ export const API_ENDPOINTS = {
     FILES: (domain: string) => `/api/site/${domain}/files`,
     FILES_READ: (domain: string) => `/api/site/${domain}/files/read`,
     FILES_WRITE: (domain: string) => `/api/site/${domain}/files/write`,
+    FILES_MKDIR: (domain: string) => `/api/site/${domain}/files/mkdir`,
     FILES_DELETE: (domain: string) => `/api/site/${domain}/files/delete`,
     FILES_UPLOAD: (domain: string) => `/api/site/${domain}/files/upload`,
     FILES_DOWNLOAD: (domain: string) => `/api/site/${domain}/files/download`,
@@ -48,22 +48,19 @@ export const fileOperations = {
   },
 
   // Write file content
-  writeFile: async (domain: string, path: string, content: string) => {
+  writeFile: async (domain: string, path: string, content: string, baseHash?: string) => {
     const response = await apiClient.post(
       API_ENDPOINTS.SITES.FILES_WRITE(domain),
-      { path, content }
+      { path, content, base_hash: baseHash }
     );
     return response.data;
   },
 
   // Create a new folder
   createFolder: async (domain: string, folderPath: string) => {
-    // We'll use writeFile to create a placeholder file then delete it
-    // Or we can just call mkdir via a new endpoint if available
-    // For now, let's assume the backend will handle this
     const response = await apiClient.post(
-      API_ENDPOINTS.SITES.FILES_WRITE(domain),
-      { path: `${folderPath}/.gitkeep`, content: '' }
+      API_ENDPOINTS.SITES.FILES_MKDIR(domain),
+      { path: folderPath }
     );
     return response.data;
   },
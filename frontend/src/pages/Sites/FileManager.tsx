@@ -21,6 +21,8 @@ interface EditorTab {
   path: string;
   content: string;
   originalContent: string;
+  // Hash of the content on disk this tab was loaded from or last saved as
+  hash?: string;
   isDirty: boolean;
   loading: boolean;
 }
@@ -129,6 +131,7 @@ export default function FileManager() {
             ...tab,
             content: data.content,
             originalContent: data.content,
+            hash: data.hash,
             loading: false
           };
         }
@@ -164,16 +167,20 @@ export default function FileManager() {
     if (!tab) return;
 
     try {
-      await saveFile.mutateAsync({ path: tab.path, content: tab.content });
+      const result = await saveFile.mutateAsync({ path: tab.path, content: tab.content, baseHash: tab.hash });
       setOpenFiles(prev => prev.map(t => {
         if (t.id === tabId) {
-          return { ...t, originalContent: t.content, isDirty: false };
+          return { ...t, originalContent: t.content, hash: result.hash, isDirty: false };
         }
         return t;
       }));
       showNotification('success', 'File saved successfully');
-    } catch (error) {
-      showNotification('error', 'Failed to save file');
+    } catch (error: any) {
+      if (error?.response?.status === 409) {
+        showNotification('error', 'File was changed on the server since it was opened; reopen it before saving');
+      } else {
+        showNotification('error', 'Failed to save file');
+      }
     }
   };
 
@@ -4,6 +4,9 @@ let services = {};
 let currentSite = null;
 let currentTab = 'overview';
 let currentFilePath = '';
+// Hash of the file open in the editor, sent back on save so the server can
+// refuse to overwrite changes made since it was loaded
+let currentFileHash = null;
 
 // Initialize on page load
 document.addEventListener('DOMContentLoaded', () => {
@@ -514,6 +517,7 @@ async function openFile(path) {
             showToast(result.error, 'error');
             return;
         }
+        currentFileHash = result.hash;
         
         const modalBody = document.getElementById('modalBody');
         modalBody.innerHTML = `
@@ -542,12 +546,15 @@ async function saveFile(path) {
         const response = await fetch(`/api/site/${currentSite.domain}/files/write`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ path, content })
+            body: JSON.stringify({ path, content, base_hash: currentFileHash })
         });
         const result = await response.json();
         
         if (result.success) {
+            currentFileHash = result.hash;
             showToast('File saved', 'success');
+        } else if (response.status === 409) {
+            showToast('File was changed on the server since it was opened; reopen it before saving', 'error');
         } else {
             showToast(result.error || 'Error saving file', 'error');
         }
@@ -4,6 +4,9 @@ const currentDomain = window.currentDomain || '';
 // Global state
 let currentTab = 'overview';
 let currentFilePath = '';
+// Hash of the file open in the editor, sent back on save so the server can
+// refuse to overwrite changes made since it was loaded
+let currentFileHash = null;
 let siteData = null;
 
 // Initialize on page load
@@ -263,6 +266,7 @@ async function openFile(path) {
     
     try {
         const result = await apiCall(`/api/site/${currentDomain}/files/read?path=${encodeURIComponent(path)}`);
+        currentFileHash = result.hash;
         
         siteContent.innerHTML = `
             <div class="site-page-section">
@@ -301,10 +305,11 @@ async function saveFile(path) {
     try {
         const result = await apiCall(`/api/site/${currentDomain}/files/write`, {
             method: 'POST',
-            body: JSON.stringify({ path, content })
+            body: JSON.stringify({ path, content, base_hash: currentFileHash })
         });
         
         if (result.success) {
+            currentFileHash = result.hash;
             showToast('File saved successfully', 'success');
         } else {
             showToast(result.error || 'Error saving file', 'error');